@@ -1,50 +1,44 @@
 from __future__ import annotations
 
-import json
+import asyncio
+import codecs
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import BinaryIO
 from uuid import uuid4
 
-from fastapi import APIRouter, File, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, File, HTTPException, Response, UploadFile
 
 from ..config import get_settings
 from ..models.document import Document
-from ..services.embedding import get_embedding
-from ..services.vectordb import get_vectordb_service
-from ..utils.file_handlers import chunk_text, extract_text_from_file
+from ..models.job import VectorizationJob
+from ..services.document_store import (
+    DOCUMENTS_DIR,
+    DocumentStore,
+    encode_cursor,
+    get_document_store,
+)
+from ..services.jobs import (
+    DocumentDeletingError,
+    JobConflictError,
+    QueueFullError,
+    VectorizationJobQueue,
+    get_job_queue,
+)
+from ..services.lexical_index import get_lexical_index
+from ..services.telemetry import stage
+from ..services.vectordb import AsyncVectorDBService, get_async_vectordb_service
 
 router = APIRouter(prefix="/api/v1", tags=["documents"])
 
-PROJECT_ROOT = Path(__file__).resolve().parents[3]
-DOCUMENTS_DIR = PROJECT_ROOT / "data" / "documents"
-INDEX_PATH = DOCUMENTS_DIR / "documents_index.json"
 SUPPORTED_EXTENSIONS: dict[str, str] = {
     ".txt": "txt",
 }
 
 
 def _ensure_storage() -> None:
-    # ドキュメント保存先とインデックスファイルを初期化
+    # ドキュメント保存先を初期化（メタ情報は DocumentStore が管理）
     DOCUMENTS_DIR.mkdir(parents=True, exist_ok=True)
-    if not INDEX_PATH.exists():
-        INDEX_PATH.write_text("{}", encoding="utf-8")
-
-
-def _load_index() -> dict[str, dict]:
-    # ドキュメント管理用インデックスを読み込む
-    _ensure_storage()
-    raw = INDEX_PATH.read_text(encoding="utf-8")
-    if not raw.strip():
-        return {}
-    return json.loads(raw)
-
-
-def _save_index(index_data: dict[str, dict]) -> None:
-    # 見やすさ優先でJSONを整形保存
-    INDEX_PATH.write_text(
-        json.dumps(index_data, ensure_ascii=False, indent=2),
-        encoding="utf-8",
-    )
 
 
 def _build_document_response(index_entry: dict) -> Document:
@@ -59,6 +53,13 @@ def _build_document_response(index_entry: dict) -> Document:
     )
 
 
+def _write_block(output: BinaryIO, decoder: codecs.IncrementalDecoder, block: bytes) -> int:
+    # UTF-8 として検証してから書き込み、ブロック内の文字数を返す
+    char_count = len(decoder.decode(block))
+    output.write(block)
+    return char_count
+
+
 @router.post(
     "/documents",
     response_model=Document,
@@ -68,7 +69,10 @@ def _build_document_response(index_entry: dict) -> Document:
     "アップロード直後はステータスが `pending` となり、別途ベクトル化が必要です。",
     response_description="登録されたドキュメントのメタ情報",
 )
-async def upload_document(file: UploadFile = File(..., description="アップロードするテキストファイル (.txt)")) -> Document:
+async def upload_document(
+    file: UploadFile = File(..., description="アップロードするテキストファイル (.txt)"),
+    store: DocumentStore = Depends(get_document_store),
+) -> Document:
     # アップロードファイル名のバリデーション
     filename = Path(file.filename or "").name
     if not filename:
@@ -83,158 +87,189 @@ async def upload_document(file: UploadFile = File(..., description="アップロ
             detail="未対応のファイル形式です。現在は .txt のみ対応しています。",
         )
 
-    # テキストファイルをUTF-8として読み込む
-    try:
-        content = await file.read()
-        text = content.decode("utf-8")
-    except Exception as exc:
-        raise HTTPException(
-            status_code=400, detail="ファイルの読み込みに失敗しました。") from exc
-
     # 保存時は重複回避のため document_id をファイル名に利用
     document_id = str(uuid4())
     stored_filename = f"{document_id}{ext}"
     stored_path = DOCUMENTS_DIR / stored_filename
 
+    # 固定サイズのブロック単位でディスクへ書き出し、UTF-8 として逐次検証する
+    # （書き込み途中のファイルは .part として扱い、完了時にリネーム）
+    _ensure_storage()
+    partial_path = stored_path.with_suffix(stored_path.suffix + ".part")
+    block_size = get_settings().upload_block_size
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    # ベクトル化時に本文を読み直さずにチャンク数を算出できるよう、文字数も数えておく
+    char_count = 0
+    try:
+        # デコード検証・書き込み・リネームはイベントループを止めないよう別スレッドで行う
+        output = await asyncio.to_thread(partial_path.open, "wb")
+        try:
+            while block := await file.read(block_size):
+                char_count += await asyncio.to_thread(_write_block, output, decoder, block)
+            char_count += len(decoder.decode(b"", final=True))
+        finally:
+            await asyncio.to_thread(output.close)
+    except UnicodeDecodeError as exc:
+        await asyncio.to_thread(partial_path.unlink, missing_ok=True)
+        raise HTTPException(
+            status_code=400, detail="ファイルの読み込みに失敗しました。") from exc
+    except Exception as exc:
+        await asyncio.to_thread(partial_path.unlink, missing_ok=True)
+        raise HTTPException(
+            status_code=500, detail="ドキュメントの保存に失敗しました。") from exc
+
     try:
-        # 本文保存 + インデックス更新
-        _ensure_storage()
-        stored_path.write_text(text, encoding="utf-8")
+        # 本文はファイルのみに保存し、メタ情報を1件だけ登録
+        await asyncio.to_thread(partial_path.replace, stored_path)
 
-        index_data = _load_index()
         created_at = datetime.now(timezone.utc).isoformat()
-        index_data[document_id] = {
+        entry = {
             "document_id": document_id,
             "filename": filename,
             "file_type": file_type,
             "status": "pending",
             "created_at": created_at,
-            "original_text": text,
             "stored_path": str(stored_path),
+            "char_count": char_count,
         }
-        _save_index(index_data)
-    except HTTPException:
-        raise
+        store.upsert(entry)
     except Exception as exc:
+        stored_path.unlink(missing_ok=True)
         raise HTTPException(
             status_code=500, detail="ドキュメントの保存に失敗しました。") from exc
 
-    return _build_document_response(index_data[document_id])
+    return _build_document_response(entry)
 
 
 @router.post(
     "/documents/{document_id}/vectorize",
-    summary="ドキュメントをベクトル化",
+    response_model=VectorizationJob,
+    status_code=202,
+    summary="ドキュメントのベクトル化ジョブを登録",
     description="指定したドキュメントをチャンクに分割し、埋め込みモデルでベクトル化して"
-    " ChromaDB に保存します。完了後はステータスが `processed` になります。",
-    response_description="ベクトル化結果（チャンク数・モデル情報など）",
+    " ChromaDB に保存するジョブをバックグラウンドで実行します。"
+    "進捗は `GET /api/v1/jobs/{job_id}` で確認でき、処理中のステータスは `processing`、"
+    "完了後は `processed` になります。同じドキュメントに同じチャンク設定の未完了ジョブがある場合はそのジョブを返し、"
+    "異なる設定の未完了ジョブがある場合は `409` を返します。",
+    response_description="登録されたジョブ",
 )
 async def vectorize_document(
     document_id: str,
     chunk_size: int = 500,
     chunk_overlap: int = 50,
-) -> dict:
+    store: DocumentStore = Depends(get_document_store),
+    queue: VectorizationJobQueue = Depends(get_job_queue),
+) -> VectorizationJob:
     # チャンク設定の妥当性チェック
     if chunk_size <= 0 or chunk_overlap < 0 or chunk_overlap >= chunk_size:
         raise HTTPException(
             status_code=400, detail="chunk_size / chunk_overlap の指定が不正です。")
 
     # 対象ドキュメント存在確認
-    index_data = _load_index()
-    entry = index_data.get(document_id)
+    if store.get(document_id) is None:
+        raise HTTPException(status_code=404, detail="指定されたドキュメントが見つかりません。")
+
+    try:
+        with stage("job_submit"):
+            job = queue.submit(document_id, chunk_size, chunk_overlap)
+    except QueueFullError as exc:
+        raise HTTPException(status_code=503, detail=str(exc)) from exc
+    except (JobConflictError, DocumentDeletingError) as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+
+    return VectorizationJob(**job)
+
+
+@router.delete(
+    "/documents/{document_id}",
+    status_code=204,
+    summary="ドキュメントを削除",
+    description="ドキュメントのメタ情報・保存ファイルと、ベクトルストア・転置インデックス上の全チャンクを削除します。"
+    "チャンクは `document_id` の条件指定で一括削除します。ベクトル化ジョブの実行中は削除できません。"
+    "削除処理中のドキュメントはステータスが `deleting` になり、ベクトル化の登録は `409` になります。",
+    response_description="削除完了（本文なし）",
+)
+async def delete_document(
+    document_id: str,
+    store: DocumentStore = Depends(get_document_store),
+    queue: VectorizationJobQueue = Depends(get_job_queue),
+    vectordb: AsyncVectorDBService = Depends(get_async_vectordb_service),
+) -> Response:
+    entry = store.get(document_id)
     if entry is None:
         raise HTTPException(status_code=404, detail="指定されたドキュメントが見つかりません。")
 
+    # 実行中のジョブと競合すると削除後にチャンクが書き戻されるため拒否
+    if queue.store.find_active(document_id) is not None:
+        raise HTTPException(
+            status_code=409, detail="ベクトル化ジョブの実行中は削除できません。")
+    # 最初の await より前に削除処理中へ遷移し、削除中にジョブが登録・実行されないようにする
+    if not store.mark_deleting(document_id):
+        raise HTTPException(status_code=409, detail="ドキュメントは削除処理中です。")
+
     try:
-        # 1) 抽出 2) 分割 3) 埋め込み 4) ベクトルDB保存
-        text = extract_text_from_file(entry["stored_path"], entry["file_type"])
-        chunks = chunk_text(text, chunk_size=chunk_size, overlap=chunk_overlap)
-
-        embeddings: list[list[float]] = []
-        for chunk in chunks:
-            embeddings.append(await get_embedding(chunk, task_type="RETRIEVAL_DOCUMENT"))
-
-        vectordb = get_vectordb_service()
-        vectordb.add_document_chunks(document_id, chunks, embeddings)
-
-        # 正常完了時はステータスを processed へ更新
-        entry["status"] = "processed"
-        entry["original_text"] = text
-        index_data[document_id] = entry
-        _save_index(index_data)
-    except HTTPException:
-        raise
-    except ValueError as exc:
-        raise HTTPException(status_code=400, detail=str(exc)) from exc
+        await vectordb.delete_document(document_id)
+        lexical_index = get_lexical_index()
+        if lexical_index is not None:
+            await asyncio.to_thread(lexical_index.delete_document, document_id)
     except Exception as exc:
-        # 失敗時はステータスを error にして再試行可能にする
-        entry["status"] = "error"
-        index_data[document_id] = entry
-        _save_index(index_data)
+        # 削除を再実行できるよう元のステータスへ戻す
+        store.update(document_id, status=entry["status"])
         raise HTTPException(
-            status_code=500, detail="ドキュメントのベクトル化に失敗しました。") from exc
+            status_code=500, detail="ベクトルの削除に失敗しました。") from exc
 
-    embedding_dimension = len(embeddings[0]) if embeddings else 0
-    settings = get_settings()
+    # ベクトル削除後にメタ情報とファイルを削除（失敗時は再実行できるよう順序を固定）
+    store.delete(document_id)
+    if entry.get("stored_path"):
+        Path(entry["stored_path"]).unlink(missing_ok=True)
 
-    return {
-        "document_id": document_id,
-        "chunks_created": len(chunks),
-        "status": "processed",
-        "embedding_model": settings.embedding_model,
-        "embedding_dimension": embedding_dimension,
-    }
+    return Response(status_code=204)
 
 
 @router.get(
     "/documents",
     summary="ドキュメント一覧を取得",
-    description="登録済みドキュメントの一覧を返します。`status` でフィルタリング、`limit`/`offset` でページングができます。",
+    description="登録済みドキュメントの一覧を返します。`status` でフィルタリングできます。"
+    "ページングはレスポンスの `next_cursor` を `cursor` に渡すキーセット方式を推奨します"
+    "（`offset` は互換性のために残しています）。一覧には本文 `original_text` は含まれません。",
     response_description="ドキュメント一覧・件数・ページング情報",
 )
 async def list_documents(
     status: str | None = None,
     limit: int = 50,
     offset: int = 0,
+    cursor: str | None = None,
+    store: DocumentStore = Depends(get_document_store),
 ) -> dict:
     # ページング引数のバリデーション
     if limit < 1 or offset < 0:
         raise HTTPException(status_code=400, detail="limit / offset の指定が不正です。")
 
-    # インデックスをレスポンス形式へ変換
-    index_data = _load_index()
-    documents = [
-        _build_document_response(entry).model_dump(mode="json")
-        for entry in index_data.values()
-    ]
-
-    if status is not None:
-        # 必要に応じてステータスで絞り込み
-        documents = [doc for doc in documents if doc["status"] == status]
-
+    # ステータス絞り込み・ページングは DocumentStore 側（索引付き）で実行
+    # chunk_count は取り込み時に更新されるカウンタを返す（VectorDB は走査しない）
     try:
-        # VectorDB上の実チャンク数を付与
-        vectordb = get_vectordb_service()
-        vectordb_documents = vectordb.list_documents()
-        chunk_counts = {
-            item["document_id"]: item["chunk_count"]
-            for item in vectordb_documents
-            if item.get("document_id")
-        }
-
-        for doc in documents:
-            doc["chunk_count"] = chunk_counts.get(doc["document_id"], 0)
-    except Exception:
-        # 集計失敗時は一覧取得を優先し chunk_count=0 を返す
-        for doc in documents:
-            doc["chunk_count"] = 0
+        entries = store.list(status=status, limit=limit + 1, offset=offset, cursor=cursor)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
 
-    total = len(documents)
-    paginated = documents[offset: offset + limit]
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    documents = [
+        {
+            **_build_document_response(entry).model_dump(mode="json", exclude={"original_text"}),
+            "chunk_count": entry["chunk_count"],
+        }
+        for entry in entries
+    ]
+    next_cursor = (
+        encode_cursor(entries[-1]["created_at"], entries[-1]["document_id"])
+        if has_more else None
+    )
 
     return {
-        "documents": paginated,
-        "total": total,
+        "documents": documents,
+        "total": store.count(status),
         "limit": limit,
         "offset": offset,
+        "next_cursor": next_cursor,
     }
@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from ..models.job import VectorizationJob
+from ..services.jobs import VectorizationJobQueue, get_job_queue
+
+router = APIRouter(prefix="/api/v1", tags=["jobs"])
+
+
+@router.get(
+    "/jobs/{job_id}",
+    response_model=VectorizationJob,
+    summary="ベクトル化ジョブの状態を取得",
+    description="`POST /api/v1/documents/{document_id}/vectorize` で登録したジョブの状態と"
+    "チャンク単位の進捗（`processed_chunks` / `total_chunks`）を返します。",
+    response_description="ジョブの状態・進捗",
+)
+async def get_job(
+    job_id: str,
+    queue: VectorizationJobQueue = Depends(get_job_queue),
+) -> VectorizationJob:
+    job = queue.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="指定されたジョブが見つかりません。")
+    return VectorizationJob(**job)
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from ..services.embedding import peek_query_embedding_cache
+from ..services.experiment_log import get_experiment_logger
+from ..services.jobs import VectorizationJobQueue, get_job_queue, peek_job_queue
+from ..services.rate_limit import get_rate_limiters
+from ..services.telemetry import REGISTRY, Counter, Gauge
+from ..services.vectordb import (
+    AsyncVectorDBService,
+    get_async_vectordb_service,
+    peek_async_vectordb_service,
+)
+
+router = APIRouter(prefix="/api/v1", tags=["metrics"])
+
+# Prometheus のスクレイプ先（慣例に合わせて /metrics に公開）
+prometheus_router = APIRouter(tags=["metrics"])
+
+
+@router.get(
+    "/metrics",
+    summary="実行時メトリクスを取得",
+    description="ChromaDB 用スレッドプールのサイズや実行中タスク数、質問埋め込みキャッシュのヒット率、"
+    "実験ログの書き込み・破棄件数、Gemini API のレート制御の状態など、運用向けの実行時メトリクスを返します。",
+    response_description="コンポーネントごとのメトリクス",
+)
+async def get_metrics(
+    vectordb: AsyncVectorDBService = Depends(get_async_vectordb_service),
+    job_queue: VectorizationJobQueue = Depends(get_job_queue),
+) -> dict:
+    cache = peek_query_embedding_cache()
+    experiment_logger = get_experiment_logger()
+    return {
+        "vectordb": vectordb.stats(),
+        "query_embedding_cache": cache.stats() if cache is not None else None,
+        "vectorize_jobs": job_queue.stats(),
+        "experiment_log": experiment_logger.stats() if experiment_logger is not None else None,
+        "gemini_rate_limiters": {
+            name: limiter.stats() for name, limiter in get_rate_limiters().items()
+        },
+    }
+
+
+@prometheus_router.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+    summary="Prometheus 形式のメトリクスを取得",
+    description="ステージごとの処理時間・HTTP リクエスト処理時間のヒストグラム、キャッシュヒット率、"
+    "実行中の Gemini API 呼び出し数、スレッドプール・ジョブキューの使用状況を Prometheus テキスト形式で返します。",
+    response_description="Prometheus テキスト形式 (version 0.0.4)",
+)
+async def get_prometheus_metrics() -> PlainTextResponse:
+    return PlainTextResponse(
+        REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# 以下は出力時に各コンポーネントの stats() から値を取得する（ホットパスでは何も記録しない）
+# スクレイプでコンポーネントを生成しないよう peek_*() で参照し、未生成なら何も出力しない
+
+
+def _cache_stats() -> dict | None:
+    cache = peek_query_embedding_cache()
+    return cache.stats() if cache is not None else None
+
+
+def _cache_value(key: str) -> dict:
+    stats = _cache_stats()
+    return {(): float(stats[key])} if stats is not None else {}
+
+
+def _pool_stats() -> dict | None:
+    service = peek_async_vectordb_service()
+    return service.stats() if service is not None else None
+
+
+def _pool_values(key: str) -> dict:
+    stats = _pool_stats()
+    if stats is None:
+        return {}
+    return {(pool,): float(stats[f"{pool}_{key}"]) for pool in ("read", "write")}
+
+
+def _pool_saturation() -> dict:
+    stats = _pool_stats()
+    if stats is None:
+        return {}
+    return {
+        (pool,): stats[f"{pool}_in_flight"] / max(1, stats[f"{pool}_pool_size"])
+        for pool in ("read", "write")
+    }
+
+
+def _job_values() -> dict:
+    queue = peek_job_queue()
+    if queue is None:
+        return {}
+    return {(key,): float(value) for key, value in queue.stats().items()}
+
+
+def _experiment_log_values() -> dict:
+    experiment_logger = get_experiment_logger()
+    if experiment_logger is None:
+        return {}
+    stats = experiment_logger.stats()
+    return {(result,): float(stats[result]) for result in ("written", "dropped", "write_errors")}
+
+
+def _experiment_log_queued() -> dict:
+    experiment_logger = get_experiment_logger()
+    return {(): float(experiment_logger.stats()["queued"])} if experiment_logger is not None else {}
+
+
+def _limiter_values(key: str) -> dict:
+    return {
+        (name,): float(limiter.stats()[key]) for name, limiter in get_rate_limiters().items()
+    }
+
+
+REGISTRY.register(Counter(
+    "rag_query_embedding_cache_hits_total", "Query embedding cache hits.",
+    collect=lambda: _cache_value("hits"),
+))
+REGISTRY.register(Counter(
+    "rag_query_embedding_cache_misses_total", "Query embedding cache misses.",
+    collect=lambda: _cache_value("misses"),
+))
+REGISTRY.register(Gauge(
+    "rag_query_embedding_cache_hit_ratio", "Query embedding cache hit ratio since startup.",
+    collect=lambda: _cache_value("hit_rate"),
+))
+REGISTRY.register(Gauge(
+    "rag_query_embedding_cache_entries", "Entries in the query embedding cache.",
+    collect=lambda: _cache_value("entries"),
+))
+REGISTRY.register(Gauge(
+    "rag_vectordb_pool_size", "Vector store thread pool size.", ("pool",),
+    collect=lambda: _pool_values("pool_size"),
+))
+REGISTRY.register(Gauge(
+    "rag_vectordb_pool_in_flight", "Vector store tasks running or waiting per pool.", ("pool",),
+    collect=lambda: _pool_values("in_flight"),
+))
+REGISTRY.register(Gauge(
+    "rag_vectordb_pool_saturation", "In-flight tasks divided by pool size (>1 means queueing).",
+    ("pool",),
+    collect=_pool_saturation,
+))
+REGISTRY.register(Gauge(
+    "rag_vectorize_jobs", "Vectorization job queue state (workers, running, queued, max_queued).",
+    ("state",),
+    collect=_job_values,
+))
+REGISTRY.register(Counter(
+    "rag_experiment_log_records_total",
+    "Experiment log records by result (written, dropped on queue overflow, write_errors).",
+    ("result",),
+    collect=_experiment_log_values,
+))
+REGISTRY.register(Gauge(
+    "rag_experiment_log_queued", "Experiment log records waiting for the background writer.",
+    collect=_experiment_log_queued,
+))
+REGISTRY.register(Gauge(
+    "rag_upstream_concurrency_limit",
+    "Adaptive (AIMD) concurrency limit for Gemini API calls per limiter.",
+    ("limiter",),
+    collect=lambda: _limiter_values("concurrency_limit"),
+))
+REGISTRY.register(Counter(
+    "rag_upstream_throttled_total", "Gemini API responses with status 429 per limiter.",
+    ("limiter",),
+    collect=lambda: _limiter_values("throttled"),
+))
@@ -1,91 +1,635 @@
 from __future__ import annotations
 
+import asyncio
 from datetime import datetime, timezone
+import json
+import time
+from typing import AsyncIterator
 from uuid import uuid4
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 
 from ..config import get_settings
 from ..models.query import (
+    BatchQueryRequest,
+    BatchQueryResponse,
+    BatchQueryResult,
+    BatchQueryTimings,
+    CompareModeStats,
+    CompareResponse,
     GenerationParameters,
+    NonRagResponse,
+    QueryOptions,
     QueryRequest,
     QueryResponse,
     RetrievedChunk,
+    TokenUsage,
+)
+from ..services.context import build_context
+from ..services.deadline import Deadline, DeadlineExceededError, deadline_scope
+from ..services.embedding import embedding_model_key, get_embedding, get_query_embeddings
+from ..services.experiment_log import log_experiment
+from ..services.generation import (
+    generate_answer,
+    generate_answer_non_rag,
+    generate_answer_with_usage,
+    stream_answer,
+)
+from ..services.lexical_index import get_lexical_index
+from ..services.retrieval import reciprocal_rank_fusion
+from ..services.vectordb import (
+    AsyncVectorDBService,
+    DimensionMismatchError,
+    get_async_vectordb_service,
 )
-from ..services.embedding import get_embedding
-from ..services.generation import generate_answer
-from ..services.vectordb import get_vectordb_service
 
 router = APIRouter(prefix="/api/v1", tags=["query"])
 
+# ヒットなし時に返す固定メッセージ
+NO_RESULTS_ANSWER = "関連ドキュメントが見つかりませんでした。"
+# 処理期限内に回答を生成できなかった場合に返す固定メッセージ（検索結果は返却する）
+DEGRADED_ANSWER = "時間内に回答を生成できなかったため、関連ドキュメントのみを返します。"
+# 処理期限内に検索が完了しなかった場合に返す固定メッセージ
+RETRIEVAL_DEGRADED_ANSWER = "時間内に関連ドキュメントを検索できませんでした。"
 
-@router.post(
-    "/query",
-    response_model=QueryResponse,
-    summary="RAG で質問に回答",
-    description="質問文を受け取り、ベクトル検索で関連ドキュメントを取得したうえで"
-    " Gemini が根拠付き回答を生成します。`top_k` 件のチャンクを根拠として使用します。",
-    response_description="生成された回答・根拠チャンク・使用モデル情報",
-)
-async def query_rag(payload: QueryRequest) -> QueryResponse:
-    # 1リクエストごとに一意IDを付与
+
+async def _search_chunks(payload: QueryRequest, vectordb: AsyncVectorDBService) -> list[dict]:
+    lexical_index = get_lexical_index() if payload.search_mode == "hybrid" else None
+    # 1) 質問を埋め込み化して 2) 類似チャンク検索
+    if lexical_index is None:
+        query_embedding = await get_embedding(payload.question, task_type="RETRIEVAL_QUERY")
+        return await vectordb.query_similar_chunks(
+            query_embedding, payload.top_k, payload.search_ef)
+
+    # hybrid: ベクトル検索と BM25 検索を並行実行し、RRF で統合して上位 top_k を返す
     settings = get_settings()
-    query_id = str(uuid4())
+    candidates = payload.top_k * max(1, settings.hybrid_candidate_multiplier)
 
-    try:
-        # 1) 質問を埋め込み化して 2) 類似チャンク検索
+    async def vector_search() -> list[dict]:
         query_embedding = await get_embedding(payload.question, task_type="RETRIEVAL_QUERY")
-        vectordb = get_vectordb_service()
-        chunks = vectordb.query_similar_chunks(query_embedding, payload.top_k)
+        return await vectordb.query_similar_chunks(
+            query_embedding, candidates, payload.search_ef)
+
+    vector_chunks, lexical_chunks = await asyncio.gather(
+        vector_search(),
+        asyncio.to_thread(lexical_index.search, payload.question, candidates),
+    )
+    fused = reciprocal_rank_fusion([vector_chunks, lexical_chunks], k=settings.hybrid_rrf_k)
+    return fused[: payload.top_k]
+
+
+async def _retrieve_chunks(
+    payload: QueryRequest,
+    vectordb: AsyncVectorDBService,
+    deadline: Deadline | None = None,
+) -> list[dict]:
+    # 処理期限の超過（DeadlineExceededError）は呼び出し側で縮退応答・504 などへ変換する
+    try:
+        if deadline is None:
+            return await _search_chunks(payload, vectordb)
+        # 埋め込み・検索を処理期限の残り時間内で実行
+        return await deadline.run(_search_chunks(payload, vectordb), "retrieval")
+    except DeadlineExceededError:
+        raise
+    except DimensionMismatchError as exc:
+        # 設定変更後に再ベクトル化されていない場合は早期に明示エラーで返す
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
     except Exception as exc:
         raise HTTPException(status_code=500, detail="ベクトル検索に失敗しました。") from exc
 
-    parameters = GenerationParameters(
+
+async def _build_context(
+    payload: QueryOptions,
+    chunks: list[dict],
+    vectordb: AsyncVectorDBService,
+    deadline: Deadline | None = None,
+) -> tuple[list[dict], list[str], dict | None]:
+    # 隣接チャンクの連結・重複除去・MMR で予算内の文脈を組み立てる（処理期限の残り時間内で実行）
+    packing = build_context(chunks, vectordb, payload.context_token_budget)
+    if deadline is None:
+        return await packing
+    return await deadline.run(packing, "context")
+
+
+def _deadline_seconds(payload: QueryRequest) -> float:
+    # リクエスト指定の処理期限を優先し、未指定なら設定値（0 以下は無期限）
+    if payload.deadline_ms is not None:
+        return payload.deadline_ms / 1000
+    return get_settings().query_deadline_seconds
+
+
+def _compare_error_detail(exc: Exception) -> str:
+    # 比較モードの失敗理由（処理期限の超過はステージ名を含めて返す）
+    if isinstance(exc, HTTPException):
+        return exc.detail
+    if isinstance(exc, DeadlineExceededError):
+        return f"処理期限内に完了しませんでした（{exc.stage}）。"
+    return "回答生成に失敗しました。"
+
+
+def _elapsed_ms(started: float) -> float:
+    return (time.perf_counter() - started) * 1000
+
+
+async def _retrieve_chunks_batch(
+    payload: BatchQueryRequest,
+    vectordb: AsyncVectorDBService,
+) -> tuple[list[list[dict]], float, float]:
+    # 全質問を1回のバッチ埋め込みと1回の複数ベクトル検索で処理する（検索結果, 埋め込み時間, 検索時間）
+    settings = get_settings()
+    lexical_index = get_lexical_index() if payload.search_mode == "hybrid" else None
+    candidates = payload.top_k
+    lexical_task = None
+    if lexical_index is not None:
+        # hybrid: BM25 検索は埋め込みを待たずに別スレッドで開始
+        candidates = payload.top_k * max(1, settings.hybrid_candidate_multiplier)
+        lexical_task = asyncio.create_task(asyncio.to_thread(
+            lambda: [lexical_index.search(question, candidates) for question in payload.questions]))
+
+    try:
+        started = time.perf_counter()
+        query_embeddings = await get_query_embeddings(
+            payload.questions, task_type="RETRIEVAL_QUERY")
+        embedding_ms = _elapsed_ms(started)
+
+        started = time.perf_counter()
+        vector_lists = await vectordb.query_similar_chunks_batch(
+            query_embeddings, candidates, payload.search_ef)
+        if lexical_task is None:
+            return vector_lists, embedding_ms, _elapsed_ms(started)
+
+        lexical_lists = await lexical_task
+        fused_lists = [
+            reciprocal_rank_fusion([vector_chunks, lexical_chunks], k=settings.hybrid_rrf_k)[
+                : payload.top_k]
+            for vector_chunks, lexical_chunks in zip(vector_lists, lexical_lists)
+        ]
+        return fused_lists, embedding_ms, _elapsed_ms(started)
+    except DimensionMismatchError as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail="ベクトル検索に失敗しました。") from exc
+    finally:
+        if lexical_task is not None and not lexical_task.done():
+            lexical_task.cancel()
+
+
+def _build_parameters(payload: QueryOptions) -> GenerationParameters:
+    return GenerationParameters(
         temperature=payload.temperature,
         max_tokens=payload.max_tokens,
         top_k=payload.top_k,
+        search_mode=payload.search_mode,
     )
 
-    if not chunks:
-        # ヒットなし時は明示メッセージで返却
-        return QueryResponse(
-            query_id=query_id,
-            question=payload.question,
-            answer="関連ドキュメントが見つかりませんでした。",
-            retrieved_chunks=[],
-            model=settings.generation_model,
-            parameters=parameters,
-            timestamp=datetime.now(timezone.utc),
-        )
 
-    try:
-        # 検索結果を根拠に回答生成
-        answer = await generate_answer(
-            payload.question,
-            [chunk["content"] for chunk in chunks],
-            payload.temperature,
-            payload.max_tokens,
-        )
-    except Exception as exc:
-        raise HTTPException(status_code=500, detail="回答生成に失敗しました。") from exc
+def _log_query(
+    endpoint: str,
+    query_id: str,
+    question: str,
+    payload: QueryOptions,
+    chunks: list[dict],
+    answer: str | None,
+    started: float,
+    error: str | None = None,
+    mode: str = "rag",
+    **fields,
+) -> None:
+    # 実験ログへ入力・検索結果・モデル・パラメータを記録（キューへ積むだけで書き込みは待たない）
+    log_experiment(
+        "query",
+        endpoint=endpoint,
+        mode=mode,
+        query_id=query_id,
+        question=question,
+        model=get_settings().generation_model,
+        embedding_model=embedding_model_key(),
+        parameters={
+            "top_k": payload.top_k,
+            "temperature": payload.temperature,
+            "max_tokens": payload.max_tokens,
+            "search_ef": payload.search_ef,
+            "search_mode": payload.search_mode,
+            "context_token_budget": payload.context_token_budget,
+        },
+        retrieved=[
+            {
+                "chunk_id": chunk["chunk_id"],
+                "document_id": chunk.get("document_id"),
+                "score": chunk["score"],
+            }
+            for chunk in chunks
+        ],
+        answer=answer,
+        error=error,
+        latency_ms=_elapsed_ms(started),
+        **fields,
+    )
 
+
+def _build_retrieved_chunks(chunks: list[dict]) -> list[RetrievedChunk]:
     # APIレスポンス形式へ整形
-    retrieved_chunks = [
+    return [
         RetrievedChunk(
             chunk_id=chunk["chunk_id"],
             document_id=chunk.get("document_id"),
+            chunk_index=chunk.get("chunk_index"),
             content=chunk["content"],
             similarity_score=chunk["score"],
         )
         for chunk in chunks
     ]
 
+
+@router.post(
+    "/query",
+    response_model=QueryResponse,
+    summary="RAG で質問に回答",
+    description="質問文を受け取り、ベクトル検索で関連ドキュメントを取得したうえで"
+    " Gemini が根拠付き回答を生成します。`top_k` 件の検索結果から、重複を除き多様性を考慮して"
+    "トークン予算（`context_token_budget`）に収まるチャンクを根拠として使用します。"
+    " `search_mode=hybrid` では文字 n-gram の BM25 検索結果も RRF で統合します。"
+    " 処理期限（`deadline_ms` / `QUERY_DEADLINE_SECONDS`）内に回答を生成できない場合は、"
+    "検索結果のみを `degraded=true` で返します（検索自体が間に合わない場合は検索結果も空になります）。",
+    response_description="生成された回答・根拠チャンク・使用モデル情報",
+)
+async def query_rag(
+    payload: QueryRequest,
+    vectordb: AsyncVectorDBService = Depends(get_async_vectordb_service),
+) -> QueryResponse:
+    # 1リクエストごとに一意IDを付与
+    settings = get_settings()
+    query_id = str(uuid4())
+    started = time.perf_counter()
+
+    with deadline_scope(Deadline(_deadline_seconds(payload))) as deadline:
+        parameters = _build_parameters(payload)
+        degraded_reason = None
+        passages: list[str] = []
+        context = None
+        try:
+            chunks = await _retrieve_chunks(payload, vectordb, deadline)
+        except DeadlineExceededError:
+            # 検索が間に合わなければ、根拠なしの縮退応答（検索結果は空）を返す
+            chunks = []
+            degraded_reason = "検索が処理期限内に完了しませんでした。"
+            answer = RETRIEVAL_DEGRADED_ANSWER
+
+        if degraded_reason is None:
+            try:
+                chunks, passages, context = await _build_context(
+                    payload, chunks, vectordb, deadline)
+            except DeadlineExceededError:
+                # 文脈を組み立てられなければ生成せず、検索結果のみを返す
+                degraded_reason = "文脈の構築が処理期限内に完了しませんでした。"
+
+        if degraded_reason is None and not chunks:
+            # ヒットなし時は明示メッセージで返却
+            answer = NO_RESULTS_ANSWER
+        elif degraded_reason is None:
+            remaining = deadline.remaining()
+            if remaining is not None and remaining < settings.query_generation_min_seconds:
+                # 生成に必要な時間が残っていなければ、検索結果のみを期限内に返す
+                degraded_reason = "生成に必要な残り時間が不足しています。"
+            else:
+                try:
+                    # 検索結果を根拠に回答生成（残り時間をタイムアウトとする）
+                    answer = await deadline.run(
+                        generate_answer(
+                            payload.question,
+                            passages,
+                            payload.temperature,
+                            payload.max_tokens,
+                        ),
+                        "generation",
+                    )
+                except DeadlineExceededError:
+                    degraded_reason = "回答生成が処理期限内に完了しませんでした。"
+                except Exception as exc:
+                    _log_query("query", query_id, payload.question, payload, chunks, None,
+                               started, error=repr(exc), context=context)
+                    raise HTTPException(status_code=500, detail="回答生成に失敗しました。") from exc
+        if chunks and degraded_reason is not None:
+            answer = DEGRADED_ANSWER
+
+    _log_query("query", query_id, payload.question, payload, chunks, answer, started,
+               degraded_reason=degraded_reason, context=context)
     return QueryResponse(
         query_id=query_id,
         question=payload.question,
         answer=answer,
-        retrieved_chunks=retrieved_chunks,
+        retrieved_chunks=_build_retrieved_chunks(chunks),
         model=settings.generation_model,
         parameters=parameters,
         timestamp=datetime.now(timezone.utc),
+        degraded=degraded_reason is not None,
+        degraded_reason=degraded_reason,
+    )
+
+
+@router.post(
+    "/query/compare",
+    response_model=CompareResponse,
+    summary="RAG と Non-RAG の回答を比較",
+    description="同じ質問に対して、RAG（埋め込み・ベクトル検索・根拠付き生成）と Non-RAG（検索なしの生成のみ）を"
+    "並行実行し、両方の回答とモードごとの処理時間・トークン使用量を返します。"
+    " 全体の処理時間は2モードの合計ではなく、遅い方のモードとほぼ同じになります。"
+    " 片方のモードが失敗した場合は `error` に理由を入れ、もう一方の結果は返却します。"
+    " 処理期限（`deadline_ms` / `QUERY_DEADLINE_SECONDS`）は両モードに適用し、"
+    "期限内に完了しなかったモードは失敗として扱います。",
+    response_description="両モードの回答と処理時間・トークン使用量",
+)
+async def query_compare(
+    payload: QueryRequest,
+    vectordb: AsyncVectorDBService = Depends(get_async_vectordb_service),
+) -> CompareResponse:
+    settings = get_settings()
+    comparison_id = str(uuid4())
+    parameters = _build_parameters(payload)
+    started = time.perf_counter()
+    deadline = Deadline(_deadline_seconds(payload))
+
+    async def run_rag() -> tuple[QueryResponse | None, CompareModeStats]:
+        query_id = str(uuid4())
+        mode_started = time.perf_counter()
+        chunks: list[dict] = []
+        context = None
+        retrieval_ms = None
+        try:
+            chunks = await _retrieve_chunks(payload, vectordb, deadline)
+            retrieval_ms = _elapsed_ms(mode_started)
+            chunks, passages, context = await _build_context(payload, chunks, vectordb, deadline)
+            usage = None
+            if chunks:
+                answer, usage = await deadline.run(
+                    generate_answer_with_usage(
+                        payload.question,
+                        passages,
+                        payload.temperature,
+                        payload.max_tokens,
+                    ),
+                    "generation",
+                )
+            else:
+                answer = NO_RESULTS_ANSWER
+        except Exception as exc:
+            _log_query("query_compare", query_id, payload.question, payload, chunks, None,
+                       mode_started, error=repr(exc), context=context,
+                       comparison_id=comparison_id)
+            detail = _compare_error_detail(exc)
+            return None, CompareModeStats(
+                latency_ms=_elapsed_ms(mode_started), retrieval_ms=retrieval_ms, error=detail)
+
+        _log_query("query_compare", query_id, payload.question, payload, chunks, answer,
+                   mode_started, usage=usage, context=context, comparison_id=comparison_id)
+        response = QueryResponse(
+            query_id=query_id,
+            question=payload.question,
+            answer=answer,
+            retrieved_chunks=_build_retrieved_chunks(chunks),
+            model=settings.generation_model,
+            parameters=parameters,
+            timestamp=datetime.now(timezone.utc),
+        )
+        return response, CompareModeStats(
+            latency_ms=_elapsed_ms(mode_started),
+            retrieval_ms=retrieval_ms,
+            usage=TokenUsage(**usage) if usage is not None else None,
+        )
+
+    async def run_non_rag() -> tuple[NonRagResponse | None, CompareModeStats]:
+        query_id = str(uuid4())
+        mode_started = time.perf_counter()
+        try:
+            answer, usage = await deadline.run(
+                generate_answer_non_rag(payload.question, payload.temperature, payload.max_tokens),
+                "generation",
+            )
+        except Exception as exc:
+            _log_query("query_compare", query_id, payload.question, payload, [], None,
+                       mode_started, error=repr(exc), mode="non_rag", comparison_id=comparison_id)
+            return None, CompareModeStats(
+                latency_ms=_elapsed_ms(mode_started), error=_compare_error_detail(exc))
+
+        _log_query("query_compare", query_id, payload.question, payload, [], answer,
+                   mode_started, mode="non_rag", usage=usage, comparison_id=comparison_id)
+        response = NonRagResponse(
+            answer=answer, model=settings.generation_model, parameters=parameters)
+        return response, CompareModeStats(
+            latency_ms=_elapsed_ms(mode_started), usage=TokenUsage(**usage))
+
+    # 2モードを並行実行し、全体の待ち時間を遅い方のモードに揃える
+    # （タスクは作成時のコンテキストを引き継ぐため、処理期限のスコープ内で開始する）
+    with deadline_scope(deadline):
+        (rag_response, rag_stats), (non_rag_response, non_rag_stats) = await asyncio.gather(
+            run_rag(), run_non_rag())
+    if rag_response is None and non_rag_response is None:
+        if deadline.remaining() == 0:
+            raise HTTPException(status_code=504, detail="処理期限内に回答を生成できませんでした。")
+        raise HTTPException(status_code=500, detail="回答生成に失敗しました。")
+
+    return CompareResponse(
+        comparison_id=comparison_id,
+        question=payload.question,
+        rag_response=rag_response,
+        non_rag_response=non_rag_response,
+        rag=rag_stats,
+        non_rag=non_rag_stats,
+        total_ms=_elapsed_ms(started),
+        timestamp=datetime.now(timezone.utc),
+    )
+
+
+@router.post(
+    "/query/batch",
+    response_model=BatchQueryResponse,
+    summary="RAG で複数の質問に一括回答",
+    description="複数の質問を受け取り、埋め込み化を1回のバッチ要求、ベクトル検索を1回の複数ベクトル検索で行ったうえで、"
+    "回答を `BATCH_QUERY_CONCURRENCY` 件ずつ並行生成します。評価用の大量質問の実行向けです。"
+    " 回答生成に失敗した質問は `error` に理由を入れて返し、他の質問の結果は返却します。"
+    " 処理期限（`deadline_ms`）は受け付けず、各ステージは既定のタイムアウトで実行します。",
+    response_description="質問ごとの回答と処理時間",
+)
+async def query_rag_batch(
+    payload: BatchQueryRequest,
+    vectordb: AsyncVectorDBService = Depends(get_async_vectordb_service),
+) -> BatchQueryResponse:
+    settings = get_settings()
+    if len(payload.questions) > settings.batch_query_max_questions:
+        raise HTTPException(
+            status_code=400,
+            detail=f"質問数が上限（{settings.batch_query_max_questions}件）を超えています。",
+        )
+    if any(not question.strip() for question in payload.questions):
+        raise HTTPException(status_code=400, detail="空の質問が含まれています。")
+
+    batch_id = str(uuid4())
+    batch_started = time.perf_counter()
+    chunk_lists, embedding_ms, retrieval_ms = await _retrieve_chunks_batch(payload, vectordb)
+    parameters = _build_parameters(payload)
+
+    # 同時実行数を制限して回答を並行生成
+    semaphore = asyncio.Semaphore(max(1, settings.batch_query_concurrency))
+
+    async def answer_question(index: int, question: str, chunks: list[dict]) -> BatchQueryResult:
+        async with semaphore:
+            started = time.perf_counter()
+            query_id = str(uuid4())
+            context = None
+            if chunks:
+                try:
+                    chunks, passages, context = await _build_context(payload, chunks, vectordb)
+                    answer = await generate_answer(
+                        question,
+                        passages,
+                        payload.temperature,
+                        payload.max_tokens,
+                    )
+                except Exception as exc:
+                    _log_query("query_batch", query_id, question, payload, chunks, None, started,
+                               error=repr(exc), context=context, batch_id=batch_id)
+                    return BatchQueryResult(
+                        index=index,
+                        error="回答生成に失敗しました。",
+                        generation_ms=_elapsed_ms(started),
+                    )
+            else:
+                answer = NO_RESULTS_ANSWER
+
+            _log_query("query_batch", query_id, question, payload, chunks, answer, started,
+                       context=context, batch_id=batch_id)
+            return BatchQueryResult(
+                index=index,
+                response=QueryResponse(
+                    query_id=query_id,
+                    question=question,
+                    answer=answer,
+                    retrieved_chunks=_build_retrieved_chunks(chunks),
+                    model=settings.generation_model,
+                    parameters=parameters,
+                    timestamp=datetime.now(timezone.utc),
+                ),
+                generation_ms=_elapsed_ms(started),
+            )
+
+    generation_started = time.perf_counter()
+    results = await asyncio.gather(
+        *(
+            answer_question(index, question, chunks)
+            for index, (question, chunks) in enumerate(zip(payload.questions, chunk_lists))
+        )
+    )
+    generation_ms = _elapsed_ms(generation_started)
+
+    failed = sum(1 for result in results if result.error is not None)
+    return BatchQueryResponse(
+        batch_id=batch_id,
+        results=results,
+        succeeded=len(results) - failed,
+        failed=failed,
+        timings=BatchQueryTimings(
+            embedding_ms=embedding_ms,
+            retrieval_ms=retrieval_ms,
+            generation_ms=generation_ms,
+            total_ms=_elapsed_ms(batch_started),
+        ),
+    )
+
+
+def _format_sse(event: str, data: dict | list) -> str:
+    # Server-Sent Events の1イベント分を組み立てる
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post(
+    "/query/stream",
+    summary="RAG で質問に回答（ストリーミング）",
+    description="`/query` と同じ処理を Server-Sent Events で返します。"
+    " 検索結果を `chunks` イベントで先に送り、生成中の回答を `token` イベントで逐次送信し、"
+    " 最後に `QueryResponse` 全体を `done` イベントで送ります。生成中の失敗は `error` イベントで通知します。"
+    " 処理期限（`deadline_ms` / `QUERY_DEADLINE_SECONDS`）は生成の完了までに適用し、"
+    "検索・文脈の構築が間に合わない場合は `504`、生成が間に合わない場合はそこまでの回答を"
+    " `degraded=true` の `done` イベントで返します。",
+    response_description="text/event-stream 形式のイベント列",
+)
+async def query_rag_stream(
+    payload: QueryRequest,
+    vectordb: AsyncVectorDBService = Depends(get_async_vectordb_service),
+) -> StreamingResponse:
+    settings = get_settings()
+    query_id = str(uuid4())
+    started = time.perf_counter()
+
+    # 検索・文脈の構築はストリーム開始前に（処理期限内で）実行し、失敗時は通常の HTTP エラーとして返す
+    deadline = Deadline(_deadline_seconds(payload))
+    with deadline_scope(deadline):
+        try:
+            chunks = await _retrieve_chunks(payload, vectordb, deadline)
+        except DeadlineExceededError as exc:
+            raise HTTPException(
+                status_code=504, detail="検索が処理期限内に完了しませんでした。") from exc
+        try:
+            chunks, passages, context = await _build_context(payload, chunks, vectordb, deadline)
+        except DeadlineExceededError as exc:
+            raise HTTPException(
+                status_code=504, detail="文脈の構築が処理期限内に完了しませんでした。") from exc
+    retrieved_chunks = _build_retrieved_chunks(chunks)
+    parameters = _build_parameters(payload)
+
+    async def event_stream() -> AsyncIterator[str]:
+        yield _format_sse(
+            "chunks", [chunk.model_dump(mode="json") for chunk in retrieved_chunks])
+
+        answer_parts: list[str] = []
+        degraded_reason = None
+        remaining = deadline.remaining()
+        if not chunks:
+            answer_parts.append(NO_RESULTS_ANSWER)
+            yield _format_sse("token", {"text": NO_RESULTS_ANSWER})
+        elif remaining is not None and remaining < settings.query_generation_min_seconds:
+            # 生成に必要な時間が残っていなければ、検索結果のみを返す
+            degraded_reason = "生成に必要な残り時間が不足しています。"
+        else:
+            try:
+                # ストリームはエンドポイントの処理後に送信されるため、処理期限のスコープを張り直す
+                with deadline_scope(deadline):
+                    async for text in stream_answer(
+                        payload.question,
+                        passages,
+                        payload.temperature,
+                        payload.max_tokens,
+                    ):
+                        answer_parts.append(text)
+                        yield _format_sse("token", {"text": text})
+            except DeadlineExceededError:
+                degraded_reason = "回答生成が処理期限内に完了しませんでした。"
+            except Exception as exc:
+                # ヘッダー送信後のため HTTP ステータスでは返せず、error イベントで通知
+                _log_query("query_stream", query_id, payload.question, payload, chunks, None,
+                           started, error=repr(exc), context=context)
+                yield _format_sse("error", {"detail": "回答生成に失敗しました。"})
+                return
+
+        # 期限切れの場合は送信済みの断片までを回答とする（何も生成できていなければ固定メッセージ）
+        answer = "".join(answer_parts) or (DEGRADED_ANSWER if degraded_reason else "")
+        _log_query("query_stream", query_id, payload.question, payload, chunks, answer, started,
+                   degraded_reason=degraded_reason, context=context)
+        response = QueryResponse(
+            query_id=query_id,
+            question=payload.question,
+            answer=answer,
+            retrieved_chunks=retrieved_chunks,
+            model=settings.generation_model,
+            parameters=parameters,
+            timestamp=datetime.now(timezone.utc),
+            degraded=degraded_reason is not None,
+            degraded_reason=degraded_reason,
+        )
+        yield _format_sse("done", response.model_dump(mode="json"))
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from functools import lru_cache
 from pathlib import Path
+from typing import Literal
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -15,9 +16,127 @@ class Settings(BaseSettings):
     chroma_port: int = 8001
     chroma_persist_directory: str = "data/chromadb"
 
+    # ハイブリッド検索用の文字 n-gram 転置インデックス（chroma_persist_directory と同じ階層に保存）
+    lexical_index_enabled: bool = True
+    lexical_ngram: int = 2
+    # RRF の定数 k と、統合前に各検索で取得する候補数の倍率（top_k × 倍率）
+    hybrid_rrf_k: int = 60
+    hybrid_candidate_multiplier: int = 3
+
+    # チャンク埋め込みの永続ストア（chroma_persist_directory と同じ階層に保存）
+    chunk_embedding_store_enabled: bool = True
+
+    # ChromaDB コレクションの距離空間と HNSW パラメータ（space / M / construction_ef は新規作成時のみ有効）
+    chroma_distance_space: Literal["cosine", "l2", "ip"] = "cosine"
+    hnsw_m: int = 16
+    hnsw_construction_ef: int = 100
+    hnsw_search_ef: int = 100
+    # 質問ごとに指定できる search_ef の上限（大きすぎる探索幅で検索が遅くなるのを防ぐ）
+    hnsw_search_ef_max: int = 1000
+
+    # ベクトルストアのバックエンド（chroma / numpy）
+    vector_backend: Literal["chroma", "numpy"] = "chroma"
+    # numpy バックエンド: メモリマップ保存先・走査用の量子化方式・再スコアリング候補倍率・走査ブロック行数
+    numpy_store_directory: str = "data/numpy_store"
+    numpy_quantization: Literal["int8", "float16"] = "int8"
+    numpy_rescore_multiplier: int = 4
+    numpy_scan_block_rows: int = 65536
+
+    # ChromaDB 同期処理を実行するスレッドプールのサイズ（検索用 / 保存用）
+    vectordb_read_workers: int = 4
+    vectordb_write_workers: int = 1
+
+    # Gemini API のベースURL（ローカルの代替サーバーでベンチマークする場合などに差し替え）
+    gemini_api_base_url: str = "https://generativelanguage.googleapis.com/v1beta"
+
     # 使用モデル
     generation_model: str = "gemini-2.5-flash"
     embedding_model: str = "gemini-embedding-001"
+    # 埋め込みの出力次元数（未指定ならモデル既定の 3072。例: 768 で索引サイズを約1/4に）
+    embedding_output_dimensionality: int | None = None
+
+    # 埋め込みバッチ処理の設定（batchEmbedContents は1リクエスト最大100件）
+    embedding_batch_size: int = 100
+    embedding_max_concurrency: int = 4
+
+    # Gemini API 呼び出しの共有レート制御（埋め込み・生成でクォータが別のため用途ごとに設定。RPM / TPM は 0 で無制限）
+    # 同時実行数は上限値から開始し、429 で半減・成功が続くと上限まで回復する（AIMD）
+    embedding_rpm_limit: int = 0
+    embedding_tpm_limit: int = 0
+    embedding_concurrency_limit: int = 16
+    generation_rpm_limit: int = 0
+    generation_tpm_limit: int = 0
+    generation_concurrency_limit: int = 16
+    # 429 / 5xx / 通信エラー時の再試行回数と、ジッター付き指数バックオフの基準・上限（秒）
+    gemini_max_retries: int = 5
+    gemini_retry_base_delay: float = 0.5
+    gemini_retry_max_delay: float = 30.0
+
+    # 一括質問応答（/query/batch）の1リクエストあたりの最大質問数と回答生成の同時実行数
+    batch_query_max_questions: int = 500
+    batch_query_concurrency: int = 8
+
+    # アップロードをディスクへ書き出す単位（バイト）
+    upload_block_size: int = 1024 * 1024
+
+    # バックグラウンドのベクトル化ジョブ設定（進捗はバッチ単位で保存）
+    vectorize_workers: int = 2
+    vectorize_max_queued_jobs: int = 100
+    vectorize_batch_size: int = 200
+    # 保存待ちの間に先行して埋め込むバッチ数（パイプラインの深さ）
+    vectorize_pipeline_depth: int = 2
+
+    # 質問埋め込みキャッシュ（0で無効。パスを指定すると SQLite に永続化）
+    query_embedding_cache_size: int = 1024
+    query_embedding_cache_ttl: float = 3600.0
+    query_embedding_cache_path: str = ""
+
+    # Gemini API 共有HTTPクライアントの設定（keep-alive / HTTP/2 でハンドシェイクを再利用）
+    http2_enabled: bool = True
+    http_max_connections: int = 20
+    http_max_keepalive_connections: int = 10
+    http_keepalive_expiry: float = 30.0
+    http_connect_timeout: float = 5.0
+
+    # 操作ごとのタイムアウト（秒）
+    embedding_timeout: float = 30.0
+    embedding_batch_timeout: float = 60.0
+    generation_timeout: float = 60.0
+
+    # 実験ログ（質問応答・ベクトル化の入力・検索結果・モデル・パラメータを JSONL で記録）
+    # ディレクトリはプロジェクトルート（application/）基準。既定はリポジトリルートの experiments/
+    experiment_log_enabled: bool = True
+    experiment_log_directory: str = "../experiments"
+    experiment_log_filename: str = "experiment_log.jsonl"
+    # 書き込み待ちキューの上限（超えた分は破棄して件数を数える）・1回に書き込む最大件数・fsync 間隔（秒）
+    experiment_log_queue_size: int = 10000
+    experiment_log_batch_size: int = 500
+    experiment_log_fsync_interval: float = 1.0
+    # このサイズ（バイト）を超えたらローテーションし、旧ファイルを gzip 圧縮する（0でローテーションなし）
+    experiment_log_max_bytes: int = 64 * 1024 * 1024
+    experiment_log_compress: bool = True
+
+    # 質問応答（/query）の処理期限（秒、0で無期限）。リクエストの deadline_ms で上書きでき、
+    # 埋め込み・検索・生成の各ステージは残り時間をタイムアウトとして実行する
+    query_deadline_seconds: float = 10.0
+    # 生成開始時の残り時間がこれを下回る場合は生成を省略し、検索結果のみを返す（縮退応答）
+    query_generation_min_seconds: float = 1.0
+
+    # 質問埋め込みのヘッジ要求: 直近の応答時間の分位点（p95）を過ぎても返らなければ同じ要求を追加で送る
+    # 計測件数が少ない間は initial_delay を待ち時間とし、min_delay 未満には下げない
+    embedding_hedge_enabled: bool = True
+    embedding_hedge_quantile: float = 0.95
+    embedding_hedge_initial_delay: float = 1.0
+    embedding_hedge_min_delay: float = 0.05
+
+    # 検索結果から生成用の文脈を組み立てる設定（無効時は取得チャンクをそのまま連結）
+    # 同じドキュメントの隣接チャンクは重複部分（オーバーラップ）を除いて連結し、
+    # MMR（λ=関連度の重み）で多様なチャンクから順に、トークン数の概算が予算に収まるまで採用する
+    context_packing_enabled: bool = True
+    context_token_budget: int = 2000
+    context_mmr_lambda: float = 0.7
+    # 採用済みチャンクとの埋め込みのコサイン類似度がこれ以上なら重複とみなして除外する
+    context_duplicate_threshold: float = 0.97
 
     # アプリログ設定
     log_level: str = "INFO"
@@ -30,6 +149,18 @@ class Settings(BaseSettings):
     )
 
 
+# 相対パス設定の基準となるプロジェクトルート（application/）
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+
+def resolve_project_path(path: str) -> Path:
+    # 相対パスはプロジェクトルート基準へ正規化
+    resolved = Path(path)
+    if not resolved.is_absolute():
+        resolved = PROJECT_ROOT / resolved
+    return resolved
+
+
 @lru_cache
 def get_settings() -> Settings:
     # 設定オブジェクトをキャッシュして毎回の再生成を防ぐ
@@ -1,12 +1,26 @@
 from __future__ import annotations
 
+import asyncio
+from contextlib import asynccontextmanager
 import logging
+from typing import AsyncIterator
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from .config import get_settings
-from .api import documents, queries
+from .api import documents, jobs, metrics, queries
+from .services.document_store import close_document_store
+from .services.embedding import close_query_embedding_cache
+from .services.embedding_store import close_chunk_embedding_store
+from .services.experiment_log import close_experiment_logger, init_experiment_logger
+from .services.http_client import close_http_client, init_http_client
+from .services.ingest import run_vectorization_job
+from .services.jobs import close_job_queue, init_job_queue
+from .services.lexical_index import close_lexical_index, get_lexical_index
+from .services.rate_limit import reset_rate_limiters
+from .services.telemetry import ServerTimingMiddleware
+from .services.vectordb import init_vectordb_service, reset_vectordb_service
 
 
 _TAGS_METADATA = [
@@ -19,6 +33,14 @@ _TAGS_METADATA = [
         "name": "documents",
         "description": "ドキュメントのアップロード・ベクトル化・一覧取得などを行うエンドポイント。",
     },
+    {
+        "name": "jobs",
+        "description": "バックグラウンドで実行されるベクトル化ジョブの進捗を確認するエンドポイント。",
+    },
+    {
+        "name": "metrics",
+        "description": "スレッドプール使用状況などの実行時メトリクスを返すエンドポイント。",
+    },
 ]
 
 _DESCRIPTION = """
@@ -35,11 +57,53 @@ _DESCRIPTION = """
 ### 利用フロー
 
 1. `POST /api/v1/documents` でテキストファイルをアップロード
-2. `POST /api/v1/documents/{document_id}/vectorize` でベクトル化
+2. `POST /api/v1/documents/{document_id}/vectorize` でベクトル化ジョブを登録し、`GET /api/v1/jobs/{job_id}` で完了を確認
 3. `POST /api/v1/query` で質問を送信
 """
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # 必須環境変数が未設定のまま起動しないようにチェック
+    settings = get_settings()
+    if not settings.gemini_api_key:
+        raise RuntimeError("GEMINI_API_KEY が設定されていません。.env を確認してください。")
+
+    # 起動時にログレベルを反映
+    logging.basicConfig(level=settings.log_level)
+
+    # Gemini 呼び出し用の共有HTTPクライアントをアプリ存続期間中だけ保持
+    await init_http_client()
+
+    # ChromaDB クライアントとコレクション、実行用スレッドプールを起動時に一度だけ用意
+    vectordb = init_vectordb_service()
+
+    # 転置インデックス導入前のデータがあれば、初回起動時に一度だけ索引を構築
+    lexical_index = get_lexical_index()
+    if lexical_index is not None and lexical_index.count() == 0:
+        await asyncio.to_thread(lexical_index.backfill, vectordb.service.iter_chunk_pages())
+
+    # 実験ログの書き込みタスクを起動（質問応答・ベクトル化ジョブから記録される）
+    await init_experiment_logger()
+
+    # ベクトル化ジョブのワーカーを起動（未完了ジョブはここで再開）
+    await init_job_queue(run_vectorization_job)
+    try:
+        yield
+    finally:
+        await close_job_queue()
+        # ジョブ停止後に、キューに残った実験ログを書き切る
+        await close_experiment_logger()
+        # 書き込み待ちの質問埋め込みを SQLite へ反映
+        await close_query_embedding_cache()
+        await close_http_client()
+        reset_rate_limiters()
+        reset_vectordb_service()
+        close_chunk_embedding_store()
+        close_lexical_index()
+        close_document_store()
+
+
 def create_app() -> FastAPI:
     # FastAPIアプリ本体を生成
     app = FastAPI(
@@ -53,6 +117,7 @@ def create_app() -> FastAPI:
         },
         docs_url="/docs",
         redoc_url="/redoc",
+        lifespan=lifespan,
     )
 
     # ローカル検証を優先し、CORSは広めに許可
@@ -64,19 +129,15 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
 
-    @app.on_event("startup")
-    async def validate_environment() -> None:
-        # 必須環境変数が未設定のまま起動しないようにチェック
-        settings = get_settings()
-        if not settings.gemini_api_key:
-            raise RuntimeError("GEMINI_API_KEY が設定されていません。.env を確認してください。")
-
-        # 起動時にログレベルを反映
-        logging.basicConfig(level=settings.log_level)
+    # ステージごとの処理時間を Server-Timing ヘッダーとヒストグラムへ記録
+    app.add_middleware(ServerTimingMiddleware)
 
     # APIルーターを登録
     app.include_router(queries.router)
     app.include_router(documents.router)
+    app.include_router(jobs.router)
+    app.include_router(metrics.router)
+    app.include_router(metrics.prometheus_router)
 
     return app
 
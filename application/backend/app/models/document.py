@@ -21,8 +21,14 @@ class Document(BaseModel):
     document_id: str = Field(..., description="ドキュメントの一意ID")
     filename: str = Field(..., description="元のファイル名")
     file_type: Literal["txt", "pdf", "md"] = Field(..., description="ファイル種別")
-    status: Literal["pending", "processed", "error"] = Field(
-        ..., description="処理状態: pending=未処理, processed=ベクトル化済, error=エラー"
+    status: Literal["pending", "processing", "processed", "error", "deleting"] = Field(
+        ...,
+        description="処理状態: pending=未処理, processing=ベクトル化中, processed=ベクトル化済, error=エラー,"
+        " deleting=削除処理中",
     )
     created_at: datetime = Field(..., description="アップロード日時 (UTC)")
-    original_text: str | None = Field(None, description="ドキュメントの原文テキスト")
+    original_text: str | None = Field(
+        None,
+        description="ドキュメントの原文テキスト（旧形式で登録されたドキュメントのみ。"
+        "新規登録分の本文は保存ファイルのみに保持）",
+    )
@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Literal
+
+from pydantic import BaseModel, Field
+
+
+class VectorizationJob(BaseModel):
+    """ドキュメントのベクトル化ジョブ（バックグラウンド実行）の状態"""
+
+    job_id: str = Field(..., description="ジョブの一意ID")
+    document_id: str = Field(..., description="対象ドキュメントのID")
+    status: Literal["queued", "running", "completed", "failed"] = Field(
+        ..., description="ジョブ状態: queued=待機中, running=実行中, completed=完了, failed=失敗"
+    )
+    chunk_size: int = Field(..., description="チャンクサイズ（文字数）")
+    chunk_overlap: int = Field(..., description="チャンク間のオーバーラップ（文字数）")
+    total_chunks: int = Field(0, description="総チャンク数（分割完了までは 0）")
+    processed_chunks: int = Field(0, description="ベクトルDBへ保存済みのチャンク数")
+    embedding_model: str | None = Field(None, description="使用した埋め込みモデル名")
+    embedding_dimension: int | None = Field(None, description="埋め込みベクトルの次元数")
+    error: str | None = Field(None, description="失敗時のエラーメッセージ")
+    created_at: datetime = Field(..., description="ジョブ登録日時 (UTC)")
+    updated_at: datetime = Field(..., description="最終更新日時 (UTC)")
@@ -1,19 +1,67 @@
 from __future__ import annotations
 
 from datetime import datetime
+from typing import Literal
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 
+from ..config import get_settings
 
-class QueryRequest(BaseModel):
-    """質問応答リクエスト"""
 
-    question: str = Field(..., min_length=1, description="ユーザーの質問文")
+class QueryOptions(BaseModel):
+    """検索・生成の共通オプション"""
+
     top_k: int = Field(5, ge=1, le=20, description="ベクトル検索で取得する上位チャンク数 (1〜20)")
     temperature: float = Field(
         0.7, ge=0.0, le=2.0, description="生成時のランダム性 (0.0=決定的, 2.0=最大)"
     )
     max_tokens: int = Field(500, ge=1, description="生成する最大トークン数")
+    search_ef: int | None = Field(
+        None,
+        ge=1,
+        description="HNSW 検索時の探索幅（未指定時は設定値 HNSW_SEARCH_EF。大きいほど再現率が上がり低速）。"
+        "設定値より広げる方向にのみ効き、小さい値は効果がありません。上限は設定値 HNSW_SEARCH_EF_MAX",
+    )
+    search_mode: Literal["vector", "hybrid"] = Field(
+        "vector",
+        description="検索方式: vector=ベクトル検索のみ, hybrid=文字 n-gram の BM25 検索とベクトル検索を RRF で統合",
+    )
+    context_token_budget: int | None = Field(
+        None,
+        ge=1,
+        description="生成に渡す文脈のトークン数の上限（概算。未指定時は設定値 CONTEXT_TOKEN_BUDGET）",
+    )
+
+    @field_validator("search_ef")
+    @classmethod
+    def _check_search_ef(cls, value: int | None) -> int | None:
+        # 上限は設定値で変えられるよう、Field の le ではなく実行時の設定と比較する
+        limit = get_settings().hnsw_search_ef_max
+        if value is not None and value > limit:
+            raise ValueError(f"search_ef は {limit} 以下で指定してください。")
+        return value
+
+
+class QueryRequest(QueryOptions):
+    """質問応答リクエスト"""
+
+    question: str = Field(..., min_length=1, description="ユーザーの質問文")
+    deadline_ms: int | None = Field(
+        None,
+        ge=1,
+        description="処理期限（ミリ秒。未指定時は設定値 QUERY_DEADLINE_SECONDS）。"
+        "`/query` では埋め込み・検索・生成の各ステージに残り時間を割り当て、"
+        "検索・生成が間に合わない場合は縮退応答を返します。"
+        "`/query/stream` では生成の完了まで、`/query/compare` では RAG・非RAG の両方の回答生成に適用します",
+    )
+
+
+class BatchQueryRequest(QueryOptions):
+    """一括質問応答リクエスト（全質問に同じオプションを適用）"""
+
+    questions: list[str] = Field(
+        ..., min_length=1, description="質問文の一覧（上限は設定値 BATCH_QUERY_MAX_QUESTIONS）"
+    )
 
 
 class GenerationParameters(BaseModel):
@@ -22,6 +70,7 @@ class GenerationParameters(BaseModel):
     temperature: float = Field(..., description="生成時のランダム性")
     max_tokens: int = Field(..., description="最大生成トークン数")
     top_k: int = Field(..., description="検索上位チャンク数")
+    search_mode: str = Field("vector", description="検索方式 (vector / hybrid)")
 
 
 class RetrievedChunk(BaseModel):
@@ -29,8 +78,11 @@ class RetrievedChunk(BaseModel):
 
     chunk_id: str = Field(..., description="チャンクの一意ID")
     document_id: str | None = Field(None, description="所属ドキュメントのID")
+    chunk_index: int | None = Field(None, description="ドキュメント内のチャンク番号")
     content: str = Field(..., description="チャンクのテキスト内容")
-    similarity_score: float = Field(..., description="質問との類似スコア (0.0〜1.0)")
+    similarity_score: float = Field(
+        ..., description="質問との類似スコア (0.0〜1.0。hybrid では RRF スコアを正規化した値)"
+    )
 
 
 class QueryResponse(BaseModel):
@@ -45,3 +97,76 @@ class QueryResponse(BaseModel):
     model: str = Field(..., description="使用した生成モデル名")
     parameters: GenerationParameters = Field(..., description="実行時パラメータ")
     timestamp: datetime = Field(..., description="レスポンス生成日時 (UTC)")
+    degraded: bool = Field(
+        False, description="処理期限内に回答を生成できず、検索結果のみを返した場合は true"
+    )
+    degraded_reason: str | None = Field(None, description="縮退応答になった理由")
+
+
+class BatchQueryTimings(BaseModel):
+    """一括質問応答の処理時間 (ミリ秒)"""
+
+    embedding_ms: float = Field(..., description="全質問の埋め込み化にかかった時間")
+    retrieval_ms: float = Field(..., description="全質問の検索にかかった時間")
+    generation_ms: float = Field(..., description="全質問の回答生成にかかった時間（並行実行の経過時間）")
+    total_ms: float = Field(..., description="リクエスト全体の処理時間")
+
+
+class BatchQueryResult(BaseModel):
+    """一括質問応答の質問ごとの結果"""
+
+    index: int = Field(..., description="リクエスト内での質問の位置 (0始まり)")
+    response: QueryResponse | None = Field(None, description="回答（生成に失敗した場合は null）")
+    error: str | None = Field(None, description="生成に失敗した場合のエラー内容")
+    generation_ms: float = Field(..., description="この質問の回答生成にかかった時間 (ミリ秒)")
+
+
+class BatchQueryResponse(BaseModel):
+    """一括質問応答APIのレスポンス"""
+
+    batch_id: str = Field(..., description="リクエストの一意ID")
+    results: list[BatchQueryResult] = Field(..., description="質問ごとの結果（入力順）")
+    succeeded: int = Field(..., description="回答生成に成功した質問数")
+    failed: int = Field(..., description="回答生成に失敗した質問数")
+    timings: BatchQueryTimings = Field(..., description="ステージごとの処理時間")
+
+
+class TokenUsage(BaseModel):
+    """生成モデルのトークン使用量（Gemini の usageMetadata。返却されない項目は null）"""
+
+    prompt_tokens: int | None = Field(None, description="入力プロンプトのトークン数")
+    completion_tokens: int | None = Field(None, description="回答のトークン数")
+    thoughts_tokens: int | None = Field(None, description="思考（thinking）のトークン数")
+    total_tokens: int | None = Field(None, description="合計トークン数")
+
+
+class NonRagResponse(BaseModel):
+    """Non-RAG モード（検索なし）の回答"""
+
+    answer: str = Field(..., description="生成モデルのみで生成した回答")
+    model: str = Field(..., description="使用した生成モデル名")
+    parameters: GenerationParameters = Field(..., description="実行時パラメータ")
+
+
+class CompareModeStats(BaseModel):
+    """比較モードの各モードの処理時間・トークン使用量"""
+
+    latency_ms: float = Field(..., description="このモードの処理時間（RAG は検索を含む）")
+    retrieval_ms: float | None = Field(None, description="検索にかかった時間（RAG のみ）")
+    usage: TokenUsage | None = Field(None, description="トークン使用量（生成しなかった場合は null）")
+    error: str | None = Field(None, description="失敗した場合のエラー内容")
+
+
+class CompareResponse(BaseModel):
+    """RAG / Non-RAG 比較APIのレスポンス"""
+
+    comparison_id: str = Field(..., description="リクエストの一意ID")
+    question: str = Field(..., description="入力された質問文")
+    rag_response: QueryResponse | None = Field(None, description="RAG の回答（失敗した場合は null）")
+    non_rag_response: NonRagResponse | None = Field(
+        None, description="Non-RAG の回答（失敗した場合は null）"
+    )
+    rag: CompareModeStats = Field(..., description="RAG の処理時間・トークン使用量")
+    non_rag: CompareModeStats = Field(..., description="Non-RAG の処理時間・トークン使用量")
+    total_ms: float = Field(..., description="リクエスト全体の処理時間（両モードを並行実行）")
+    timestamp: datetime = Field(..., description="レスポンス生成日時 (UTC)")
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import logging
+
+import numpy as np
+
+from ..config import get_settings
+from .rate_limit import estimate_tokens
+from .telemetry import stage
+from .vectordb import AsyncVectorDBService
+
+logger = logging.getLogger(__name__)
+
+
+def overlap_length(left: str, right: str, overlap: int | None) -> int:
+    # 分割時のオーバーラップ文字数のうち、実際に left の末尾と right の先頭が一致する場合のみ取り除く
+    # （オーバーラップが記録されていない旧データは取り除かずにそのまま連結する）
+    if not overlap or overlap <= 0 or overlap > len(right):
+        return 0
+    return overlap if left.endswith(right[:overlap]) else 0
+
+
+def merge_adjacent_chunks(chunks: list[dict]) -> list[tuple[list[dict], str]]:
+    """同じドキュメントで chunk_index が連続するチャンクを、重複部分を除いて1つの本文に連結する
+
+    重複部分はベクトル化時に保存した chunk_overlap の文字数で判断する。
+    入力順（優先度順）を保ち、各まとまりは最初に現れたチャンクの位置に置く。
+    戻り値は (まとまりに含まれるチャンク, 連結した本文) の一覧。
+    """
+    groups: list[list[dict]] = []
+    group_of: dict[tuple[str, int], int] = {}
+    for chunk in chunks:
+        document_id, index = chunk.get("document_id"), chunk.get("chunk_index")
+        if document_id is None or index is None:
+            groups.append([chunk])
+            continue
+        # 前後どちらかに隣接するまとまりがあれば合流し、両側にあれば先に現れた方へ2つを結合する
+        before = group_of.get((document_id, index - 1))
+        after = group_of.get((document_id, index + 1))
+        if before is not None and after is not None and before != after:
+            keep, drop = min(before, after), max(before, after)
+            groups[keep].extend(groups[drop])
+            for member in groups[drop]:
+                group_of[(document_id, member["chunk_index"])] = keep
+            groups[drop] = []
+            before = after = keep
+        position = before if before is not None else after
+        if position is None:
+            position = len(groups)
+            groups.append([])
+        groups[position].append(chunk)
+        group_of[(document_id, index)] = position
+
+    merged: list[tuple[list[dict], str]] = []
+    for group in groups:
+        if not group:
+            continue
+        ordered = sorted(group, key=lambda chunk: chunk.get("chunk_index") or 0)
+        parts = [ordered[0]["content"]]
+        for previous, chunk in zip(ordered, ordered[1:]):
+            overlap = overlap_length(
+                previous["content"], chunk["content"], chunk.get("chunk_overlap"))
+            parts.append(chunk["content"][overlap:])
+        merged.append((group, "".join(parts)))
+    return merged
+
+
+def _normalized_matrix(chunks: list[dict], embeddings: dict[str, list[float]]) -> np.ndarray | None:
+    # チャンク順の L2 正規化済み行列（埋め込みが取得できなかった行は 0 ベクトル）
+    vectors = [embeddings.get(chunk["chunk_id"]) for chunk in chunks]
+    dimension = next((len(vector) for vector in vectors if vector), 0)
+    if dimension == 0:
+        return None
+    matrix = np.zeros((len(chunks), dimension), dtype=np.float32)
+    for row, vector in enumerate(vectors):
+        if vector and len(vector) == dimension:
+            matrix[row] = vector
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def pack_context(
+    chunks: list[dict],
+    embeddings: dict[str, list[float]],
+    token_budget: int,
+    mmr_lambda: float = 0.7,
+    duplicate_threshold: float = 0.97,
+) -> tuple[list[dict], list[str], dict]:
+    """検索結果から、トークン予算内に収まる多様なチャンクを選んで生成用の文脈を組み立てる
+
+    MMR（λ × 関連度 − (1 − λ) × 採用済みチャンクとの最大類似度）の高い順に採用する。
+    関連度は検索スコア、類似度は保存済み埋め込みのコサイン類似度を使い、
+    類似度が duplicate_threshold 以上（再アップロードした同じ内容など）や本文が同一のチャンクは除外する。
+    隣接チャンクの重複部分は数えずに予算を判定し、最上位のチャンクは予算を超えても必ず採用する。
+    戻り値は (採用したチャンク, プロンプトへ渡す本文の一覧, 集計値)。
+    """
+    matrix = _normalized_matrix(chunks, embeddings)
+    relevance = [float(chunk.get("score") or 0.0) for chunk in chunks]
+    max_similarity = np.full(len(chunks), -np.inf, dtype=np.float32)
+    remaining = list(range(len(chunks)))
+    selected: list[int] = []
+    passages: list[str] = []
+    tokens = 0
+    seen_contents: set[str] = set()
+    duplicates = over_budget = 0
+
+    def mmr(index: int) -> float:
+        redundancy = max(0.0, float(max_similarity[index])) if selected else 0.0
+        return mmr_lambda * relevance[index] - (1.0 - mmr_lambda) * redundancy
+
+    while remaining:
+        # 未採用の候補から MMR が最大のものを取り出す
+        best = max(remaining, key=mmr)
+        remaining.remove(best)
+        chunk = chunks[best]
+
+        if chunk["content"] in seen_contents or (
+            selected and max_similarity[best] >= duplicate_threshold
+        ):
+            duplicates += 1
+            continue
+
+        candidate = [chunks[index] for index in selected] + [chunk]
+        candidate_passages = [text for _, text in merge_adjacent_chunks(candidate)]
+        candidate_tokens = sum(estimate_tokens(text) for text in candidate_passages)
+        if selected and candidate_tokens > token_budget:
+            # 予算を超える場合は採用せず、より短い候補が収まるか続けて判定する
+            over_budget += 1
+            continue
+
+        selected.append(best)
+        passages, tokens = candidate_passages, candidate_tokens
+        seen_contents.add(chunk["content"])
+        if matrix is not None:
+            np.maximum(max_similarity, matrix @ matrix[best], out=max_similarity)
+
+    original_tokens = sum(estimate_tokens(chunk["content"]) for chunk in chunks)
+    return [chunks[index] for index in selected], passages, {
+        "candidates": len(chunks),
+        "selected": len(selected),
+        "passages": len(passages),
+        "duplicates": duplicates,
+        "over_budget": over_budget,
+        "tokens": tokens,
+        "original_tokens": original_tokens,
+    }
+
+
+async def build_context(
+    chunks: list[dict],
+    vectordb: AsyncVectorDBService,
+    token_budget: int | None = None,
+) -> tuple[list[dict], list[str], dict | None]:
+    # 検索結果から生成用の文脈を組み立てる（無効時・ヒットなし時は取得チャンクをそのまま使う）
+    settings = get_settings()
+    if not chunks or not settings.context_packing_enabled:
+        return chunks, [chunk["content"] for chunk in chunks], None
+
+    with stage("context_packing"):
+        try:
+            embeddings = await vectordb.get_chunk_embeddings(
+                [chunk["chunk_id"] for chunk in chunks])
+        except Exception:
+            # 埋め込みが取得できなくても、重複除去・隣接チャンクの連結・予算判定は行う
+            logger.warning("文脈構築用の埋め込み取得に失敗しました。多様性を考慮せずに選択します。",
+                           exc_info=True)
+            embeddings = {}
+        return pack_context(
+            chunks,
+            embeddings,
+            token_budget or settings.context_token_budget,
+            mmr_lambda=settings.context_mmr_lambda,
+            duplicate_threshold=settings.context_duplicate_threshold,
+        )
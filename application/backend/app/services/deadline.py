@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+import time
+from typing import Awaitable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+# 期限間近でも HTTP タイムアウトに 0 以下を渡さないための下限（秒）
+MIN_STAGE_TIMEOUT = 0.01
+
+
+class DeadlineExceededError(TimeoutError):
+    """リクエストの処理期限内にステージが完了しなかった"""
+
+    def __init__(self, stage: str) -> None:
+        super().__init__(f"処理期限を超過しました: {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    """リクエスト全体の処理期限（seconds が None / 0 以下なら無期限）"""
+
+    def __init__(self, seconds: float | None) -> None:
+        self._expires_at = time.monotonic() + seconds if seconds and seconds > 0 else None
+
+    def remaining(self) -> float | None:
+        if self._expires_at is None:
+            return None
+        return max(0.0, self._expires_at - time.monotonic())
+
+    def timeout(self, default: float) -> float:
+        # ステージ既定のタイムアウトと残り時間の短い方
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        return max(MIN_STAGE_TIMEOUT, min(default, remaining))
+
+    async def run(self, awaitable: Awaitable[T], stage: str) -> T:
+        # 残り時間をタイムアウトとしてステージを実行する
+        remaining = self.remaining()
+        if remaining is None:
+            return await awaitable
+        try:
+            return await asyncio.wait_for(awaitable, timeout=max(MIN_STAGE_TIMEOUT, remaining))
+        except asyncio.TimeoutError as exc:
+            raise DeadlineExceededError(stage) from exc
+
+
+# 実行中リクエストの処理期限（埋め込み・生成の HTTP タイムアウトや再試行の判断に使う）
+_current_deadline: ContextVar[Deadline | None] = ContextVar("current_deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(deadline: Deadline) -> Iterator[Deadline]:
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def remaining_budget() -> float | None:
+    # 期限が設定されていない場合は None
+    deadline = _current_deadline.get()
+    return deadline.remaining() if deadline is not None else None
+
+
+def stage_timeout(default: float) -> float:
+    # 処理期限内なら残り時間で、期限外（ジョブ・スクリプト）なら既定値でタイムアウトさせる
+    deadline = _current_deadline.get()
+    return deadline.timeout(default) if deadline is not None else default
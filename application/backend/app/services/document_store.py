@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import base64
+import json
+from pathlib import Path
+import sqlite3
+import threading
+
+from ..config import PROJECT_ROOT
+
+DOCUMENTS_DIR = PROJECT_ROOT / "data" / "documents"
+DB_PATH = DOCUMENTS_DIR / "documents.sqlite3"
+# 旧形式のインデックス（初回起動時に DB へ移行）
+LEGACY_INDEX_PATH = DOCUMENTS_DIR / "documents_index.json"
+
+# documents テーブルで管理する列（API層の index_entry と同じキー）
+DOCUMENT_COLUMNS = (
+    "document_id",
+    "filename",
+    "file_type",
+    "status",
+    "created_at",
+    "original_text",
+    "stored_path",
+    "chunk_count",
+    "char_count",
+)
+
+# 削除処理中のステータス（この間はベクトル化ジョブの登録・実行を受け付けない）
+DELETING_STATUS = "deleting"
+
+# 一覧取得で返す列（本文 original_text は読み込まない）
+LIST_COLUMNS = tuple(column for column in DOCUMENT_COLUMNS if column != "original_text")
+
+
+def encode_cursor(created_at: str, document_id: str) -> str:
+    # (created_at, document_id) を不透明なカーソル文字列へ変換
+    raw = json.dumps([created_at, document_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        created_at, document_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception as exc:
+        raise ValueError("cursor の形式が不正です。") from exc
+    return str(created_at), str(document_id)
+
+
+class DocumentStore:
+    """ドキュメントのメタ情報を管理する SQLite（WALモード）ストア
+
+    1件単位の upsert で更新するため、コーパスが大きくなっても書き込みコストは一定。
+    """
+
+    def __init__(self, db_path: str, legacy_index_path: str | None = None) -> None:
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                document_id TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                file_type TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                original_text TEXT,
+                stored_path TEXT NOT NULL,
+                chunk_count INTEGER NOT NULL DEFAULT 0,
+                char_count INTEGER
+            );
+            """
+        )
+        # 旧スキーマ（chunk_count 列なし）の DB を移行
+        columns = {row["name"] for row in self._db.execute("PRAGMA table_info(documents)")}
+        if "chunk_count" not in columns:
+            self._db.execute(
+                "ALTER TABLE documents ADD COLUMN chunk_count INTEGER NOT NULL DEFAULT 0")
+        # 本文の文字数（アップロード時に記録。旧データは NULL のままベクトル化時に数え直す）
+        if "char_count" not in columns:
+            self._db.execute("ALTER TABLE documents ADD COLUMN char_count INTEGER")
+        # キーセットページング用に (status, created_at, document_id) の複合索引を張る
+        self._db.executescript(
+            """
+            DROP INDEX IF EXISTS idx_documents_status;
+            DROP INDEX IF EXISTS idx_documents_created_at;
+            CREATE INDEX IF NOT EXISTS idx_documents_status_created
+                ON documents (status, created_at, document_id);
+            CREATE INDEX IF NOT EXISTS idx_documents_created
+                ON documents (created_at, document_id);
+            """
+        )
+        # 一覧の total を COUNT(*) の全走査なしで返せるよう、ステータス別の件数をトリガーで維持する
+        has_counts = self._db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'document_counts'"
+        ).fetchone() is not None
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS document_counts (
+                status TEXT PRIMARY KEY,
+                count INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TRIGGER IF NOT EXISTS trg_documents_count_insert
+            AFTER INSERT ON documents BEGIN
+                INSERT INTO document_counts (status, count) VALUES (NEW.status, 1)
+                    ON CONFLICT(status) DO UPDATE SET count = count + 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS trg_documents_count_delete
+            AFTER DELETE ON documents BEGIN
+                UPDATE document_counts SET count = count - 1 WHERE status = OLD.status;
+            END;
+            CREATE TRIGGER IF NOT EXISTS trg_documents_count_status
+            AFTER UPDATE OF status ON documents WHEN OLD.status IS NOT NEW.status BEGIN
+                UPDATE document_counts SET count = count - 1 WHERE status = OLD.status;
+                INSERT INTO document_counts (status, count) VALUES (NEW.status, 1)
+                    ON CONFLICT(status) DO UPDATE SET count = count + 1;
+            END;
+            """
+        )
+        if not has_counts:
+            # 既存 DB は作成時に一度だけ集計して初期値とする
+            self._db.execute(
+                "INSERT INTO document_counts (status, count)"
+                " SELECT status, COUNT(*) FROM documents GROUP BY status"
+            )
+        self._db.commit()
+
+        if legacy_index_path:
+            self._migrate_legacy_index(Path(legacy_index_path))
+
+    def _migrate_legacy_index(self, index_path: Path) -> None:
+        # 旧 documents_index.json が残っていれば一度だけ取り込み、退避用にリネーム
+        if not index_path.exists():
+            return
+
+        raw = index_path.read_text(encoding="utf-8")
+        entries = json.loads(raw).values() if raw.strip() else []
+        with self._lock, self._db:
+            self._db.executemany(
+                f"INSERT OR IGNORE INTO documents ({', '.join(DOCUMENT_COLUMNS)})"
+                f" VALUES ({', '.join('?' * len(DOCUMENT_COLUMNS))})",
+                [
+                    tuple(entry.get(column, 0 if column == "chunk_count" else None)
+                          for column in DOCUMENT_COLUMNS)
+                    for entry in entries
+                ],
+            )
+        index_path.rename(index_path.with_suffix(index_path.suffix + ".migrated"))
+
+    def get(self, document_id: str) -> dict | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM documents WHERE document_id = ?", (document_id,)
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def upsert(self, entry: dict) -> None:
+        # 1件だけを挿入または置換（他ドキュメントの更新を上書きしない）
+        placeholders = ", ".join("?" * len(DOCUMENT_COLUMNS))
+        updates = ", ".join(
+            f"{column} = excluded.{column}" for column in DOCUMENT_COLUMNS[1:])
+        with self._lock, self._db:
+            self._db.execute(
+                f"INSERT INTO documents ({', '.join(DOCUMENT_COLUMNS)}) VALUES ({placeholders})"
+                f" ON CONFLICT(document_id) DO UPDATE SET {updates}",
+                tuple(entry.get(column, 0 if column == "chunk_count" else None)
+                      for column in DOCUMENT_COLUMNS),
+            )
+
+    def update(self, document_id: str, **fields) -> None:
+        # 指定列のみ更新（status の遷移など）
+        unknown = set(fields) - set(DOCUMENT_COLUMNS[1:])
+        if unknown:
+            raise ValueError(f"未知の列が指定されました: {sorted(unknown)}")
+        if not fields:
+            return
+
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._lock, self._db:
+            self._db.execute(
+                f"UPDATE documents SET {assignments} WHERE document_id = ?",
+                (*fields.values(), document_id),
+            )
+
+    def mark_deleting(self, document_id: str) -> bool:
+        # 削除処理中へ条件付きで遷移する（既に削除処理中なら False）
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "UPDATE documents SET status = ? WHERE document_id = ? AND status != ?",
+                (DELETING_STATUS, document_id, DELETING_STATUS),
+            )
+        return cursor.rowcount > 0
+
+    def delete(self, document_id: str) -> bool:
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "DELETE FROM documents WHERE document_id = ?", (document_id,))
+        return cursor.rowcount > 0
+
+    def increment_chunk_count(self, document_id: str, delta: int) -> None:
+        # 取り込み時にチャンク数カウンタを更新（一覧で VectorDB を走査しないため）
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE documents SET chunk_count = MAX(chunk_count + ?, 0) WHERE document_id = ?",
+                (delta, document_id),
+            )
+
+    def list(
+        self,
+        status: str | None = None,
+        limit: int = 50,
+        offset: int = 0,
+        cursor: str | None = None,
+    ) -> list[dict]:
+        # (created_at, document_id) 順で取得。cursor 指定時はキーセットページングで
+        # 索引をシークするため、コーパス件数によらず一定コストになる
+        query = f"SELECT {', '.join(LIST_COLUMNS)} FROM documents"
+        conditions: list[str] = []
+        params: list = []
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        if cursor is not None:
+            conditions.append("(created_at, document_id) > (?, ?)")
+            params.extend(decode_cursor(cursor))
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY created_at, document_id LIMIT ?"
+        params.append(limit)
+        if cursor is None and offset:
+            query += " OFFSET ?"
+            params.append(offset)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self, status: str | None = None) -> int:
+        # トリガーで維持しているステータス別の件数を返す（documents は走査しない）
+        query = "SELECT COALESCE(SUM(count), 0) FROM document_counts"
+        params: list = []
+        if status is not None:
+            query += " WHERE status = ?"
+            params.append(status)
+        with self._lock:
+            return self._db.execute(query, params).fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+_store: DocumentStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_document_store() -> DocumentStore:
+    # FastAPI の依存性注入から利用される共有インスタンス
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = DocumentStore(str(DB_PATH), str(LEGACY_INDEX_PATH))
+    return _store
+
+
+def close_document_store() -> None:
+    global _store
+    with _store_lock:
+        if _store is not None:
+            _store.close()
+        _store = None
@@ -1,44 +1,576 @@
 from __future__ import annotations
 
+from array import array
+import asyncio
+from collections import OrderedDict, deque
+import logging
+import math
+from pathlib import Path
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable
+import unicodedata
+
 import httpx
 
-from ..config import get_settings
+from ..config import get_settings, resolve_project_path
+from .embedding_store import get_chunk_embedding_store, make_chunk_key
+from .deadline import stage_timeout
+from .http_client import gemini_model_endpoint, get_http_client
+from .rate_limit import estimate_tokens, get_rate_limiter
+from .telemetry import CHUNK_EMBEDDING_LOOKUPS, EMBEDDING_HEDGES, stage, upstream_call
 
-# Gemini API のモデルエンドポイントベースURL
-GEMINI_BASE_ENDPOINT = "https://generativelanguage.googleapis.com/v1beta/models"
+logger = logging.getLogger(__name__)
 
 
-async def get_embedding(text: str, task_type: str | None = None) -> list[float]:
-    # 設定からモデル名とAPIキーを取得
+def embedding_model_key() -> str:
+    # キャッシュ・埋め込みストアのキーに使うモデル識別子（次元数を変えたら別物として扱う）
     settings = get_settings()
-    endpoint = f"{GEMINI_BASE_ENDPOINT}/{settings.embedding_model}:embedContent"
+    if settings.embedding_output_dimensionality:
+        return f"{settings.embedding_model}@{settings.embedding_output_dimensionality}"
+    return settings.embedding_model
 
-    # Gemini embedContent の入力フォーマット
-    payload: dict = {
+
+def _postprocess_embedding(values: list[float]) -> list[float]:
+    # 次元削減時は指定次元に切り詰めたうえで L2 正規化し直す
+    # （gemini-embedding-001 は全次元出力時のみ正規化済みのため）
+    dimensionality = get_settings().embedding_output_dimensionality
+    if not dimensionality:
+        return values
+    truncated = values[:dimensionality]
+    norm = math.sqrt(sum(value * value for value in truncated))
+    if norm == 0:
+        return truncated
+    return [value / norm for value in truncated]
+
+
+def _build_embed_request(text: str, task_type: str | None) -> dict:
+    # embedContent / batchEmbedContents 共通のリクエスト本体
+    request: dict = {
         "content": {"parts": [{"text": text}]},
     }
     # 検索用途に合わせて埋め込み最適化を切り替え（例: RETRIEVAL_QUERY / RETRIEVAL_DOCUMENT）
     if task_type:
-        payload["taskType"] = task_type
+        request["taskType"] = task_type
+    dimensionality = get_settings().embedding_output_dimensionality
+    if dimensionality:
+        request["outputDimensionality"] = dimensionality
+    return request
+
+
+def _normalize_text(text: str) -> str:
+    # 全角半角・空白の揺れを吸収してキャッシュキーを安定させる
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+# SQLite 永続層への書き込みをまとめる間隔（秒）
+CACHE_WRITE_BEHIND_INTERVAL = 0.5
+
+
+class EmbeddingCache:
+    """質問埋め込みのプロセス内キャッシュ（LRU + TTL、任意で SQLite 永続層）
+
+    SQLite 層の読み込みは別スレッドで行い、書き込みはメモリに積んでおき
+    一定間隔ごとに1トランザクションでまとめて反映する（質問応答の経路で commit を待たない）。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 3600.0,
+        sqlite_path: str | None = None,
+    ) -> None:
+        self._max_entries = max(1, max_entries)
+        self._ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[tuple[str, str, str], tuple[float, list[float]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        # 再起動後も再利用できるようディスク層を用意（パス未指定なら無効）
+        self._db_lock = threading.Lock()
+        self._pending: dict[tuple[str, str, str], tuple[float, bytes]] = {}
+        self._flush_task: asyncio.Task | None = None
+        self._db: sqlite3.Connection | None = None
+        if sqlite_path:
+            Path(sqlite_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                " model TEXT NOT NULL, task_type TEXT NOT NULL, text TEXT NOT NULL,"
+                " created_at REAL NOT NULL, vector BLOB NOT NULL,"
+                " PRIMARY KEY (model, task_type, text))"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(model: str, task_type: str | None, text: str) -> tuple[str, str, str]:
+        return (model, task_type or "", _normalize_text(text))
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self._ttl_seconds > 0 and now - created_at > self._ttl_seconds
+
+    async def get(self, key: tuple[str, str, str]) -> list[float] | None:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created_at, vector = entry
+                if not self._is_expired(created_at, now):
+                    # 参照されたエントリを末尾へ移動（LRU）
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self._entries[key]
+            # 書き込み待ちのエントリはディスクを読まずに返す
+            row = self._pending.get(key)
+
+        # メモリに無ければディスク層を（別スレッドで）確認し、あればメモリへ昇格
+        if row is None and self._db is not None:
+            row = await asyncio.to_thread(self._load, key)
+        with self._lock:
+            if row is not None and not self._is_expired(row[0], now):
+                vector = array("d", row[1]).tolist()
+                self._store_memory(key, row[0], vector)
+                self.hits += 1
+                return vector
+            self.misses += 1
+            return None
+
+    def _load(self, key: tuple[str, str, str]) -> tuple[float, bytes] | None:
+        with self._db_lock:
+            return self._db.execute(
+                "SELECT created_at, vector FROM query_embeddings"
+                " WHERE model = ? AND task_type = ? AND text = ?",
+                key,
+            ).fetchone()
+
+    def set(self, key: tuple[str, str, str], vector: list[float]) -> None:
+        now = time.time()
+        with self._lock:
+            self._store_memory(key, now, vector)
+            if self._db is None:
+                return
+            self._pending[key] = (now, array("d", vector).tobytes())
+            if self._flush_task is not None:
+                return
+            try:
+                self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+                return
+            except RuntimeError:
+                pass
+        # イベントループ外（スクリプトなど）からの呼び出しはその場で書き込む
+        self._flush()
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(CACHE_WRITE_BEHIND_INTERVAL)
+        with self._lock:
+            self._flush_task = None
+        try:
+            await asyncio.to_thread(self._flush)
+        except Exception:
+            logger.exception("質問埋め込みキャッシュの書き込みに失敗しました。")
+
+    def _flush(self) -> None:
+        # 書き込み待ちのエントリを1トランザクションでまとめて保存する
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending or self._db is None:
+            return
+        with self._db_lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO query_embeddings"
+                " (model, task_type, text, created_at, vector) VALUES (?, ?, ?, ?, ?)",
+                [(*key, created_at, vector) for key, (created_at, vector) in pending.items()],
+            )
+
+    def _store_memory(self, key: tuple[str, str, str], created_at: float, vector: list[float]) -> None:
+        # 上限を超えたら最も古く参照されたエントリから追い出す
+        self._entries[key] = (created_at, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._pending.clear()
+            self.hits = 0
+            self.misses = 0
+        if self._db is not None:
+            with self._db_lock, self._db:
+                self._db.execute("DELETE FROM query_embeddings")
+
+    async def close(self) -> None:
+        # 書き込み待ちのエントリを保存してから接続を閉じる
+        with self._lock:
+            task, self._flush_task = self._flush_task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        if self._db is not None:
+            await asyncio.to_thread(self._flush)
+            with self._db_lock:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self._max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "persistent": self._db is not None,
+            }
+
+
+_query_cache: EmbeddingCache | None = None
+_query_cache_lock = threading.Lock()
+
+
+def _resolve_cache_path(path: str) -> str | None:
+    if not path:
+        return None
+
+    return str(resolve_project_path(path))
+
+
+def get_query_embedding_cache() -> EmbeddingCache | None:
+    # 設定で無効化されている場合は None を返す
+    global _query_cache
+    settings = get_settings()
+    if settings.query_embedding_cache_size <= 0:
+        return None
+
+    if _query_cache is None:
+        with _query_cache_lock:
+            if _query_cache is None:
+                _query_cache = EmbeddingCache(
+                    max_entries=settings.query_embedding_cache_size,
+                    ttl_seconds=settings.query_embedding_cache_ttl,
+                    sqlite_path=_resolve_cache_path(settings.query_embedding_cache_path),
+                )
+    return _query_cache
+
+
+def peek_query_embedding_cache() -> EmbeddingCache | None:
+    # メトリクス出力用。未生成の場合は生成せずに None を返す
+    return _query_cache
+
+
+async def close_query_embedding_cache() -> None:
+    global _query_cache
+    with _query_cache_lock:
+        cache, _query_cache = _query_cache, None
+    if cache is not None:
+        await cache.close()
+
+
+async def get_embedding(text: str, task_type: str | None = None) -> list[float]:
+    with stage("embedding"):
+        # キャッシュヒット時は API を呼ばずに返却
+        cache = get_query_embedding_cache()
+        cache_key = EmbeddingCache.make_key(embedding_model_key(), task_type, text)
+        if cache is not None:
+            cached = await cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        embedding = await _request_embedding_hedged(text, task_type)
+        if cache is not None:
+            cache.set(cache_key, embedding)
+        return embedding
+
+
+class LatencyTracker:
+    """直近の応答時間（秒）を保持し、分位点を返す（ヘッジ要求の待ち時間の算出用）"""
+
+    def __init__(self, window: int = 200) -> None:
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> float | None:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
 
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        headers = {
-            "Content-Type": "application/json",
-            "x-goog-api-key": settings.gemini_api_key,
-        }
-        response = await client.post(endpoint, headers=headers, json=payload)
+# 分位点が安定するまでの最小計測件数
+HEDGE_MIN_SAMPLES = 20
+
+_query_embedding_latency = LatencyTracker()
+
+
+def _hedge_delay() -> float:
+    settings = get_settings()
+    if len(_query_embedding_latency) < HEDGE_MIN_SAMPLES:
+        return settings.embedding_hedge_initial_delay
+    quantile = _query_embedding_latency.quantile(settings.embedding_hedge_quantile)
+    return max(settings.embedding_hedge_min_delay, quantile)
+
+
+async def _timed_request_embedding(text: str, task_type: str | None) -> list[float]:
+    started = time.perf_counter()
+    embedding = await _request_embedding(text, task_type)
+    _query_embedding_latency.observe(time.perf_counter() - started)
+    return embedding
+
+
+async def _request_embedding_hedged(text: str, task_type: str | None) -> list[float]:
+    # 最初の要求が p95 を過ぎても返らなければ同じ要求をもう1本送り、先に成功した方を使う
+    if not get_settings().embedding_hedge_enabled:
+        return await _timed_request_embedding(text, task_type)
+
+    started = time.perf_counter()
+    first = asyncio.create_task(_timed_request_embedding(text, task_type))
+    pending: set[asyncio.Task] = {first}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=_hedge_delay())
+        if done:
+            return first.result()
+
+        hedge = asyncio.create_task(_timed_request_embedding(text, task_type))
+        pending.add(hedge)
+        EMBEDDING_HEDGES.inc(result="sent")
+        error: BaseException | None = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        EMBEDDING_HEDGES.inc(result="won")
+                    return task.result()
+                error = task.exception()
+        # 両方とも失敗した場合は最後のエラーを送出
+        raise error
+    finally:
+        # 遅れた方の要求は取り消す（呼び出し元が取り消された場合も含む）
+        for task in pending:
+            task.cancel()
+        if first in pending:
+            # 取り消した最初の要求もそれまでの経過時間を記録する（遅い要求が計測から漏れて
+            # 分位点が下がり続け、ヘッジが過剰に送られるのを防ぐ）
+            _query_embedding_latency.observe(time.perf_counter() - started)
+
+
+async def get_query_embeddings(texts: list[str], task_type: str | None = None) -> list[list[float]]:
+    # 複数の質問をまとめて埋め込み化（キャッシュ済みの質問は除き、残りを batchEmbedContents で取得）
+    if not texts:
+        return []
+
+    cache = get_query_embedding_cache()
+    model_key = embedding_model_key()
+    keys = [EmbeddingCache.make_key(model_key, task_type, text) for text in texts]
+    known: dict[tuple[str, str, str], list[float]] = {}
+    missing: dict[tuple[str, str, str], str] = {}
+    for key, text in zip(keys, texts):
+        if key in known or key in missing:
+            continue
+        cached = await cache.get(key) if cache is not None else None
+        if cached is not None:
+            known[key] = cached
+        else:
+            missing[key] = text
+
+    if missing:
+        with stage("embedding"):
+            fetched = await _embed_in_batches(list(missing.values()), task_type)
+        for key, embedding in zip(missing, fetched):
+            known[key] = embedding
+            if cache is not None:
+                cache.set(key, embedding)
+
+    return [known[key] for key in keys]
+
+
+async def _request_embedding(text: str, task_type: str | None) -> list[float]:
+    settings = get_settings()
+    endpoint = gemini_model_endpoint(settings.embedding_model, "embedContent")
+
+    # Gemini embedContent の入力フォーマット
+    payload = _build_embed_request(text, task_type)
+
+    # 共有クライアントを借りてコネクションを再利用
+    client = get_http_client()
+    headers = {
+        "Content-Type": "application/json",
+        "x-goog-api-key": settings.gemini_api_key,
+    }
+    # 共有リミッター経由で送信（429 / 5xx は再試行）
+    limiter = get_rate_limiter("embedding")
+    tokens = estimate_tokens(text)
+    with upstream_call("embed_content"):
+        response = await limiter.call(
+            lambda: client.post(
+                endpoint,
+                headers=headers,
+                json=payload,
+                timeout=stage_timeout(settings.embedding_timeout),
+            ),
+            tokens,
+        )
 
         # taskType 非対応モデル向けフォールバック
         if response.status_code == 400 and task_type:
-            fallback_payload = {
-                "content": {"parts": [{"text": text}]},
-            }
-            response = await client.post(endpoint, headers=headers, json=fallback_payload)
+            fallback_payload = _build_embed_request(text, None)
+            response = await limiter.call(
+                lambda: client.post(
+                    endpoint,
+                    headers=headers,
+                    json=fallback_payload,
+                    timeout=stage_timeout(settings.embedding_timeout),
+                ),
+                tokens,
+            )
 
         if response.status_code >= 400:
-            raise RuntimeError(f"Embedding API error: status={response.status_code}, body={response.text}")
+            raise RuntimeError(
+                f"Embedding API error: status={response.status_code}, body={response.text}")
 
-        data = response.json()
+    data = response.json()
 
     # 返却形式: {"embedding": {"values": [...]}}
-    return data["embedding"]["values"]
+    return _postprocess_embedding(data["embedding"]["values"])
+
+
+def _build_batch_payload(model: str, texts: list[str], task_type: str | None) -> dict:
+    # batchEmbedContents はリクエストごとにモデル名を明示する
+    return {
+        "requests": [
+            {"model": f"models/{model}", **_build_embed_request(text, task_type)}
+            for text in texts
+        ]
+    }
+
+
+async def _embed_batch(
+    client: httpx.AsyncClient,
+    texts: list[str],
+    task_type: str | None,
+) -> list[list[float]]:
+    settings = get_settings()
+    endpoint = gemini_model_endpoint(settings.embedding_model, "batchEmbedContents")
+    headers = {
+        "Content-Type": "application/json",
+        "x-goog-api-key": settings.gemini_api_key,
+    }
+
+    # バッチ全体で1リクエスト、トークン数は全テキストの合計で制御
+    limiter = get_rate_limiter("embedding")
+    tokens = sum(estimate_tokens(text) for text in texts)
+    payload = _build_batch_payload(settings.embedding_model, texts, task_type)
+    with upstream_call("batch_embed_contents"):
+        response = await limiter.call(
+            lambda: client.post(
+                endpoint,
+                headers=headers,
+                json=payload,
+                timeout=stage_timeout(settings.embedding_batch_timeout),
+            ),
+            tokens,
+        )
+
+        # taskType 非対応モデル向けフォールバック
+        if response.status_code == 400 and task_type:
+            fallback_payload = _build_batch_payload(settings.embedding_model, texts, None)
+            response = await limiter.call(
+                lambda: client.post(
+                    endpoint,
+                    headers=headers,
+                    json=fallback_payload,
+                    timeout=stage_timeout(settings.embedding_batch_timeout),
+                ),
+                tokens,
+            )
+
+        if response.status_code >= 400:
+            raise RuntimeError(
+                f"Embedding API error: status={response.status_code}, body={response.text}")
+
+    # 返却形式: {"embeddings": [{"values": [...]}, ...]}（入力順を維持）
+    embeddings = [
+        _postprocess_embedding(item["values"]) for item in response.json().get("embeddings", [])
+    ]
+    if len(embeddings) != len(texts):
+        raise RuntimeError(
+            f"Embedding API error: expected {len(texts)} embeddings, got {len(embeddings)}"
+        )
+    return embeddings
+
+
+async def get_embeddings(texts: list[str], task_type: str | None = None) -> list[list[float]]:
+    # 複数テキストをバッチ単位でまとめて埋め込み化（入力順で返却）
+    if not texts:
+        return []
+
+    # 埋め込みストアに同一本文があれば再利用し、未取得分だけ API を呼ぶ
+    store = get_chunk_embedding_store()
+    model_key = embedding_model_key()
+    keys = [make_chunk_key(model_key, task_type, text) for text in texts]
+    known: dict[str, list[float]] = {}
+    if store is not None:
+        known = await asyncio.to_thread(store.get_many, keys)
+
+    missing: dict[str, str] = {}
+    for key, text in zip(keys, texts):
+        if key not in known and key not in missing:
+            missing[key] = text
+
+    CHUNK_EMBEDDING_LOOKUPS.inc(len(texts) - len(missing), result="hit")
+    CHUNK_EMBEDDING_LOOKUPS.inc(len(missing), result="miss")
+    if missing:
+        missing_keys = list(missing)
+
+        async def save_batch(start: int, embeddings: list[list[float]]) -> None:
+            # 完了したバッチから保存し、他のバッチが失敗しても再実行時に API を呼ばずに再利用する
+            batch_keys = missing_keys[start: start + len(embeddings)]
+            await asyncio.to_thread(store.put_many, dict(zip(batch_keys, embeddings)))
+
+        with stage("chunk_embedding"):
+            fetched = await _embed_in_batches(
+                list(missing.values()), task_type, save_batch if store is not None else None)
+        known.update(zip(missing_keys, fetched))
+
+    return [known[key] for key in keys]
+
+
+async def _embed_in_batches(
+    texts: list[str],
+    task_type: str | None,
+    on_batch: Callable[[int, list[list[float]]], Awaitable[None]] | None = None,
+) -> list[list[float]]:
+    # on_batch はバッチ完了ごとに（先頭位置, 埋め込み）で呼ばれる
+    settings = get_settings()
+    batch_size = max(1, settings.embedding_batch_size)
+    starts = range(0, len(texts), batch_size)
+
+    # 同時実行バッチ数を制限してAPIクォータ超過を防ぐ
+    semaphore = asyncio.Semaphore(max(1, settings.embedding_max_concurrency))
+    client = get_http_client()
+
+    async def run(start: int) -> list[list[float]]:
+        async with semaphore:
+            embeddings = await _embed_batch(client, texts[start: start + batch_size], task_type)
+        if on_batch is not None:
+            await on_batch(start, embeddings)
+        return embeddings
+
+    # 1バッチが失敗したら残りのバッチ（API 呼び出し・保存）を取り消す
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(run(start)) for start in starts]
+    except ExceptionGroup as exc:
+        # 呼び出し元が従来どおり個々の例外を扱えるよう、最初のエラーを送出する
+        raise exc.exceptions[0] from None
+
+    return [embedding for task in tasks for embedding in task.result()]
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+from array import array
+import hashlib
+from pathlib import Path
+import sqlite3
+import threading
+
+from ..config import get_settings, resolve_project_path
+
+STORE_FILENAME = "chunk_embeddings.sqlite3"
+
+# SQLite のバインド変数上限に収まるよう IN 句を分割する
+_LOOKUP_BATCH_SIZE = 500
+
+
+def make_chunk_key(model: str, task_type: str | None, text: str) -> str:
+    # (モデル, taskType, チャンク本文) のハッシュでコンテンツアドレス化
+    digest = hashlib.sha256()
+    for part in (model, task_type or "", text):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ChunkEmbeddingStore:
+    """チャンク本文のハッシュをキーに埋め込みを永続保存するストア
+
+    チャンク設定を変えて再ベクトル化しても、同一本文のチャンクは API を呼ばずに再利用する。
+    """
+
+    def __init__(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_embeddings ("
+            " key TEXT PRIMARY KEY, dimension INTEGER NOT NULL, vector BLOB NOT NULL)"
+        )
+        self._db.commit()
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        # 見つかったキーのみを返す（欠損分は呼び出し側で API 取得）
+        found: dict[str, list[float]] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(unique_keys), _LOOKUP_BATCH_SIZE):
+                batch = unique_keys[start: start + _LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM chunk_embeddings WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, items: dict[str, list[float]]) -> None:
+        if not items:
+            return
+        # ChromaDB と同じ float32 で保存してディスク使用量を抑える
+        rows = [
+            (key, len(vector), array("f", vector).tobytes())
+            for key, vector in items.items()
+        ]
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO chunk_embeddings (key, dimension, vector) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._db.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM chunk_embeddings").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+_store: ChunkEmbeddingStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_chunk_embedding_store() -> ChunkEmbeddingStore | None:
+    # 設定で無効化されている場合は None を返す
+    global _store
+    settings = get_settings()
+    if not settings.chunk_embedding_store_enabled:
+        return None
+
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                persist_directory = resolve_project_path(settings.chroma_persist_directory)
+                _store = ChunkEmbeddingStore(str(persist_directory.parent / STORE_FILENAME))
+    return _store
+
+
+def close_chunk_embedding_store() -> None:
+    global _store
+    with _store_lock:
+        if _store is not None:
+            _store.close()
+        _store = None
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timezone
+import gzip
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+import time
+
+from ..config import get_settings, resolve_project_path
+
+logger = logging.getLogger(__name__)
+
+# 書き込みタスクへ終了を伝える番兵
+_STOP = object()
+
+
+def _json_default(value):
+    # datetime は ISO 8601、それ以外は文字列表現で出力
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class ExperimentLogger:
+    """実験ログ（質問応答・ベクトル化の入力/検索結果/モデル/パラメータ）を JSONL へ書き出すロガー
+
+    log() は上限付きのメモリキューへ積むだけで、整形・書き込み・fsync は
+    バックグラウンドのタスク（ファイル操作は別スレッド）がまとめて行う。
+    キューが満杯の場合は呼び出し元を待たせず、レコードを破棄して件数を数える。
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        queue_size: int = 10000,
+        batch_size: int = 500,
+        fsync_interval: float = 1.0,
+        max_bytes: int = 64 * 1024 * 1024,
+        compress: bool = True,
+    ) -> None:
+        self._path = path
+        self._batch_size = max(1, batch_size)
+        self._fsync_interval = max(0.01, fsync_interval)
+        self._max_bytes = max_bytes
+        self._compress = compress
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+        self._task: asyncio.Task | None = None
+        self._file = None
+        self._size = 0
+        self._dirty = False
+        self._last_sync = 0.0
+        self._closed = False
+        self._written = 0
+        self._dropped = 0
+        self._write_errors = 0
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    async def start(self) -> None:
+        await asyncio.to_thread(self._open)
+        self._task = asyncio.create_task(self._run(), name="experiment-log-writer")
+
+    async def close(self) -> None:
+        # キューに残ったレコードを書き切ってからファイルを閉じる
+        if self._closed:
+            return
+        self._closed = True
+        if self._task is not None:
+            await self._queue.put(_STOP)
+            await self._task
+            self._task = None
+        await asyncio.to_thread(self._close_file)
+
+    def log(self, record: dict) -> bool:
+        # イベントループ上から呼び出す。整形は書き込みタスク側で行う
+        if self._closed:
+            return False
+        try:
+            self._queue.put_nowait(record)
+        except asyncio.QueueFull:
+            if self._dropped == 0:
+                logger.warning("実験ログのキューが満杯のため、レコードを破棄しました。")
+            self._dropped += 1
+            return False
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                record = await asyncio.wait_for(self._queue.get(), timeout=self._fsync_interval)
+            except asyncio.TimeoutError:
+                # 書き込みが途切れたら未同期分をディスクへ反映
+                if self._dirty:
+                    await asyncio.to_thread(self._sync)
+                continue
+
+            batch = [record]
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+
+            stop = any(item is _STOP for item in batch)
+            records = [item for item in batch if item is not _STOP]
+            try:
+                await asyncio.to_thread(self._write, records, stop)
+            except Exception:
+                # 書き込み失敗で質問応答を止めないよう、記録して次のバッチへ進む
+                self._write_errors += len(records)
+                logger.exception("実験ログの書き込みに失敗しました。")
+            if stop:
+                return
+
+    def _open(self) -> None:
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self._path.open("a", encoding="utf-8")
+        self._size = self._path.stat().st_size
+
+    def _write(self, records: list[dict], sync: bool) -> None:
+        if records:
+            if self._max_bytes > 0 and self._size >= self._max_bytes:
+                self._rotate()
+            data = "".join(
+                json.dumps(record, ensure_ascii=False, default=_json_default) + "\n"
+                for record in records
+            )
+            self._file.write(data)
+            self._file.flush()
+            self._size += len(data.encode("utf-8"))
+            self._written += len(records)
+            self._dirty = True
+        if sync or time.monotonic() - self._last_sync >= self._fsync_interval:
+            self._sync()
+
+    def _sync(self) -> None:
+        if self._dirty and self._file is not None:
+            os.fsync(self._file.fileno())
+            self._dirty = False
+        self._last_sync = time.monotonic()
+
+    def _rotate(self) -> None:
+        # 上限サイズに達したファイルを日時付きの名前へ退避し、必要なら gzip 圧縮する
+        self._sync()
+        self._file.close()
+        suffix = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        rotated = self._path.with_name(f"{self._path.stem}-{suffix}{self._path.suffix}")
+        self._path.rename(rotated)
+        if self._compress:
+            with rotated.open("rb") as source, gzip.open(f"{rotated}.gz", "wb") as target:
+                shutil.copyfileobj(source, target)
+            rotated.unlink()
+        self._open()
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+            self._file = None
+
+    def stats(self) -> dict:
+        return {
+            "written": self._written,
+            "dropped": self._dropped,
+            "write_errors": self._write_errors,
+            "queued": self._queue.qsize(),
+            "max_queued": self._queue.maxsize,
+            "file_bytes": self._size,
+        }
+
+
+_logger: ExperimentLogger | None = None
+
+
+async def init_experiment_logger() -> ExperimentLogger | None:
+    # 起動時に書き込みタスクを開始（無効化されている場合は何もしない）
+    global _logger
+    settings = get_settings()
+    if _logger is None and settings.experiment_log_enabled:
+        _logger = ExperimentLogger(
+            resolve_project_path(settings.experiment_log_directory) / settings.experiment_log_filename,
+            queue_size=settings.experiment_log_queue_size,
+            batch_size=settings.experiment_log_batch_size,
+            fsync_interval=settings.experiment_log_fsync_interval,
+            max_bytes=settings.experiment_log_max_bytes,
+            compress=settings.experiment_log_compress,
+        )
+        await _logger.start()
+    return _logger
+
+
+def get_experiment_logger() -> ExperimentLogger | None:
+    return _logger
+
+
+async def close_experiment_logger() -> None:
+    global _logger
+    if _logger is not None:
+        await _logger.close()
+        _logger = None
+
+
+def log_experiment(event: str, **fields) -> None:
+    # ロガー未初期化（無効化・スクリプト実行など）の場合は何もしない
+    if _logger is not None:
+        _logger.log({"event": event, "logged_at": datetime.now(timezone.utc), **fields})
@@ -1,11 +1,14 @@
 from __future__ import annotations
 
-import httpx
+import asyncio
+import json
+from typing import AsyncIterator
 
 from ..config import get_settings
-
-# Gemini API のモデルエンドポイントベースURL
-GEMINI_BASE_ENDPOINT = "https://generativelanguage.googleapis.com/v1beta/models"
+from .deadline import DeadlineExceededError, remaining_budget, stage_timeout
+from .http_client import gemini_model_endpoint, get_http_client
+from .rate_limit import estimate_tokens, get_rate_limiter
+from .telemetry import stage, upstream_call
 
 
 def build_rag_prompt(question: str, context_chunks: list[str]) -> str:
@@ -21,19 +24,9 @@ def build_rag_prompt(question: str, context_chunks: list[str]) -> str:
     )
 
 
-async def generate_answer(
-    question: str,
-    context_chunks: list[str],
-    temperature: float = 0.3,
-    max_tokens: int = 1000,
-) -> str:
-    # 設定とプロンプトを準備
-    settings = get_settings()
-    prompt = build_rag_prompt(question, context_chunks)
-    endpoint = f"{GEMINI_BASE_ENDPOINT}/{settings.generation_model}:generateContent"
-
-    # Gemini generateContent の入力形式
-    payload = {
+def _build_generation_payload(prompt: str, temperature: float, max_tokens: int) -> dict:
+    # Gemini generateContent / streamGenerateContent 共通の入力形式
+    return {
         "contents": [{"parts": [{"text": prompt}]}],
         "generationConfig": {
             "temperature": temperature,
@@ -41,18 +34,67 @@ async def generate_answer(
         },
     }
 
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        # REST API で回答生成
-        response = await client.post(
-            endpoint,
-            headers={
-                "Content-Type": "application/json",
-                "x-goog-api-key": settings.gemini_api_key,
-            },
-            json=payload,
+
+def _extract_texts(data: dict) -> list[str]:
+    # 先頭候補のテキストパートを取り出す
+    candidates = data.get("candidates", [])
+    if not candidates:
+        return []
+    parts = candidates[0].get("content", {}).get("parts", [])
+    return [part.get("text", "") for part in parts if part.get("text")]
+
+
+def build_non_rag_prompt(question: str) -> str:
+    # 比較用: ドキュメントを与えずモデルの知識のみで回答させるプロンプト
+    return (
+        "以下の質問に答えてください。\n\n"
+        "【質問】\n"
+        f"{question}\n\n"
+        "【回答】"
+    )
+
+
+def _extract_usage(data: dict) -> dict:
+    # usageMetadata をトークン数の辞書へ変換（未返却の項目は None）
+    usage = data.get("usageMetadata", {})
+    return {
+        "prompt_tokens": usage.get("promptTokenCount"),
+        "completion_tokens": usage.get("candidatesTokenCount"),
+        "thoughts_tokens": usage.get("thoughtsTokenCount"),
+        "total_tokens": usage.get("totalTokenCount"),
+    }
+
+
+def _estimate_generation_tokens(prompt: str, max_tokens: int) -> int:
+    # TPM 制御用: 入力の概算に出力上限を加えた値を予約する
+    return estimate_tokens(prompt) + max_tokens
+
+
+async def _generate(payload: dict, tokens: int) -> tuple[str, dict]:
+    # generateContent を呼び出し、回答テキストとトークン使用量を返す
+    settings = get_settings()
+    endpoint = gemini_model_endpoint(settings.generation_model, "generateContent")
+
+    # 共有クライアントを借りて REST API で回答生成（共有リミッター経由、429 / 5xx は再試行）
+    client = get_http_client()
+    limiter = get_rate_limiter("generation")
+    with stage("generation"), upstream_call("generate_content"):
+        response = await limiter.call(
+            lambda: client.post(
+                endpoint,
+                headers={
+                    "Content-Type": "application/json",
+                    "x-goog-api-key": settings.gemini_api_key,
+                },
+                json=payload,
+                timeout=stage_timeout(settings.generation_timeout),
+            ),
+            tokens,
         )
         response.raise_for_status()
-        data = response.json()
+    data = response.json()
+    usage = _extract_usage(data)
+    limiter.adjust_tokens(tokens, usage["total_tokens"])
 
     # 候補がない場合は上位でエラーとして扱う
     candidates = data.get("candidates", [])
@@ -60,9 +102,106 @@ async def generate_answer(
         raise RuntimeError("Gemini から回答候補が返されませんでした。")
 
     # 先頭候補のテキストパートを連結して返却
-    parts = candidates[0].get("content", {}).get("parts", [])
-    texts = [part.get("text", "") for part in parts if part.get("text")]
+    texts = _extract_texts(data)
     if not texts:
         raise RuntimeError("Gemini からテキスト回答が取得できませんでした。")
 
-    return "\n".join(texts)
+    return "\n".join(texts), usage
+
+
+async def generate_answer_with_usage(
+    question: str,
+    context_chunks: list[str],
+    temperature: float = 0.3,
+    max_tokens: int = 1000,
+) -> tuple[str, dict]:
+    # 検索チャンクを根拠に回答を生成し、トークン使用量とあわせて返す
+    with stage("prompt_build"):
+        prompt = build_rag_prompt(question, context_chunks)
+        payload = _build_generation_payload(prompt, temperature, max_tokens)
+    return await _generate(payload, _estimate_generation_tokens(prompt, max_tokens))
+
+
+async def generate_answer(
+    question: str,
+    context_chunks: list[str],
+    temperature: float = 0.3,
+    max_tokens: int = 1000,
+) -> str:
+    answer, _ = await generate_answer_with_usage(question, context_chunks, temperature, max_tokens)
+    return answer
+
+
+async def generate_answer_non_rag(
+    question: str,
+    temperature: float = 0.3,
+    max_tokens: int = 1000,
+) -> tuple[str, dict]:
+    # 検索を行わず生成モデルのみで回答する（RAG との比較用）
+    with stage("prompt_build"):
+        prompt = build_non_rag_prompt(question)
+        payload = _build_generation_payload(prompt, temperature, max_tokens)
+    return await _generate(payload, _estimate_generation_tokens(prompt, max_tokens))
+
+
+async def stream_answer(
+    question: str,
+    context_chunks: list[str],
+    temperature: float = 0.3,
+    max_tokens: int = 1000,
+) -> AsyncIterator[str]:
+    # streamGenerateContent（SSE形式）で生成されたテキスト断片を順次返す
+    settings = get_settings()
+    with stage("prompt_build"):
+        prompt = build_rag_prompt(question, context_chunks)
+        payload = _build_generation_payload(prompt, temperature, max_tokens)
+    endpoint = gemini_model_endpoint(settings.generation_model, "streamGenerateContent")
+
+    client = get_http_client()
+    request = client.build_request(
+        "POST",
+        endpoint,
+        params={"alt": "sse"},
+        headers={
+            "Content-Type": "application/json",
+            "x-goog-api-key": settings.gemini_api_key,
+        },
+        json=payload,
+        timeout=stage_timeout(settings.generation_timeout),
+    )
+
+    async def within_deadline(awaitable):
+        # HTTP タイムアウトは受信間隔にしか効かないため、処理期限までの残り時間でも打ち切る
+        budget = remaining_budget()
+        if budget is None:
+            return await awaitable
+        try:
+            return await asyncio.wait_for(awaitable, timeout=budget)
+        except asyncio.TimeoutError as exc:
+            raise DeadlineExceededError("generation") from exc
+
+    # ストリーム全体（最後の断片の受信まで）を生成時間として記録
+    # 再試行はストリーム開始前（レスポンスヘッダーのステータス）でのみ行う
+    with stage("generation"), upstream_call("stream_generate_content"):
+        response = await within_deadline(get_rate_limiter("generation").call(
+            lambda: client.send(request, stream=True),
+            _estimate_generation_tokens(prompt, max_tokens),
+        ))
+        try:
+            response.raise_for_status()
+            lines = response.aiter_lines()
+            while True:
+                try:
+                    line = await within_deadline(anext(lines))
+                except StopAsyncIteration:
+                    break
+                # SSE の data 行のみを解釈（空行・コメント行は読み飛ばす）
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if not data:
+                    continue
+                for text in _extract_texts(json.loads(data)):
+                    yield text
+        finally:
+            await response.aclose()
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import importlib.util
+
+import httpx
+
+from ..config import get_settings
+
+# プロセス全体で共有する Gemini API 用クライアント（アプリ lifespan で生成・破棄）
+_client: httpx.AsyncClient | None = None
+
+
+def gemini_model_endpoint(model: str, method: str) -> str:
+    # モデル単位の Gemini API エンドポイント（例: .../models/{model}:generateContent）
+    base_url = get_settings().gemini_api_base_url.rstrip("/")
+    return f"{base_url}/models/{model}:{method}"
+
+
+def _http2_available() -> bool:
+    # HTTP/2 は h2 パッケージが必要（未導入環境では HTTP/1.1 keep-alive にフォールバック）
+    return importlib.util.find_spec("h2") is not None
+
+
+def _build_client() -> httpx.AsyncClient:
+    settings = get_settings()
+    limits = httpx.Limits(
+        max_connections=settings.http_max_connections,
+        max_keepalive_connections=settings.http_max_keepalive_connections,
+        keepalive_expiry=settings.http_keepalive_expiry,
+    )
+    # 操作ごとのタイムアウトは呼び出し側で上書きする。ここでは接続確立のみ共通化
+    timeout = httpx.Timeout(
+        settings.generation_timeout,
+        connect=settings.http_connect_timeout,
+    )
+    return httpx.AsyncClient(
+        http2=settings.http2_enabled and _http2_available(),
+        limits=limits,
+        timeout=timeout,
+    )
+
+
+async def init_http_client() -> httpx.AsyncClient:
+    # 起動時に一度だけ生成（二重初期化は既存クライアントを返す）
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+async def close_http_client() -> None:
+    # 停止時にコネクションプールを解放
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    # lifespan 外（スクリプト実行など）から呼ばれた場合は遅延生成する
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
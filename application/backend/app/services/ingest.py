@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import asyncio
+from itertools import islice
+import time
+from typing import Callable, Iterator
+
+from ..config import get_settings
+from ..utils.file_handlers import count_chunks, count_file_chars, iter_file_chunks
+from .document_store import get_document_store
+from .embedding import embedding_model_key, get_embeddings
+from .experiment_log import log_experiment
+from .jobs import JobStore
+from .lexical_index import get_lexical_index
+from .telemetry import stage
+from .vectordb import AsyncVectorDBService, get_async_vectordb_service, make_chunk_id
+
+# 1バッチ保存完了ごとに呼ばれるコールバック（保存済みチャンク数の累計, バッチ件数, 埋め込み次元）
+# 進捗の DB 書き込みを想定し、イベントループを止めないよう別スレッドで呼び出す
+BatchCallback = Callable[[int, int, int], None]
+
+
+async def ingest_chunks_pipelined(
+    document_id: str,
+    chunks: Iterator[str],
+    vectordb: AsyncVectorDBService,
+    start_index: int = 0,
+    batch_size: int = 200,
+    depth: int = 2,
+    on_batch_stored: BatchCallback | None = None,
+    existing_ids: set[str] | None = None,
+    extra_metadata: dict | None = None,
+) -> int:
+    """チャンク生成 → 埋め込み → ChromaDB 保存をパイプライン化して実行する
+
+    埋め込みは最大 depth バッチ先行して実行し、保存はチャンク順に1バッチずつ行う。
+    キューが埋まると生成側が待機するため、メモリ使用量はチャンク総数によらず
+    (depth + 1) * batch_size 程度に収まる。失敗時に失われるのは未保存のバッチのみ。
+
+    existing_ids を渡すと、同じ ID（位置と本文が同じ）のチャンクは埋め込み・保存を省略し、
+    処理したチャンクの ID を existing_ids から取り除く。完了後に残った ID が不要になったチャンク。
+    extra_metadata は保存する全チャンクのメタデータへ追加する（分割時の chunk_overlap など）。
+    """
+    queue: asyncio.Queue[
+        tuple[list[int], list[str], asyncio.Task | None, int] | None
+    ] = asyncio.Queue(maxsize=max(1, depth))
+    pending: set[asyncio.Task] = set()
+
+    def next_batch(index: int) -> tuple[list[str], list[str]]:
+        # ファイルの読み込み・デコードとチャンク ID のハッシュ計算はイベントループを止めないよう別スレッドで行う
+        batch = list(islice(chunks, batch_size))
+        return batch, [
+            make_chunk_id(document_id, index + offset, chunk) for offset, chunk in enumerate(batch)]
+
+    async def produce() -> None:
+        # 生成側: バッチを切り出して埋め込みを開始し、完了を待たずにキューへ渡す
+        index = start_index
+        while True:
+            batch, chunk_ids = await asyncio.to_thread(next_batch, index)
+            if not batch:
+                break
+            # 変更のないチャンクを除いた差分のみを埋め込む
+            changed_indexes: list[int] = []
+            changed: list[str] = []
+            for offset, (chunk, chunk_id) in enumerate(zip(batch, chunk_ids)):
+                if existing_ids is not None and chunk_id in existing_ids:
+                    existing_ids.discard(chunk_id)
+                    continue
+                changed_indexes.append(index + offset)
+                changed.append(chunk)
+            task = None
+            if changed:
+                task = asyncio.create_task(get_embeddings(changed, task_type="RETRIEVAL_DOCUMENT"))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            await queue.put((changed_indexes, changed, task, index + len(batch)))
+            index += len(batch)
+        await queue.put(None)
+
+    lexical_index = get_lexical_index()
+    producer = asyncio.create_task(produce())
+    stored = start_index
+    try:
+        # 保存側: 埋め込み完了を順番に待ち、チャンク順を保ったまま保存する
+        while (item := await queue.get()) is not None:
+            indexes, batch, task, end = item
+            embeddings = await task if task is not None else []
+            if batch:
+                chunk_ids = await vectordb.add_document_chunks(
+                    document_id, batch, embeddings, extra_metadata=extra_metadata,
+                    chunk_indexes=indexes)
+                if lexical_index is not None:
+                    # ハイブリッド検索用の転置インデックスも同じチャンクIDで更新
+                    with stage("lexical_index_write"):
+                        await asyncio.to_thread(
+                            lexical_index.add_chunks, document_id, chunk_ids, batch,
+                            chunk_indexes=indexes)
+            batch_count = end - stored
+            stored = end
+            if on_batch_stored is not None:
+                await asyncio.to_thread(
+                    on_batch_stored, stored, batch_count, len(embeddings[0]) if embeddings else 0)
+        await producer
+    finally:
+        # 失敗・キャンセル時は先行中の埋め込みを破棄
+        producer.cancel()
+        for task in list(pending):
+            task.cancel()
+        await asyncio.gather(producer, *pending, return_exceptions=True)
+
+    return stored
+
+
+async def delete_stale_chunks(
+    vectordb: AsyncVectorDBService,
+    chunk_ids: list[str],
+) -> None:
+    # 再ベクトル化で消えたチャンクをベクトルストアと転置インデックスから削除
+    if not chunk_ids:
+        return
+    with stage("stale_chunk_delete"):
+        await vectordb.delete_chunks(chunk_ids)
+        lexical_index = get_lexical_index()
+        if lexical_index is not None:
+            await asyncio.to_thread(lexical_index.delete_chunks, chunk_ids)
+
+
+async def run_vectorization_job(job: dict, job_store: JobStore) -> None:
+    # 1) 抽出 2) 分割 3) 埋め込み 4) ベクトルDB保存 をバッチ単位で進め、進捗を記録する
+    settings = get_settings()
+    document_store = get_document_store()
+    vectordb = get_async_vectordb_service()
+    document_id = job["document_id"]
+
+    entry = document_store.get(document_id)
+    if entry is None:
+        raise ValueError("指定されたドキュメントが見つかりません。")
+
+    document_store.update(document_id, status="processing")
+    started = time.perf_counter()
+    # 実験ログ用の記録（入力ドキュメント・チャンク設定・モデル・結果）
+    record: dict = {
+        "job_id": job["job_id"],
+        "document_id": document_id,
+        "filename": entry.get("filename"),
+        "embedding_model": embedding_model_key(),
+        "parameters": {
+            "chunk_size": job["chunk_size"],
+            "chunk_overlap": job["chunk_overlap"],
+            "batch_size": settings.vectorize_batch_size,
+        },
+    }
+    try:
+        # 本文全体は読み込まず、保存ファイルから遅延生成したチャンクを順に処理
+        with stage("chunk_count"):
+            char_count = entry.get("char_count")
+            if char_count is None:
+                # アップロード時の文字数を持たない旧データのみ、別スレッドで本文を数え直す
+                char_count = await asyncio.to_thread(count_file_chars, entry["stored_path"])
+            total_chunks = count_chunks(char_count, job["chunk_size"], job["chunk_overlap"])
+        job_store.update(
+            job["job_id"],
+            total_chunks=total_chunks,
+            embedding_model=settings.embedding_model,
+        )
+        chunks = iter_file_chunks(
+            entry["stored_path"],
+            entry["file_type"],
+            chunk_size=job["chunk_size"],
+            overlap=job["chunk_overlap"],
+        )
+
+        def record_progress(stored: int, batch_count: int, dimension: int) -> None:
+            # バッチ処理ごとにカウンタと進捗を更新
+            document_store.increment_chunk_count(document_id, batch_count)
+            progress: dict = {"processed_chunks": stored}
+            if dimension:
+                progress["embedding_dimension"] = dimension
+                record["embedding_dimension"] = dimension
+            job_store.update(job["job_id"], **progress)
+
+        # 保存済みチャンクの ID と突き合わせ、変更・追加されたチャンクのみ埋め込んで保存する
+        # （中断したジョブの再開時も保存済みのバッチは ID が一致するため再処理されない）
+        existing_ids = set(await vectordb.get_document_chunk_ids(document_id))
+        record["existing_chunks"] = len(existing_ids)
+        document_store.update(document_id, chunk_count=0)
+        stored = await ingest_chunks_pipelined(
+            document_id,
+            chunks,
+            vectordb,
+            batch_size=max(1, settings.vectorize_batch_size),
+            depth=settings.vectorize_pipeline_depth,
+            on_batch_stored=record_progress,
+            existing_ids=existing_ids,
+            # 文脈構築時に隣接チャンクの重複部分を正確に取り除けるよう、分割時のオーバーラップを保存
+            extra_metadata={"chunk_overlap": job["chunk_overlap"]},
+        )
+
+        # 新しい本文に存在しないチャンクを削除し、チャンク数を確定させる
+        await delete_stale_chunks(vectordb, list(existing_ids))
+
+        # 正常完了時はステータスを processed へ更新
+        document_store.update(document_id, status="processed", chunk_count=stored)
+        log_experiment(
+            "vectorize",
+            **record,
+            status="processed",
+            total_chunks=total_chunks,
+            chunk_count=stored,
+            stale_chunks_deleted=len(existing_ids),
+            latency_ms=(time.perf_counter() - started) * 1000,
+        )
+    except Exception as exc:
+        # 失敗時はステータスを error にして再試行可能にする
+        document_store.update(document_id, status="error")
+        log_experiment(
+            "vectorize",
+            **record,
+            status="error",
+            error=repr(exc),
+            latency_ms=(time.perf_counter() - started) * 1000,
+        )
+        raise
@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timezone
+import logging
+from pathlib import Path
+import sqlite3
+import threading
+from typing import Awaitable, Callable
+from uuid import uuid4
+
+from ..config import get_settings
+from .document_store import DELETING_STATUS, DOCUMENTS_DIR, get_document_store
+from .telemetry import stage
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB_PATH = DOCUMENTS_DIR / "jobs.sqlite3"
+
+# jobs テーブルの列（VectorizationJob モデルと同じキー）
+JOB_COLUMNS = (
+    "job_id",
+    "document_id",
+    "status",
+    "chunk_size",
+    "chunk_overlap",
+    "total_chunks",
+    "processed_chunks",
+    "embedding_model",
+    "embedding_dimension",
+    "error",
+    "created_at",
+    "updated_at",
+)
+
+# 未完了として再起動時に再開するジョブ状態
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class QueueFullError(RuntimeError):
+    """ジョブキューが上限に達している"""
+
+
+class JobConflictError(RuntimeError):
+    """同じドキュメントに、異なるチャンク設定の未完了ジョブがある"""
+
+    def __init__(self, job: dict) -> None:
+        super().__init__(
+            "同じドキュメントに異なるチャンク設定の未完了ジョブがあります"
+            f" (job_id={job['job_id']}, chunk_size={job['chunk_size']},"
+            f" chunk_overlap={job['chunk_overlap']})。完了後に再度登録してください。"
+        )
+        self.job = job
+
+
+class DocumentDeletingError(RuntimeError):
+    """対象ドキュメントが削除処理中"""
+
+    def __init__(self, document_id: str) -> None:
+        super().__init__(f"ドキュメントは削除処理中です (document_id={document_id})。")
+        self.document_id = document_id
+
+
+def _is_deleting(document_id: str) -> bool:
+    entry = get_document_store().get(document_id)
+    return entry is not None and entry["status"] == DELETING_STATUS
+
+
+class JobStore:
+    """ベクトル化ジョブの状態と進捗を保存する SQLite ストア（再起動後の再開に利用）"""
+
+    def __init__(self, db_path: str) -> None:
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                document_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                chunk_size INTEGER NOT NULL,
+                chunk_overlap INTEGER NOT NULL,
+                total_chunks INTEGER NOT NULL DEFAULT 0,
+                processed_chunks INTEGER NOT NULL DEFAULT 0,
+                embedding_model TEXT,
+                embedding_dimension INTEGER,
+                error TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+            CREATE INDEX IF NOT EXISTS idx_jobs_document ON jobs (document_id, status);
+            """
+        )
+        self._db.commit()
+
+    def create(self, document_id: str, chunk_size: int, chunk_overlap: int) -> dict:
+        now = datetime.now(timezone.utc).isoformat()
+        job = {
+            "job_id": str(uuid4()),
+            "document_id": document_id,
+            "status": "queued",
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "total_chunks": 0,
+            "processed_chunks": 0,
+            "embedding_model": None,
+            "embedding_dimension": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        with self._lock, self._db:
+            self._db.execute(
+                f"INSERT INTO jobs ({', '.join(JOB_COLUMNS)})"
+                f" VALUES ({', '.join('?' * len(JOB_COLUMNS))})",
+                tuple(job[column] for column in JOB_COLUMNS),
+            )
+        return job
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def find_active(self, document_id: str) -> dict | None:
+        # 同一ドキュメントで実行待ち・実行中のジョブがあれば返す
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM jobs WHERE document_id = ? AND status IN (?, ?)"
+                " ORDER BY created_at LIMIT 1",
+                (document_id, *ACTIVE_STATUSES),
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def list_active(self) -> list[dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                ACTIVE_STATUSES,
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def update(self, job_id: str, **fields) -> None:
+        unknown = set(fields) - set(JOB_COLUMNS[1:])
+        if unknown:
+            raise ValueError(f"未知の列が指定されました: {sorted(unknown)}")
+        fields["updated_at"] = datetime.now(timezone.utc).isoformat()
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._lock, self._db:
+            self._db.execute(
+                f"UPDATE jobs SET {assignments} WHERE job_id = ?",
+                (*fields.values(), job_id),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+JobRunner = Callable[[dict, JobStore], Awaitable[None]]
+
+
+class VectorizationJobQueue:
+    """ベクトル化ジョブを固定数のワーカーで順次処理するキュー
+
+    ジョブ状態は JobStore に保存し、起動時に未完了ジョブを再投入して途中から再開する。
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        runner: JobRunner,
+        workers: int = 2,
+        max_queued: int = 100,
+    ) -> None:
+        self._store = store
+        self._runner = runner
+        self._workers = max(1, workers)
+        self._max_queued = max(1, max_queued)
+        self._queue: asyncio.Queue[str] = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+        self._running = 0
+
+    @property
+    def store(self) -> JobStore:
+        return self._store
+
+    async def start(self) -> None:
+        # 前回停止時に未完了だったジョブを登録順に再投入
+        for job in self._store.list_active():
+            self._store.update(job["job_id"], status="queued")
+            self._queue.put_nowait(job["job_id"])
+
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"vectorize-worker-{index}")
+            for index in range(self._workers)
+        ]
+
+    async def stop(self) -> None:
+        # 実行中のジョブは中断し、状態は DB に残して次回起動時に再開する
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, document_id: str, chunk_size: int, chunk_overlap: int) -> dict:
+        # 同一ドキュメントの同じ設定の未完了ジョブがあれば新規登録せずに返す
+        # （設定が異なる場合は受け付けたと誤解させないよう競合として拒否する）
+        # 削除処理中のドキュメントは、削除後にチャンクが書き戻されないよう受け付けない
+        if _is_deleting(document_id):
+            raise DocumentDeletingError(document_id)
+        active = self._store.find_active(document_id)
+        if active is not None:
+            if (active["chunk_size"], active["chunk_overlap"]) != (chunk_size, chunk_overlap):
+                raise JobConflictError(active)
+            return active
+
+        if self._queue.qsize() >= self._max_queued:
+            raise QueueFullError("ベクトル化ジョブのキューが上限に達しています。")
+
+        job = self._store.create(document_id, chunk_size, chunk_overlap)
+        self._queue.put_nowait(job["job_id"])
+        return job
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                job = self._store.get(job_id)
+                if job is None or job["status"] not in ACTIVE_STATUSES:
+                    continue
+                if _is_deleting(job["document_id"]):
+                    # 登録後に削除が始まったドキュメントは処理せずに失敗として記録する
+                    self._store.update(
+                        job_id, status="failed", error=str(DocumentDeletingError(job["document_id"])))
+                    continue
+
+                self._running += 1
+                self._store.update(job_id, status="running")
+                try:
+                    with stage("vectorize_job"):
+                        await self._runner(job, self._store)
+                    self._store.update(job_id, status="completed")
+                except asyncio.CancelledError:
+                    raise
+                except Exception as exc:
+                    logger.exception("vectorization job failed: job_id=%s", job_id)
+                    self._store.update(job_id, status="failed", error=str(exc))
+                finally:
+                    self._running -= 1
+            finally:
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self._workers,
+            "running": self._running,
+            "queued": self._queue.qsize(),
+            "max_queued": self._max_queued,
+        }
+
+
+_queue: VectorizationJobQueue | None = None
+
+
+async def init_job_queue(runner: JobRunner) -> VectorizationJobQueue:
+    # 起動時にワーカーを開始し、未完了ジョブを再開する
+    global _queue
+    if _queue is None:
+        settings = get_settings()
+        _queue = VectorizationJobQueue(
+            JobStore(str(JOBS_DB_PATH)),
+            runner,
+            workers=settings.vectorize_workers,
+            max_queued=settings.vectorize_max_queued_jobs,
+        )
+        await _queue.start()
+    return _queue
+
+
+def get_job_queue() -> VectorizationJobQueue:
+    # FastAPI の依存性注入から利用（lifespan で初期化済みであること）
+    if _queue is None:
+        raise RuntimeError("ベクトル化ジョブキューが初期化されていません。")
+    return _queue
+
+
+def peek_job_queue() -> VectorizationJobQueue | None:
+    # メトリクス出力用。lifespan 外（スクリプト実行など）では None を返す
+    return _queue
+
+
+async def close_job_queue() -> None:
+    global _queue
+    if _queue is not None:
+        await _queue.stop()
+        _queue.store.close()
+        _queue = None
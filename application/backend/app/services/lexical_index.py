@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+import sqlite3
+import threading
+import unicodedata
+
+from ..config import get_settings, resolve_project_path
+from .telemetry import stage
+from .vectordb import resolve_chunk_indexes
+
+STORE_FILENAME = "lexical_index.sqlite3"
+
+
+def tokenize_ngrams(text: str, n: int = 2) -> list[str]:
+    """日本語向けの文字 n-gram に分割する
+
+    分かち書きせずに製品コードや専門用語の部分一致を拾えるよう、
+    NFKC 正規化・小文字化したうえで英数字・かな漢字のみからなる n-gram を作る。
+    """
+    normalized = unicodedata.normalize("NFKC", text).lower()
+    grams: list[str] = []
+    run: list[str] = []
+    # 記号・空白で区切った連続区間ごとに n-gram を生成
+    for char in normalized + " ":
+        if char.isalnum():
+            run.append(char)
+            continue
+        if len(run) >= n:
+            grams.extend("".join(run[index: index + n]) for index in range(len(run) - n + 1))
+        elif run:
+            grams.append("".join(run))
+        run = []
+    return grams
+
+
+class LexicalIndex:
+    """チャンク本文の文字 n-gram 転置インデックス（SQLite FTS5 + BM25）
+
+    取り込み時にチャンク単位で追加・削除でき、検索は FTS5 の bm25() で順位付けする。
+    """
+
+    def __init__(self, path: str, ngram: int = 2) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._ngram = ngram
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL UNIQUE,
+                document_id TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                content TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_document ON chunks (document_id);
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunk_terms USING fts5(
+                terms, tokenize = 'unicode61 remove_diacritics 0'
+            );
+            """
+        )
+        self._db.commit()
+
+    def add_chunks(
+        self,
+        document_id: str,
+        chunk_ids: list[str],
+        chunks: list[str],
+        start_index: int = 0,
+        chunk_indexes: list[int] | None = None,
+    ) -> None:
+        indexes = resolve_chunk_indexes(len(chunks), start_index, chunk_indexes)
+        with self._lock, self._db:
+            self._insert_chunks(document_id, chunk_ids, chunks, indexes)
+
+    def _insert_chunks(
+        self,
+        document_id: str,
+        chunk_ids: list[str],
+        chunks: list[str],
+        indexes: list[int],
+    ) -> None:
+        # 呼び出し側でロックとトランザクションを確保すること
+        # 既存 chunk_id は置き換える（再取り込み時に重複させない）
+        self._delete_where("chunk_id IN (SELECT value FROM json_each(?))", (_to_json(chunk_ids),))
+        for chunk_id, index, content in zip(chunk_ids, indexes, chunks):
+            cursor = self._db.execute(
+                "INSERT INTO chunks (chunk_id, document_id, chunk_index, content)"
+                " VALUES (?, ?, ?, ?)",
+                (chunk_id, document_id, index, content),
+            )
+            self._db.execute(
+                "INSERT INTO chunk_terms (rowid, terms) VALUES (?, ?)",
+                (cursor.lastrowid, " ".join(tokenize_ngrams(content, self._ngram))),
+            )
+
+    def delete_document(self, document_id: str) -> int:
+        with self._lock, self._db:
+            return self._delete_where("document_id = ?", (document_id,))
+
+    def delete_chunks(self, chunk_ids: list[str]) -> int:
+        with self._lock, self._db:
+            return self._delete_where(
+                "chunk_id IN (SELECT value FROM json_each(?))", (_to_json(chunk_ids),))
+
+    def _delete_where(self, condition: str, params: tuple) -> int:
+        # 呼び出し側でロックとトランザクションを確保すること
+        self._db.execute(
+            f"DELETE FROM chunk_terms WHERE rowid IN (SELECT id FROM chunks WHERE {condition})",
+            params,
+        )
+        return self._db.execute(f"DELETE FROM chunks WHERE {condition}", params).rowcount
+
+    def search(self, query: str, top_k: int = 5) -> list[dict]:
+        # クエリの n-gram を OR 条件で検索し、BM25 スコア順に返す
+        grams = list(dict.fromkeys(tokenize_ngrams(query, self._ngram)))
+        if not grams:
+            return []
+        # n 文字未満の語は前方一致で拾う
+        expression = " OR ".join(
+            f'"{gram}"' if len(gram) >= self._ngram else f'"{gram}"*' for gram in grams)
+
+        with stage("lexical_search"), self._lock:
+            rows = self._db.execute(
+                "SELECT chunks.chunk_id, chunks.document_id, chunks.chunk_index, chunks.content,"
+                " bm25(chunk_terms) AS rank"
+                " FROM chunk_terms JOIN chunks ON chunks.id = chunk_terms.rowid"
+                " WHERE chunk_terms MATCH ? ORDER BY rank LIMIT ?",
+                (expression, top_k),
+            ).fetchall()
+
+        # bm25() は小さいほど関連が高いため符号を反転してスコアにする
+        return [
+            {
+                "chunk_id": chunk_id,
+                "document_id": document_id,
+                "chunk_index": chunk_index,
+                "content": content,
+                "score": -rank,
+            }
+            for chunk_id, document_id, chunk_index, content, rank in rows
+        ]
+
+    def backfill(self, pages) -> int:
+        # 既存の ChromaDB コレクションから索引を構築（索引導入前のデータ向け）
+        added = 0
+        for ids, documents, metadatas in pages:
+            grouped: dict[str, list[tuple[str, str, int]]] = {}
+            for chunk_id, content, metadata in zip(ids, documents, metadatas):
+                metadata = metadata or {}
+                grouped.setdefault(metadata.get("document_id", ""), []).append(
+                    (chunk_id, content or "", int(metadata.get("chunk_index", 0))))
+            # ページ単位で1トランザクションにまとめて書き込む（チャンクごとに commit しない）
+            with self._lock, self._db:
+                for document_id, rows in grouped.items():
+                    chunk_ids, contents, indexes = (list(column) for column in zip(*rows))
+                    self._insert_chunks(document_id, chunk_ids, contents, indexes)
+                    added += len(rows)
+        return added
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def _to_json(values: list[str]) -> str:
+    # IN 句のバインド変数上限を避けるため json_each で展開する
+    return json.dumps(values)
+
+
+_index: LexicalIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> LexicalIndex | None:
+    # 設定で無効化されている場合は None を返す
+    global _index
+    settings = get_settings()
+    if not settings.lexical_index_enabled:
+        return None
+
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                persist_directory = resolve_project_path(settings.chroma_persist_directory)
+                _index = LexicalIndex(
+                    str(persist_directory.parent / STORE_FILENAME),
+                    ngram=settings.lexical_ngram,
+                )
+    return _index
+
+
+def close_lexical_index() -> None:
+    global _index
+    with _index_lock:
+        if _index is not None:
+            _index.close()
+        _index = None
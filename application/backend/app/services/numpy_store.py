@@ -0,0 +1,368 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+import sqlite3
+import threading
+from typing import Iterator
+
+import numpy as np
+
+from .vectordb import DimensionMismatchError, resolve_chunk_indexes, make_chunk_id
+
+# 走査用に量子化したベクトルと、再スコアリング用の全精度ベクトルを別ファイルに保持
+FULL_FILENAME = "vectors.f32"
+QUANTIZED_FILENAMES = {"int8": "vectors.i8", "float16": "vectors.f16"}
+QUANTIZED_DTYPES = {"int8": np.int8, "float16": np.float16}
+SCALES_FILENAME = "scales.f32"
+META_FILENAME = "meta.json"
+ROWS_FILENAME = "rows.sqlite3"
+
+
+class NumpyVectorStore:
+    """メモリマップした行列を総当たり走査するインプロセスのベクトルストア
+
+    走査は int8（行ごとのスケール付き）または float16 に量子化した行列で
+    ブロック単位の行列積として行い、上位候補のみ全精度（float32）で再スコアリングする。
+    類似度はコサイン類似度（保存時に L2 正規化）。
+    ベクトルファイルは追記のみのため、削除・置き換えたチャンクは行メタ情報から外し、
+    走査時は生存行マスクで除外する。
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        quantization: str = "int8",
+        rescore_multiplier: int = 4,
+        scan_block_rows: int = 65536,
+    ) -> None:
+        if quantization not in QUANTIZED_DTYPES:
+            raise ValueError(f"未対応の量子化方式です: {quantization}")
+
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._quantization = quantization
+        self._rescore_multiplier = max(1, rescore_multiplier)
+        self._scan_block_rows = max(1, scan_block_rows)
+        self._write_lock = threading.Lock()
+        self._db_lock = threading.Lock()
+
+        # 行番号とチャンクのメタ情報（本文含む）を対応付ける
+        self._db = sqlite3.connect(
+            str(self._directory / ROWS_FILENAME), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS rows (
+                row INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL UNIQUE,
+                document_id TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL DEFAULT '{}'
+            );
+            CREATE INDEX IF NOT EXISTS idx_rows_document ON rows (document_id);
+            """
+        )
+        self._db.commit()
+
+        meta_path = self._directory / META_FILENAME
+        meta = json.loads(meta_path.read_text(encoding="utf-8")) if meta_path.exists() else {}
+        if meta.get("quantization", quantization) != quantization:
+            raise ValueError("保存済みデータと量子化方式が一致しません。")
+        self._dimension: int | None = meta.get("dimension")
+        self._count = 0
+        self._live = np.zeros(0, dtype=bool)
+        self._full: np.ndarray | None = None
+        self._quantized: np.ndarray | None = None
+        self._scales: np.ndarray | None = None
+        if self._dimension:
+            # 削除済みの行はメタ情報に残らないため、行数は最大行番号から求める
+            max_row = self._db.execute("SELECT MAX(row) FROM rows").fetchone()[0]
+            self._count = 0 if max_row is None else max_row + 1
+            self._live = np.zeros(self._count, dtype=bool)
+            live_rows = [row for (row,) in self._db.execute("SELECT row FROM rows")]
+            self._live[live_rows] = True
+            self._truncate_files()
+            self._remap()
+
+    def _path(self, filename: str) -> Path:
+        return self._directory / filename
+
+    def _remap(self) -> None:
+        # 追記後に件数分だけメモリマップを張り直す（参照は差し替えのみで読み取り側と競合しない）
+        if not self._dimension or self._count == 0:
+            return
+        shape = (self._count, self._dimension)
+        self._full = np.memmap(self._path(FULL_FILENAME), dtype=np.float32, mode="r", shape=shape)
+        self._quantized = np.memmap(
+            self._path(QUANTIZED_FILENAMES[self._quantization]),
+            dtype=QUANTIZED_DTYPES[self._quantization],
+            mode="r",
+            shape=shape,
+        )
+        if self._quantization == "int8":
+            self._scales = np.memmap(
+                self._path(SCALES_FILENAME), dtype=np.float32, mode="r", shape=(self._count,))
+
+    def get_dimension(self) -> int | None:
+        return self._dimension
+
+    def _truncate_files(self) -> None:
+        # メタ情報の登録に失敗した追記分を切り詰め、行番号とファイル位置を一致させる
+        if not self._dimension:
+            return
+        sizes = {
+            FULL_FILENAME: np.dtype(np.float32).itemsize * self._dimension,
+            QUANTIZED_FILENAMES[self._quantization]:
+                np.dtype(QUANTIZED_DTYPES[self._quantization]).itemsize * self._dimension,
+        }
+        if self._quantization == "int8":
+            sizes[SCALES_FILENAME] = np.dtype(np.float32).itemsize
+        for filename, row_bytes in sizes.items():
+            path = self._path(filename)
+            if path.exists() and path.stat().st_size > self._count * row_bytes:
+                with path.open("r+b") as file:
+                    file.truncate(self._count * row_bytes)
+
+    def warm_up(self) -> None:
+        # メモリマップは生成時に張るため追加処理なし
+        return None
+
+    def _quantize(self, vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray | None]:
+        if self._quantization == "float16":
+            return vectors.astype(np.float16), None
+        # 行ごとの対称量子化（最大絶対値を 127 に割り当てる）
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+
+    def add_document_chunks(
+        self,
+        document_id: str,
+        chunks: list[str],
+        embeddings: list[list[float]],
+        start_index: int = 0,
+        extra_metadata: dict | None = None,
+        chunk_indexes: list[int] | None = None,
+    ) -> list[str]:
+        # チャンクと埋め込みの件数不一致を防止
+        if len(chunks) != len(embeddings):
+            raise ValueError("chunks と embeddings の件数が一致しません。")
+        if not chunks:
+            return []
+
+        indexes = resolve_chunk_indexes(len(chunks), start_index, chunk_indexes)
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with self._write_lock:
+            if self._dimension is None:
+                self._dimension = int(vectors.shape[1])
+                self._path(META_FILENAME).write_text(
+                    json.dumps({"dimension": self._dimension, "quantization": self._quantization}),
+                    encoding="utf-8",
+                )
+            if vectors.shape[1] != self._dimension:
+                raise DimensionMismatchError(self._dimension, int(vectors.shape[1]))
+
+            # コサイン類似度を内積で求められるよう L2 正規化して保存
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            vectors = vectors / norms
+            quantized, scales = self._quantize(vectors)
+
+            chunk_ids = [
+                make_chunk_id(document_id, index, chunk) for index, chunk in zip(indexes, chunks)]
+            metadata = json.dumps(extra_metadata or {}, ensure_ascii=False)
+            rows = [
+                (self._count + offset, chunk_id, document_id, index, chunk, metadata)
+                for offset, (chunk_id, index, chunk) in enumerate(zip(chunk_ids, indexes, chunks))
+            ]
+            try:
+                # ベクトルは追記のみ（行番号 = ファイル内の位置）
+                with self._path(FULL_FILENAME).open("ab") as file:
+                    file.write(vectors.tobytes())
+                with self._path(QUANTIZED_FILENAMES[self._quantization]).open("ab") as file:
+                    file.write(quantized.tobytes())
+                if scales is not None:
+                    with self._path(SCALES_FILENAME).open("ab") as file:
+                        file.write(scales.tobytes())
+                with self._db_lock, self._db:
+                    # 同じ chunk_id の既存行は置き換え（旧行はマスクで除外される）
+                    replaced = self._delete_rows_where(
+                        "chunk_id IN (SELECT value FROM json_each(?))", (json.dumps(chunk_ids),))
+                    self._db.executemany(
+                        "INSERT INTO rows (row, chunk_id, document_id, chunk_index, content, metadata)"
+                        " VALUES (?, ?, ?, ?, ?, ?)",
+                        rows,
+                    )
+            except Exception:
+                self._truncate_files()
+                raise
+            self._live[replaced] = False
+            self._count += len(chunks)
+            self._live = np.concatenate([self._live, np.ones(len(chunks), dtype=bool)])
+            self._remap()
+
+        return chunk_ids
+
+    def _delete_rows_where(self, condition: str, params: tuple) -> list[int]:
+        # 呼び出し側で _db_lock とトランザクションを確保すること
+        rows = [
+            row for (row,) in self._db.execute(f"SELECT row FROM rows WHERE {condition}", params)]
+        self._db.execute(f"DELETE FROM rows WHERE {condition}", params)
+        return rows
+
+    def _delete(self, condition: str, params: tuple) -> None:
+        with self._write_lock:
+            with self._db_lock, self._db:
+                rows = self._delete_rows_where(condition, params)
+            self._live[rows] = False
+
+    def get_document_chunk_ids(self, document_id: str) -> list[str]:
+        with self._db_lock:
+            return [
+                chunk_id for (chunk_id,) in self._db.execute(
+                    "SELECT chunk_id FROM rows WHERE document_id = ?", (document_id,))
+            ]
+
+    def get_chunk_embeddings(self, chunk_ids: list[str]) -> dict[str, list[float]]:
+        # 全精度（L2 正規化済み）のベクトルを chunk_id で取得する
+        if not chunk_ids:
+            return {}
+        full = self._full
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT chunk_id, row FROM rows WHERE chunk_id IN (SELECT value FROM json_each(?))",
+                (json.dumps(list(chunk_ids)),),
+            ).fetchall()
+        if full is None:
+            return {}
+        return {chunk_id: full[row].tolist() for chunk_id, row in rows if row < len(full)}
+
+    def delete_chunks(self, chunk_ids: list[str]) -> None:
+        if chunk_ids:
+            self._delete("chunk_id IN (SELECT value FROM json_each(?))", (json.dumps(chunk_ids),))
+
+    def delete_document(self, document_id: str) -> None:
+        self._delete("document_id = ?", (document_id,))
+
+    def query_similar_chunks(
+        self,
+        query_embedding: list[float],
+        top_k: int = 5,
+        search_ef: int | None = None,
+    ) -> list[dict]:
+        return self.query_similar_chunks_batch([query_embedding], top_k, search_ef)[0]
+
+    def query_similar_chunks_batch(
+        self,
+        query_embeddings: list[list[float]],
+        top_k: int = 5,
+        search_ef: int | None = None,
+    ) -> list[list[dict]]:
+        # search_ef は HNSW 用のため無視（本バックエンドは総当たり走査）
+        # 複数の質問は行列としてまとめ、量子化行列の走査を1回で済ませる
+        if not query_embeddings:
+            return []
+        # 読み取り開始時点のスナップショットで走査（並行する追記の影響を受けない）
+        count, full, quantized, scales = self._count, self._full, self._quantized, self._scales
+        live = self._live[:count]
+        if count == 0 or full is None or quantized is None:
+            return [[] for _ in query_embeddings]
+
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.shape[1] != self._dimension:
+            raise DimensionMismatchError(self._dimension, int(queries.shape[1]))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        queries = queries / norms
+
+        # 1) 量子化行列をブロック単位の行列積で走査し、質問ごとに候補を top_k × 倍率件に絞る
+        candidates = min(count, top_k * self._rescore_multiplier)
+        best_rows = [np.empty(0, dtype=np.int64) for _ in queries]
+        best_scores = [np.empty(0, dtype=np.float32) for _ in queries]
+        for start in range(0, count, self._scan_block_rows):
+            block = quantized[start: start + self._scan_block_rows]
+            scores = block.astype(np.float32) @ queries.T
+            if scales is not None:
+                scores *= scales[start: start + len(block), None]
+            # 削除・置き換え済みの行は候補から外す
+            scores[~live[start: start + len(block)]] = -np.inf
+            rows = np.arange(start, start + len(block))
+            for position in range(len(queries)):
+                merged_rows = np.concatenate([best_rows[position], rows])
+                merged_scores = np.concatenate([best_scores[position], scores[:, position]])
+                if len(merged_scores) > candidates:
+                    keep = np.argpartition(-merged_scores, candidates - 1)[:candidates]
+                    merged_rows, merged_scores = merged_rows[keep], merged_scores[keep]
+                best_rows[position], best_scores[position] = merged_rows, merged_scores
+
+        # 2) 候補のみ全精度ベクトルで再スコアリング
+        selections: list[list[tuple[int, float]]] = []
+        for position, query in enumerate(queries):
+            candidate_rows = np.sort(best_rows[position])
+            exact = full[candidate_rows] @ query
+            exact[~live[candidate_rows]] = -np.inf
+            order = np.argsort(-exact)[:top_k]
+            selections.append([
+                (int(candidate_rows[index]), float(exact[index]))
+                for index in order
+                if np.isfinite(exact[index])
+            ])
+
+        selected_rows = sorted({row for selected in selections for row, _ in selected})
+        with self._db_lock:
+            records = {
+                row: (chunk_id, document_id, chunk_index, content, metadata)
+                for row, chunk_id, document_id, chunk_index, content, metadata in self._db.execute(
+                    "SELECT row, chunk_id, document_id, chunk_index, content, metadata FROM rows"
+                    " WHERE row IN (SELECT value FROM json_each(?))",
+                    (json.dumps(selected_rows),),
+                )
+            }
+
+        return [
+            [
+                {
+                    "chunk_id": records[row][0],
+                    "document_id": records[row][1],
+                    "chunk_index": records[row][2],
+                    "content": records[row][3],
+                    "chunk_overlap": json.loads(records[row][4] or "{}").get("chunk_overlap"),
+                    "score": score,
+                }
+                for row, score in selected
+                if row in records
+            ]
+            for selected in selections
+        ]
+
+    def list_documents(self) -> list[dict]:
+        # document_id ごとのチャンク数を集計
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT document_id, COUNT(*) FROM rows GROUP BY document_id").fetchall()
+        return [{"document_id": document_id, "chunk_count": count} for document_id, count in rows]
+
+    def iter_chunk_pages(self, page_size: int = 1000) -> Iterator[tuple[list[str], list[str], list[dict]]]:
+        # 行番号順にページ単位で走査（索引の再構築用）
+        last_row = -1
+        while True:
+            with self._db_lock:
+                rows = self._db.execute(
+                    "SELECT row, chunk_id, document_id, chunk_index, content, metadata FROM rows"
+                    " WHERE row > ? ORDER BY row LIMIT ?",
+                    (last_row, page_size),
+                ).fetchall()
+            if not rows:
+                return
+            last_row = rows[-1][0]
+            yield (
+                [row[1] for row in rows],
+                [row[4] for row in rows],
+                [
+                    {**json.loads(row[5]), "document_id": row[2], "chunk_index": row[3]}
+                    for row in rows
+                ],
+            )
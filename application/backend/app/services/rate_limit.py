@@ -0,0 +1,315 @@
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import logging
+import random
+import time
+from typing import Awaitable, Callable
+
+import httpx
+
+from ..config import get_settings
+from .deadline import remaining_budget
+from .telemetry import UPSTREAM_RETRIES, record_stage
+
+logger = logging.getLogger(__name__)
+
+# 再試行対象のステータス（429: クォータ超過、5xx: 一時的な障害）
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+def estimate_tokens(text: str) -> int:
+    # TPM 制御用のトークン数概算（英語は約4文字、日本語は約1.3文字で1トークン）
+    return len(text.encode("utf-8")) // 4 + 1
+
+
+class TokenBucket:
+    """1分あたりの上限を一定速度で補充するトークンバケット（上限 0 以下で無制限）"""
+
+    def __init__(self, per_minute: float) -> None:
+        self._rate = per_minute / 60.0
+        self._capacity = float(per_minute)
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        # 待機は到着順に処理する
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._rate > 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        if not self.enabled:
+            return
+        # バケット容量を超える要求は容量分で打ち切る（永久に待たないように）
+        amount = min(amount, self._capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                await asyncio.sleep((amount - self._tokens) / self._rate)
+
+    def adjust(self, amount: float) -> None:
+        # 概算との差分を精算する（負の値で返却、残量はマイナスも許容して後続を待たせる）
+        if self.enabled:
+            self._refill()
+            self._tokens = min(self._capacity, self._tokens - amount)
+
+    def available(self) -> float | None:
+        # 無制限の場合は None
+        if not self.enabled:
+            return None
+        self._refill()
+        return self._tokens
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD で同時実行数の上限を調整するリミッター
+
+    成功ごとに上限を 1/上限 ずつ増やし（上限分の成功で +1）、スロットリング時は半減させる。
+    同じ混雑で同時に返った複数の 429 で何度も半減しないよう、直前の縮小より後に開始した要求のみ反映する。
+    """
+
+    def __init__(self, maximum: int, minimum: int = 1, decrease_factor: float = 0.5) -> None:
+        self._maximum = max(1, maximum)
+        self._minimum = max(1, min(minimum, self._maximum))
+        self._decrease_factor = decrease_factor
+        self._limit = float(self._maximum)
+        self._in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+
+    @property
+    def limit(self) -> int:
+        return max(self._minimum, int(self._limit))
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    async def acquire(self) -> float:
+        # 取得できた時刻を返す（on_throttle で縮小の要否判定に使う）
+        if self._in_flight < self.limit and not self._waiters:
+            self._in_flight += 1
+            return time.monotonic()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # 割り当て直後に取り消された場合はスロットを返す
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+        return time.monotonic()
+
+    def release(self) -> None:
+        self._in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self._in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._in_flight += 1
+                waiter.set_result(None)
+
+    def on_success(self) -> None:
+        if self._limit < self._maximum:
+            self._limit = min(self._maximum, self._limit + 1.0 / self._limit)
+            self._wake()
+
+    def on_throttle(self, started: float) -> None:
+        if started < self._last_decrease:
+            return
+        self._limit = max(self._minimum, self._limit * self._decrease_factor)
+        self._last_decrease = time.monotonic()
+        logger.info("Gemini API のスロットリングにより同時実行数を %d に縮小しました。", self.limit)
+
+
+def parse_retry_after(response: httpx.Response) -> float | None:
+    # Retry-After ヘッダー（秒 / HTTP 日付）、なければ Gemini のエラー本文の RetryInfo.retryDelay を参照
+    header = response.headers.get("retry-after")
+    if header:
+        try:
+            return max(0.0, float(header))
+        except ValueError:
+            try:
+                retry_at = parsedate_to_datetime(header)
+            except (TypeError, ValueError):
+                return None
+            return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+    try:
+        details = response.json().get("error", {}).get("details", [])
+    except (ValueError, AttributeError):
+        return None
+    for detail in details if isinstance(details, list) else []:
+        delay = detail.get("retryDelay") if isinstance(detail, dict) else None
+        if isinstance(delay, str) and delay.endswith("s"):
+            try:
+                return max(0.0, float(delay[:-1]))
+            except ValueError:
+                continue
+    return None
+
+
+class GeminiRateLimiter:
+    """Gemini API 呼び出しの共有リミッター（RPM / TPM のトークンバケット + AIMD 同時実行数 + 再試行）
+
+    埋め込み・生成でクォータが別のため、モデル用途ごとに1インスタンスを共有する。
+    429 / 5xx / 通信エラーはジッター付き指数バックオフで再試行し、Retry-After が返された場合は
+    その時刻まで同じリミッターを使う全リクエストの送信を止める。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        max_concurrency: int = 16,
+        max_retries: int = 5,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+    ) -> None:
+        self.name = name
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._concurrency = AdaptiveConcurrencyLimiter(max_concurrency)
+        self._max_retries = max(0, max_retries)
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._blocked_until = 0.0
+        self.retries = 0
+        self.throttled = 0
+
+    def _backoff(self, attempt: int) -> float:
+        # フルジッター: 0〜min(上限, 基準 × 2^試行回数) の一様乱数
+        return random.uniform(0, min(self._max_delay, self._base_delay * (2 ** attempt)))
+
+    def _should_retry(self, attempt: int, delay: float) -> bool:
+        # 再試行回数の上限に達した場合と、待機すると処理期限を過ぎる場合は諦める
+        if attempt >= self._max_retries:
+            return False
+        remaining = remaining_budget()
+        return remaining is None or delay < remaining
+
+    async def _acquire(self, tokens: int) -> float:
+        waited = time.perf_counter()
+        blocked = self._blocked_until - time.monotonic()
+        if blocked > 0:
+            await asyncio.sleep(blocked)
+        await self._requests.acquire(1)
+        await self._tokens.acquire(tokens)
+        started = await self._concurrency.acquire()
+        record_stage(f"{self.name}_rate_limit_wait", time.perf_counter() - waited)
+        return started
+
+    async def call(
+        self,
+        send: Callable[[], Awaitable[httpx.Response]],
+        tokens: int = 1,
+    ) -> httpx.Response:
+        """send() を制限付きで実行し、一時的なエラーは再試行して最終的なレスポンスを返す
+
+        再試行し尽くした 429 / 5xx はそのまま返す（ステータスの判定は呼び出し側で行う）。
+        ストリーミング応答の場合、同時実行数のスロットはレスポンスヘッダー受信までで解放する。
+        """
+        attempt = 0
+        while True:
+            started = await self._acquire(tokens)
+            try:
+                response = await send()
+            except httpx.TransportError as exc:
+                delay = self._backoff(attempt)
+                if not self._should_retry(attempt, delay):
+                    raise
+                reason = type(exc).__name__
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    self._concurrency.on_success()
+                    return response
+                # ストリーミング応答でもエラー本文（RetryInfo）を参照できるよう読み込む
+                await response.aread()
+                if response.status_code == 429:
+                    self.throttled += 1
+                    self._concurrency.on_throttle(started)
+
+                reason = str(response.status_code)
+                delay = self._backoff(attempt)
+                retry_after = parse_retry_after(response)
+                if retry_after is not None:
+                    # 指定時刻までは他のリクエストも送らない
+                    delay = max(delay, min(retry_after, self._max_delay))
+                    self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+                if not self._should_retry(attempt, delay):
+                    return response
+                await response.aclose()
+            finally:
+                self._concurrency.release()
+
+            attempt += 1
+            self.retries += 1
+            UPSTREAM_RETRIES.inc(limiter=self.name, reason=reason)
+            logger.warning(
+                "Gemini API 呼び出しを再試行します (%s, reason=%s, attempt=%d, delay=%.2fs)",
+                self.name, reason, attempt, delay,
+            )
+            await asyncio.sleep(delay)
+
+    def adjust_tokens(self, estimated: int, actual: int | None) -> None:
+        # 実際の使用量（usageMetadata）が分かれば TPM の概算を補正する
+        if actual is not None:
+            self._tokens.adjust(actual - estimated)
+
+    def stats(self) -> dict:
+        return {
+            "concurrency_limit": self._concurrency.limit,
+            "in_flight": self._concurrency.in_flight,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "request_tokens_available": self._requests.available(),
+            "tpm_tokens_available": self._tokens.available(),
+        }
+
+
+_limiters: dict[str, GeminiRateLimiter] = {}
+
+
+def get_rate_limiter(name: str) -> GeminiRateLimiter:
+    # name は "embedding" / "generation"（同じ用途の呼び出し元で1つのリミッターを共有）
+    limiter = _limiters.get(name)
+    if limiter is None:
+        settings = get_settings()
+        limiter = _limiters[name] = GeminiRateLimiter(
+            name,
+            requests_per_minute=getattr(settings, f"{name}_rpm_limit"),
+            tokens_per_minute=getattr(settings, f"{name}_tpm_limit"),
+            max_concurrency=getattr(settings, f"{name}_concurrency_limit"),
+            max_retries=settings.gemini_max_retries,
+            base_delay=settings.gemini_retry_base_delay,
+            max_delay=settings.gemini_retry_max_delay,
+        )
+    return limiter
+
+
+def get_rate_limiters() -> dict[str, GeminiRateLimiter]:
+    return dict(_limiters)
+
+
+def reset_rate_limiters() -> None:
+    # asyncio の待機オブジェクトはイベントループに紐づくため、アプリ停止時に破棄する
+    _limiters.clear()
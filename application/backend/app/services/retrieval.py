@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+
+def reciprocal_rank_fusion(rankings: list[list[dict]], k: int = 60) -> list[dict]:
+    """複数の検索結果を Reciprocal Rank Fusion で統合する
+
+    各結果リストでの順位 r に対して 1 / (k + r) を合算し、chunk_id ごとに並べ替える。
+    スコアは全リストで1位だった場合を 1.0 とする 0.0〜1.0 に正規化して score に格納する。
+    """
+    if not rankings:
+        return []
+
+    fused: dict[str, dict] = {}
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            chunk_id = item["chunk_id"]
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+            # 先に現れた結果（ベクトル検索側）の内容を優先して保持
+            fused.setdefault(chunk_id, dict(item))
+
+    max_score = len(rankings) / (k + 1)
+    ordered = sorted(scores, key=lambda chunk_id: scores[chunk_id], reverse=True)
+    return [
+        {**fused[chunk_id], "score": scores[chunk_id] / max_score}
+        for chunk_id in ordered
+    ]
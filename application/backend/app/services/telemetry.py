@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+import math
+import threading
+import time
+from typing import Callable, Iterator
+
+# ステージ処理時間のバケット（秒）。キャッシュヒットの数百µsから生成の数十秒までを想定
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+LabelValues = tuple[str, ...]
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class _ValueMetric(_Metric):
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        collect: Callable[[], dict[LabelValues, float]] | None = None,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[LabelValues, float] = {}
+        # collect を渡すと、値を保持せず出力時に呼び出して取得する
+        self._collect = collect
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        if self._collect is not None:
+            values = list(self._collect().items())
+        else:
+            with self._lock:
+                values = list(self._values.items())
+        return super().render() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in values
+        ]
+
+
+class Counter(_ValueMetric):
+    kind = "counter"
+
+
+class Gauge(_ValueMetric):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._buckets = tuple(sorted(buckets))
+        # ラベルごとに [各バケットの件数..., +Inf の件数], 合計値
+        self._series: dict[LabelValues, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        # 観測値が入る最小のバケットのみ加算し、累積は出力時に計算する
+        key = self._key(labels)
+        index = bisect_left(self._buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self._buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def render(self) -> list[str]:
+        with self._lock:
+            snapshot = [(key, list(counts), total[0]) for key, (counts, total) in self._series.items()]
+        lines = super().render()
+        for key, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip((*self._buckets, math.inf), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        # Prometheus テキスト形式 (version 0.0.4)
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: list[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "rag_stage_duration_seconds",
+    "Duration of processing stages (embedding, vector search, generation, ...).",
+    ("stage",),
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "rag_http_request_duration_seconds",
+    "HTTP request duration by route template.",
+    ("method", "route", "status"),
+))
+UPSTREAM_IN_FLIGHT = REGISTRY.register(Gauge(
+    "rag_upstream_requests_in_flight",
+    "Gemini API requests currently in flight.",
+    ("operation",),
+))
+UPSTREAM_REQUESTS = REGISTRY.register(Counter(
+    "rag_upstream_requests_total",
+    "Gemini API requests by operation and outcome.",
+    ("operation", "outcome"),
+))
+UPSTREAM_RETRIES = REGISTRY.register(Counter(
+    "rag_upstream_retries_total",
+    "Gemini API retries by limiter and reason (status code or transport error).",
+    ("limiter", "reason"),
+))
+EMBEDDING_HEDGES = REGISTRY.register(Counter(
+    "rag_embedding_hedges_total",
+    "Hedged query embedding requests (sent = duplicate issued, won = duplicate answered first).",
+    ("result",),
+))
+CHUNK_EMBEDDING_LOOKUPS = REGISTRY.register(Counter(
+    "rag_chunk_embedding_store_lookups_total",
+    "Chunk embedding store lookups during vectorization (hit = API call skipped).",
+    ("result",),
+))
+
+# リクエスト単位のステージ処理時間（Server-Timing ヘッダー用）。None の間は記録しない
+_request_timings: ContextVar[dict[str, float] | None] = ContextVar("request_timings", default=None)
+
+
+def begin_request_timings() -> dict[str, float]:
+    # リクエスト開始時に呼び出し、同じコンテキストで実行されるステージの時間を集計する
+    timings: dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def record_stage(name: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, stage=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        # 同じステージが複数回実行された場合は合計する
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """ブロックの処理時間をステージとして記録する（同期・非同期のどちらからでも使用可）"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+@contextmanager
+def upstream_call(operation: str) -> Iterator[None]:
+    # Gemini API 呼び出しの実行中件数と結果を記録する
+    UPSTREAM_IN_FLIGHT.inc(operation=operation)
+    outcome = "error"
+    try:
+        yield
+        outcome = "success"
+    finally:
+        UPSTREAM_IN_FLIGHT.dec(operation=operation)
+        UPSTREAM_REQUESTS.inc(operation=operation, outcome=outcome)
+
+
+def format_server_timing(timings: dict[str, float]) -> str:
+    # Server-Timing ヘッダー値（dur はミリ秒）
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+
+class ServerTimingMiddleware:
+    """リクエストごとのステージ処理時間を Server-Timing ヘッダーで返す ASGI ミドルウェア
+
+    レスポンスヘッダー送信時点までに完了したステージのみ含まれる（ストリーミングの生成時間は含まない）。
+    ルートテンプレート単位のリクエスト処理時間もヒストグラムへ記録する。
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        timings = begin_request_timings()
+        status_code = 500
+
+        async def send_with_timing(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                value = format_server_timing({**timings, "total": time.perf_counter() - started})
+                message = {
+                    **message,
+                    "headers": [*message.get("headers", []), (b"server-timing", value.encode("latin-1"))],
+                }
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            # パスパラメータを含まないルートテンプレートでラベル付けする
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=route,
+                status=str(status_code),
+            )
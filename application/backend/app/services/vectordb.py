@@ -1,9 +1,15 @@
 from __future__ import annotations
 
+import asyncio
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import logging
 from pathlib import Path
 import sys
-from uuid import uuid4
+import threading
+import time
+from typing import Any, Callable, Iterator, Protocol, TypeVar
 
 import sqlite3
 
@@ -18,16 +24,114 @@ if sqlite3.sqlite_version_info < (3, 35, 0):
 
 import chromadb
 
-from ..config import get_settings
+from ..config import get_settings, resolve_project_path
+from .telemetry import record_stage
 
 COLLECTION_NAME = "rag_documents"
 
+logger = logging.getLogger(__name__)
+
+_T = TypeVar("_T")
+
+# コレクションのメタデータに記録する埋め込み次元のキー
+DIMENSION_METADATA_KEY = "embedding_dimension"
+
+
+class DimensionMismatchError(ValueError):
+    """保存済みベクトルと埋め込み次元が一致しない"""
+
+    def __init__(self, expected: int, actual: int) -> None:
+        super().__init__(
+            f"埋め込み次元が一致しません: expected={expected}, got={actual}。"
+            "EMBEDDING_OUTPUT_DIMENSIONALITY を変更した場合は再ベクトル化が必要です。"
+        )
+        self.expected = expected
+        self.actual = actual
+
+
+# iter_chunk_pages が返す1ページ分（ids, documents, metadatas）
+ChunkPage = tuple[list[str], list[str], list[dict]]
+
+
+def make_chunk_id(document_id: str, chunk_index: int, content: str) -> str:
+    # (document_id, chunk_index, 本文ハッシュ) から決定的に ID を作る
+    # 再ベクトル化時に同じ位置・同じ本文のチャンクは同じ ID になり、差分だけを更新できる
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+    return f"{document_id}:{chunk_index}:{digest}"
+
+
+def resolve_chunk_indexes(
+    count: int, start_index: int, chunk_indexes: list[int] | None,
+) -> list[int]:
+    if chunk_indexes is None:
+        return list(range(start_index, start_index + count))
+    if len(chunk_indexes) != count:
+        raise ValueError("chunks と chunk_indexes の件数が一致しません。")
+    return list(chunk_indexes)
+
+
+class VectorStore(Protocol):
+    """ベクトルストアのバックエンド共通インターフェース（Settings.vector_backend で切替）"""
+
+    def warm_up(self) -> None: ...
+
+    def get_dimension(self) -> int | None: ...
+
+    def query_similar_chunks(
+        self,
+        query_embedding: list[float],
+        top_k: int = 5,
+        search_ef: int | None = None,
+    ) -> list[dict]: ...
+
+    def query_similar_chunks_batch(
+        self,
+        query_embeddings: list[list[float]],
+        top_k: int = 5,
+        search_ef: int | None = None,
+    ) -> list[list[dict]]: ...
+
+    def add_document_chunks(
+        self,
+        document_id: str,
+        chunks: list[str],
+        embeddings: list[list[float]],
+        start_index: int = 0,
+        extra_metadata: dict | None = None,
+        chunk_indexes: list[int] | None = None,
+    ) -> list[str]: ...
+
+    def get_document_chunk_ids(self, document_id: str) -> list[str]: ...
+
+    def get_chunk_embeddings(self, chunk_ids: list[str]) -> dict[str, list[float]]: ...
+
+    def delete_chunks(self, chunk_ids: list[str]) -> None: ...
+
+    def delete_document(self, document_id: str) -> None: ...
+
+    def list_documents(self) -> list[dict]: ...
+
+    def iter_chunk_pages(self, page_size: int = 1000) -> Iterator[ChunkPage]: ...
+
+
+def distance_to_similarity(distance: float, space: str) -> float:
+    # ChromaDB の距離を類似度（大きいほど類似）へ変換
+    if space == "l2":
+        # 正規化済みベクトルでは二乗L2距離 d = 2 - 2cos のため cos = 1 - d/2
+        return 1.0 - distance / 2.0
+    # cosine: d = 1 - cos / ip: d = 1 - dot
+    return 1.0 - distance
+
 
 class VectorDBService:
     def __init__(
         self,
         persist_directory: str,
         collection_name: str = COLLECTION_NAME,
+        space: str = "cosine",
+        hnsw_m: int = 16,
+        hnsw_construction_ef: int = 100,
+        hnsw_search_ef: int = 100,
     ) -> None:
         # 永続化ディレクトリを事前作成
         Path(persist_directory).mkdir(parents=True, exist_ok=True)
@@ -36,49 +140,177 @@ class VectorDBService:
         self._client = chromadb.PersistentClient(path=persist_directory)
         self._collection_name = collection_name
 
+        # 新規作成時の距離空間と HNSW パラメータ（既存コレクションの space / M は変更不可）
+        self._configuration = {
+            "hnsw": {
+                "space": space,
+                "max_neighbors": hnsw_m,
+                "ef_construction": hnsw_construction_ef,
+                "ef_search": hnsw_search_ef,
+            }
+        }
+        self._search_ef = hnsw_search_ef
+
+        # 解決済みコレクションをキャッシュし、リクエストごとの再取得を避ける
+        self._collection = None
+        self._collection_lock = threading.Lock()
+
     def get_collection(self):
-        # コレクションが無ければ作成して返す
-        return self._client.get_or_create_collection(name=self._collection_name)
+        # コレクションが無ければ作成して返す（2回目以降はキャッシュを返却）
+        collection = self._collection
+        if collection is not None:
+            return collection
+
+        with self._collection_lock:
+            if self._collection is None:
+                self._collection = self._client.get_or_create_collection(
+                    name=self._collection_name,
+                    configuration=self._configuration,
+                )
+            return self._collection
+
+    def _hnsw_configuration(self) -> dict:
+        configuration = self.get_collection().configuration or {}
+        return configuration.get("hnsw") or {}
 
-    def query_similar_chunks(self, query_embedding: list[float], top_k: int = 5) -> list[dict]:
+    @property
+    def space(self) -> str:
+        # 実際のコレクションの距離空間（旧バージョンで作成したものは l2 の場合がある）
+        return self._hnsw_configuration().get("space") or "l2"
+
+    def warm_up(self) -> None:
+        # 起動時にコレクションを解決してキャッシュし、search_ef を設定値へ揃える
+        hnsw = self._hnsw_configuration()
+        expected_space = self._configuration["hnsw"]["space"]
+        if hnsw.get("space") != expected_space:
+            logger.warning(
+                "collection %s uses distance space %s (configured: %s);"
+                " re-create the collection to change it",
+                self._collection_name, hnsw.get("space"), expected_space,
+            )
+        if hnsw.get("ef_search") != self._search_ef:
+            self.get_collection().modify(configuration={"hnsw": {"ef_search": self._search_ef}})
+
+    def get_dimension(self) -> int | None:
+        # コレクション作成後、最初の保存時に記録した埋め込み次元
+        metadata = self.get_collection().metadata or {}
+        dimension = metadata.get(DIMENSION_METADATA_KEY)
+        return int(dimension) if dimension else None
+
+    def _check_dimension(self, dimension: int, record: bool = False) -> None:
+        # 次元不一致のベクトルは ChromaDB に渡す前に拒否する
+        expected = self.get_dimension()
+        if expected is None:
+            if record:
+                collection = self.get_collection()
+                collection.modify(
+                    metadata={**(collection.metadata or {}), DIMENSION_METADATA_KEY: dimension})
+            return
+        if expected != dimension:
+            raise DimensionMismatchError(expected, dimension)
+
+    def invalidate_collection(self) -> None:
+        # コレクション削除・再作成時に明示的にキャッシュを破棄する
+        with self._collection_lock:
+            self._collection = None
+
+    def query_similar_chunks(
+        self,
+        query_embedding: list[float],
+        top_k: int = 5,
+        search_ef: int | None = None,
+    ) -> list[dict]:
         # ベクトル近傍検索を実行
+        return self.query_similar_chunks_batch([query_embedding], top_k, search_ef)[0]
+
+    def query_similar_chunks_batch(
+        self,
+        query_embeddings: list[list[float]],
+        top_k: int = 5,
+        search_ef: int | None = None,
+    ) -> list[list[dict]]:
+        # 複数の質問ベクトルを1回の collection.query でまとめて検索（入力順で返却）
+        if not query_embeddings:
+            return []
+        for query_embedding in query_embeddings:
+            self._check_dimension(len(query_embedding))
         collection = self.get_collection()
+        space = self.space
+
+        # ChromaDB は読み込み済みインデックスの ef_search を変更できないため、
+        # hnswlib が実効探索幅を max(ef_search, n_results) とする性質を利用して
+        # 候補数を search_ef まで広げて検索し、上位 top_k に切り詰める
+        # （search_ef が設定値以下なら探索幅は変わらない。広げる方向にのみ効く）
+        n_results = max(top_k, search_ef or 0)
+        widened = n_results > top_k
+        # 広げた候補は ID と距離のみを受け取り、本文・メタデータは上位 top_k 件分だけ読み込む
         results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k,
-            include=["documents", "metadatas", "distances"],
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            include=["distances"] if widened else ["documents", "metadatas", "distances"],
         )
 
         if not results.get("ids"):
-            return []
+            return [[] for _ in query_embeddings]
 
-        items: list[dict] = []
-        ids = results["ids"][0]
-        documents = results.get("documents", [[]])[0]
-        metadatas = results.get("metadatas", [[]])[0]
-        distances = results.get("distances", [[]])[0]
-
-        for index, chunk_id in enumerate(ids):
-            metadata = metadatas[index] if index < len(metadatas) else {}
-            distance = distances[index] if index < len(distances) else None
-            # Chromaのdistanceから簡易スコアへ変換（大きいほど類似）
-            score = 1.0 - distance if distance is not None else 0.0
-            items.append(
-                {
-                    "chunk_id": chunk_id,
-                    "document_id": metadata.get("document_id") if metadata else None,
-                    "content": documents[index] if index < len(documents) else "",
-                    "score": score,
-                }
+        top_ids = [ids[:top_k] for ids in results["ids"]]
+        if widened:
+            unique_ids = list(dict.fromkeys(chunk_id for ids in top_ids for chunk_id in ids))
+            fetched = (
+                collection.get(ids=unique_ids, include=["documents", "metadatas"])
+                if unique_ids else {}
             )
+            records = {
+                chunk_id: (document, metadata)
+                for chunk_id, document, metadata in zip(
+                    fetched.get("ids") or [],
+                    fetched.get("documents") or [],
+                    fetched.get("metadatas") or [],
+                )
+            }
+        else:
+            records = {}
+            for position, ids in enumerate(top_ids):
+                documents = (results.get("documents") or [])[position] or []
+                metadatas = (results.get("metadatas") or [])[position] or []
+                for index, chunk_id in enumerate(ids):
+                    records[chunk_id] = (
+                        documents[index] if index < len(documents) else "",
+                        metadatas[index] if index < len(metadatas) else {},
+                    )
 
-        return items
+        batches: list[list[dict]] = []
+        for position, ids in enumerate(top_ids):
+            distances = (results.get("distances") or [])[position] or []
+
+            items: list[dict] = []
+            for index, chunk_id in enumerate(ids):
+                content, metadata = records.get(chunk_id, ("", {}))
+                distance = distances[index] if index < len(distances) else None
+                # Chromaのdistanceから類似度へ変換（大きいほど類似）
+                score = distance_to_similarity(distance, space) if distance is not None else 0.0
+                items.append(
+                    {
+                        "chunk_id": chunk_id,
+                        "document_id": metadata.get("document_id") if metadata else None,
+                        "chunk_index": metadata.get("chunk_index") if metadata else None,
+                        "chunk_overlap": metadata.get("chunk_overlap") if metadata else None,
+                        "content": content or "",
+                        "score": score,
+                    }
+                )
+            batches.append(items)
+
+        return batches
 
     def add_document_chunks(
         self,
         document_id: str,
         chunks: list[str],
         embeddings: list[list[float]],
+        start_index: int = 0,
+        extra_metadata: dict | None = None,
+        chunk_indexes: list[int] | None = None,
     ) -> list[str]:
         # チャンクと埋め込みの件数不一致を防止
         if len(chunks) != len(embeddings):
@@ -86,17 +318,22 @@ class VectorDBService:
         if not chunks:
             return []
 
+        indexes = resolve_chunk_indexes(len(chunks), start_index, chunk_indexes)
+        self._check_dimension(len(embeddings[0]), record=True)
         collection = self.get_collection()
-        chunk_ids = [str(uuid4()) for _ in chunks]
+        chunk_ids = [
+            make_chunk_id(document_id, index, chunk) for index, chunk in zip(indexes, chunks)]
         metadatas = [
             {
+                **(extra_metadata or {}),
                 "document_id": document_id,
                 "chunk_index": index,
             }
-            for index in range(len(chunks))
+            for index in indexes
         ]
 
-        collection.add(
+        # ID が決定的なため、同じチャンクの再保存は重複せず置き換えになる
+        collection.upsert(
             ids=chunk_ids,
             documents=chunks,
             embeddings=embeddings,
@@ -105,6 +342,49 @@ class VectorDBService:
 
         return chunk_ids
 
+    def get_document_chunk_ids(self, document_id: str) -> list[str]:
+        # 埋め込みや本文は取得せず ID のみを返す（再ベクトル化時の差分判定用）
+        results = self.get_collection().get(where={"document_id": document_id}, include=[])
+        return list(results.get("ids", []))
+
+    def get_chunk_embeddings(self, chunk_ids: list[str]) -> dict[str, list[float]]:
+        # 保存済みの埋め込みを chunk_id で取得（文脈構築時の多様性判定用。存在しない ID は含めない）
+        if not chunk_ids:
+            return {}
+        results = self.get_collection().get(ids=list(chunk_ids), include=["embeddings"])
+        embeddings = results.get("embeddings")
+        if embeddings is None:
+            return {}
+        return {
+            chunk_id: [float(value) for value in embedding]
+            for chunk_id, embedding in zip(results.get("ids", []), embeddings)
+        }
+
+    def delete_chunks(self, chunk_ids: list[str]) -> None:
+        if not chunk_ids:
+            return
+        collection = self.get_collection()
+        batch_size = self._client.get_max_batch_size()
+        for start in range(0, len(chunk_ids), batch_size):
+            collection.delete(ids=chunk_ids[start:start + batch_size])
+
+    def delete_document(self, document_id: str) -> None:
+        # ID を列挙せず where 条件1回でドキュメントの全チャンクを削除
+        self.get_collection().delete(where={"document_id": document_id})
+
+    def iter_chunk_pages(self, page_size: int = 1000) -> Iterator[ChunkPage]:
+        # コレクション全体をページ単位で走査（索引の再構築用）
+        collection = self.get_collection()
+        offset = 0
+        while True:
+            results = collection.get(
+                include=["documents", "metadatas"], limit=page_size, offset=offset)
+            ids = results.get("ids", [])
+            if not ids:
+                return
+            yield ids, results.get("documents") or [], results.get("metadatas") or []
+            offset += len(ids)
+
     def list_documents(self) -> list[dict]:
         # メタデータから document_id ごとのチャンク数を集計
         collection = self.get_collection()
@@ -127,13 +407,189 @@ class VectorDBService:
         return list(grouped.values())
 
 
-def get_vectordb_service() -> VectorDBService:
+class AsyncVectorDBService:
+    """VectorStore の同期処理を専用スレッドプールで実行する非同期ファサード
+
+    検索（読み取り）と保存（書き込み）でプールを分け、大きな取り込み中も検索を止めない。
+    """
+
+    def __init__(
+        self,
+        service: VectorStore,
+        read_workers: int = 4,
+        write_workers: int = 1,
+    ) -> None:
+        self._service = service
+        self._read_workers = max(1, read_workers)
+        self._write_workers = max(1, write_workers)
+        self._read_executor = ThreadPoolExecutor(
+            max_workers=self._read_workers, thread_name_prefix="vectordb-read")
+        self._write_executor = ThreadPoolExecutor(
+            max_workers=self._write_workers, thread_name_prefix="vectordb-write")
+
+        # プールごとの実行中・待機中タスク数（メトリクス用）
+        self._in_flight = {"read": 0, "write": 0}
+
+    @property
+    def service(self) -> VectorStore:
+        return self._service
+
+    async def _run(self, pool: str, func: Callable[..., _T], *args: Any) -> _T:
+        # イベントループをブロックしないよう指定プールへディスパッチ
+        executor = self._read_executor if pool == "read" else self._write_executor
+        loop = asyncio.get_running_loop()
+        self._in_flight[pool] += 1
+        submitted = time.perf_counter()
+        started: list[float] = []
+
+        def call() -> _T:
+            # プール待ち時間と実行時間を分けて計測（スレッド側ではコンテキストを引き継がないため時刻のみ記録）
+            started.append(time.perf_counter())
+            return func(*args)
+
+        try:
+            return await loop.run_in_executor(executor, call)
+        finally:
+            self._in_flight[pool] -= 1
+            if started:
+                record_stage(f"vectordb_{pool}_wait", started[0] - submitted)
+                record_stage(getattr(func, "__name__", "vectordb"), time.perf_counter() - started[0])
+
+    async def query_similar_chunks(
+        self,
+        query_embedding: list[float],
+        top_k: int = 5,
+        search_ef: int | None = None,
+    ) -> list[dict]:
+        return await self._run(
+            "read", self._service.query_similar_chunks, query_embedding, top_k, search_ef)
+
+    async def query_similar_chunks_batch(
+        self,
+        query_embeddings: list[list[float]],
+        top_k: int = 5,
+        search_ef: int | None = None,
+    ) -> list[list[dict]]:
+        return await self._run(
+            "read", self._service.query_similar_chunks_batch, query_embeddings, top_k, search_ef)
+
+    async def add_document_chunks(
+        self,
+        document_id: str,
+        chunks: list[str],
+        embeddings: list[list[float]],
+        start_index: int = 0,
+        extra_metadata: dict | None = None,
+        chunk_indexes: list[int] | None = None,
+    ) -> list[str]:
+        return await self._run(
+            "write", self._service.add_document_chunks,
+            document_id, chunks, embeddings, start_index, extra_metadata, chunk_indexes)
+
+    async def get_document_chunk_ids(self, document_id: str) -> list[str]:
+        return await self._run("read", self._service.get_document_chunk_ids, document_id)
+
+    async def get_chunk_embeddings(self, chunk_ids: list[str]) -> dict[str, list[float]]:
+        return await self._run("read", self._service.get_chunk_embeddings, chunk_ids)
+
+    async def delete_chunks(self, chunk_ids: list[str]) -> None:
+        await self._run("write", self._service.delete_chunks, chunk_ids)
+
+    async def delete_document(self, document_id: str) -> None:
+        await self._run("write", self._service.delete_document, document_id)
+
+    async def list_documents(self) -> list[dict]:
+        return await self._run("read", self._service.list_documents)
+
+    def stats(self) -> dict:
+        # プールサイズと使用状況を返す（/metrics から参照）
+        return {
+            "read_pool_size": self._read_workers,
+            "read_in_flight": self._in_flight["read"],
+            "write_pool_size": self._write_workers,
+            "write_in_flight": self._in_flight["write"],
+        }
+
+    def shutdown(self) -> None:
+        # 実行中のタスクは完了を待ってからスレッドを停止
+        self._read_executor.shutdown(wait=True)
+        self._write_executor.shutdown(wait=True)
+
+
+# プロセス全体で共有する VectorStore（アプリ起動時に生成）
+_service: VectorStore | None = None
+_async_service: AsyncVectorDBService | None = None
+_service_lock = threading.Lock()
+
+
+def init_vectordb_service() -> AsyncVectorDBService:
+    # 起動時に一度だけクライアントを生成し、コレクションも解決しておく
+    service = get_vectordb_service()
+    service.warm_up()
+    return get_async_vectordb_service()
+
+
+def _create_vector_store() -> VectorStore:
+    # Settings.vector_backend に応じてバックエンドを生成
     settings = get_settings()
-    persist_directory = Path(settings.chroma_persist_directory)
+    if settings.vector_backend == "numpy":
+        from .numpy_store import NumpyVectorStore
+
+        return NumpyVectorStore(
+            str(resolve_project_path(settings.numpy_store_directory)),
+            quantization=settings.numpy_quantization,
+            rescore_multiplier=settings.numpy_rescore_multiplier,
+            scan_block_rows=settings.numpy_scan_block_rows,
+        )
+    return VectorDBService(
+        str(resolve_project_path(settings.chroma_persist_directory)),
+        space=settings.chroma_distance_space,
+        hnsw_m=settings.hnsw_m,
+        hnsw_construction_ef=settings.hnsw_construction_ef,
+        hnsw_search_ef=settings.hnsw_search_ef,
+    )
+
+
+def get_vectordb_service() -> VectorStore:
+    # FastAPI の依存性注入からも利用される。未初期化時（スクリプト実行など）は遅延生成
+    global _service
+    if _service is not None:
+        return _service
+
+    with _service_lock:
+        if _service is None:
+            _service = _create_vector_store()
+        return _service
+
+
+def get_async_vectordb_service() -> AsyncVectorDBService:
+    # API層からはこちらを Depends で注入して利用する
+    global _async_service
+    if _async_service is not None:
+        return _async_service
+
+    service = get_vectordb_service()
+    with _service_lock:
+        if _async_service is None:
+            settings = get_settings()
+            _async_service = AsyncVectorDBService(
+                service,
+                read_workers=settings.vectordb_read_workers,
+                write_workers=settings.vectordb_write_workers,
+            )
+        return _async_service
+
+
+def peek_async_vectordb_service() -> AsyncVectorDBService | None:
+    # メトリクス出力用。未初期化の場合はクライアントを生成せずに None を返す
+    return _async_service
 
-    # 相対パスはプロジェクトルート基準へ正規化
-    if not persist_directory.is_absolute():
-        project_root = Path(__file__).resolve().parents[3]
-        persist_directory = project_root / persist_directory
 
-    return VectorDBService(str(persist_directory))
+def reset_vectordb_service() -> None:
+    # 設定変更やテスト時・停止時にシングルトンを破棄する
+    global _service, _async_service
+    with _service_lock:
+        if _async_service is not None:
+            _async_service.shutdown()
+        _async_service = None
+        _service = None
@@ -1,6 +1,12 @@
 from __future__ import annotations
 
+import codecs
+import mmap
 from pathlib import Path
+from typing import Iterable, Iterator
+
+# ファイルを読み進める単位（バイト）
+DEFAULT_BLOCK_SIZE = 1024 * 1024
 
 
 def read_text_file(file_path: str) -> str:
@@ -16,13 +22,17 @@ def extract_text_from_file(file_path: str, file_type: str) -> str:
     raise ValueError(f"未対応のファイル形式です: {file_type}")
 
 
-def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> list[str]:
+def _validate_chunk_args(chunk_size: int, overlap: int) -> None:
     # 引数バリデーション
     if chunk_size <= 0:
         raise ValueError("chunk_size は正の整数である必要があります。")
     if overlap < 0 or overlap >= chunk_size:
         raise ValueError("overlap は 0 以上かつ chunk_size 未満である必要があります。")
 
+
+def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> list[str]:
+    _validate_chunk_args(chunk_size, overlap)
+
     # オーバーラップ付きスライディングウィンドウで分割
     chunks: list[str] = []
     start = 0
@@ -36,3 +46,71 @@ def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> list[str]
         start = end - overlap
 
     return chunks
+
+
+def iter_text_blocks(file_path: str, block_size: int = DEFAULT_BLOCK_SIZE) -> Iterator[str]:
+    # UTF-8 ファイルをメモリマップし、ブロック単位で逐次デコードして返す
+    # （マルチバイト文字がブロック境界をまたいでもインクリメンタルデコーダが連結する）
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with open(file_path, "rb") as file:
+        if Path(file_path).stat().st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for offset in range(0, len(mapped), block_size):
+                text = decoder.decode(mapped[offset: offset + block_size])
+                if text:
+                    yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def iter_chunks(
+    blocks: Iterable[str],
+    chunk_size: int = 500,
+    overlap: int = 50,
+) -> Iterator[str]:
+    # chunk_text と同じ分割結果を、テキスト全体を保持せずに逐次生成する
+    _validate_chunk_args(chunk_size, overlap)
+
+    step = chunk_size - overlap
+    buffer = ""
+    for block in blocks:
+        buffer += block
+        # 後続があると確定したチャンクだけを出力し、未出力分（オーバーラップ含む）を残す
+        start = 0
+        while len(buffer) - start > chunk_size:
+            yield buffer[start: start + chunk_size]
+            start += step
+        buffer = buffer[start:]
+
+    if buffer:
+        yield buffer
+
+
+def iter_file_chunks(
+    file_path: str,
+    file_type: str,
+    chunk_size: int = 500,
+    overlap: int = 50,
+) -> Iterator[str]:
+    # 保存済みファイルを遅延読み込みしながらチャンクを生成
+    if file_type != "txt":
+        raise ValueError(f"未対応のファイル形式です: {file_type}")
+    return iter_chunks(iter_text_blocks(file_path), chunk_size=chunk_size, overlap=overlap)
+
+
+def count_file_chars(file_path: str) -> int:
+    # 進捗表示用に総文字数だけを数える（本文は保持しない）
+    return sum(len(block) for block in iter_text_blocks(file_path))
+
+
+def count_chunks(text_length: int, chunk_size: int = 500, overlap: int = 50) -> int:
+    # chunk_text が生成するチャンク数を文字数から算出
+    _validate_chunk_args(chunk_size, overlap)
+    if text_length == 0:
+        return 0
+    if text_length <= chunk_size:
+        return 1
+    step = chunk_size - overlap
+    return -(-(text_length - chunk_size) // step) + 1
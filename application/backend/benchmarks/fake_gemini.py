@@ -0,0 +1,183 @@
+"""ベンチマーク用のローカル Gemini 代替サーバー。
+
+embedContent / batchEmbedContents / generateContent / streamGenerateContent を実装し、
+API クォータを消費せずに取り込み・質問応答の経路を計測できるようにする。
+埋め込みは入力テキストのハッシュから生成した決定的な単位ベクトルで、
+応答には指定した遅延（固定 + ジッター + 件数比例）を挿入する。
+
+実行例:
+    python benchmarks/fake_gemini.py --port 8090 --embed-latency-ms 30 --generate-latency-ms 400
+    GEMINI_API_BASE_URL=http://127.0.0.1:8090/v1beta uvicorn app.main:app
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from dataclasses import dataclass
+import hashlib
+import json
+import random
+from typing import AsyncIterator
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+import numpy as np
+
+# outputDimensionality 未指定時の次元（gemini-embedding-001 の既定値）
+DEFAULT_DIMENSION = 3072
+
+METHODS = ("embedContent", "batchEmbedContents", "generateContent", "streamGenerateContent")
+
+
+@dataclass
+class FakeGeminiConfig:
+    embed_latency_ms: float = 0.0
+    embed_per_item_latency_ms: float = 0.0
+    generate_latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    stream_chunks: int = 4
+    answer_chars: int = 200
+    seed: int = 0
+
+
+def deterministic_embedding(text: str, dimension: int, seed: int = 0) -> list[float]:
+    # テキストと seed が同じなら常に同じ単位ベクトルを返す
+    digest = hashlib.sha256(f"{seed}\0{text}".encode("utf-8")).digest()
+    rng = np.random.default_rng(int.from_bytes(digest[:8], "little"))
+    vector = rng.standard_normal(dimension)
+    vector /= np.linalg.norm(vector)
+    # 実 API と同程度の桁数に丸め、JSON のシリアライズ・解析コストを抑える
+    return np.round(vector, 6).tolist()
+
+
+def _prompt_text(body: dict) -> str:
+    return "".join(
+        part.get("text", "")
+        for content in body.get("contents", [])
+        for part in content.get("parts", [])
+    )
+
+
+def _usage(prompt: str, answer: str) -> dict:
+    # トークン数は文字数から概算（実 API の usageMetadata と同じキー）
+    prompt_tokens = max(1, len(prompt) // 4)
+    answer_tokens = max(1, len(answer) // 4)
+    return {
+        "promptTokenCount": prompt_tokens,
+        "candidatesTokenCount": answer_tokens,
+        "totalTokenCount": prompt_tokens + answer_tokens,
+    }
+
+
+def _json_response(data: dict) -> Response:
+    # 大きな埋め込み配列を jsonable_encoder に通さず直接シリアライズする
+    return Response(json.dumps(data), media_type="application/json")
+
+
+def create_app(config: FakeGeminiConfig | None = None) -> FastAPI:
+    config = config or FakeGeminiConfig()
+    app = FastAPI(title="Fake Gemini API")
+    stats = {**{method: 0 for method in METHODS}, "embedded_texts": 0}
+    jitter = random.Random(config.seed)
+
+    async def delay(base_ms: float, items: int = 0) -> None:
+        latency = base_ms + config.embed_per_item_latency_ms * items
+        if config.jitter_ms:
+            latency += jitter.uniform(0, config.jitter_ms)
+        if latency > 0:
+            await asyncio.sleep(latency / 1000)
+
+    def embed(request: dict) -> dict:
+        text = "".join(part.get("text", "") for part in request.get("content", {}).get("parts", []))
+        dimension = int(request.get("outputDimensionality") or DEFAULT_DIMENSION)
+        return {"values": deterministic_embedding(text, dimension, config.seed)}
+
+    def answer_for(prompt: str, max_tokens: int) -> str:
+        # プロンプトのハッシュから決定的な回答文を作る（長さは max_tokens で頭打ち）
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        length = min(config.answer_chars, max(1, max_tokens) * 4)
+        return ("回答" + digest * (length // len(digest) + 1))[:length]
+
+    @app.post("/v1beta/models/{target}")
+    async def models(target: str, request: Request):
+        model, _, method = target.partition(":")
+        if not model or method not in METHODS:
+            raise HTTPException(status_code=404, detail=f"unknown method: {target}")
+        body = await request.json()
+        stats[method] += 1
+
+        if method == "embedContent":
+            stats["embedded_texts"] += 1
+            await delay(config.embed_latency_ms, 1)
+            return _json_response({"embedding": embed(body)})
+
+        if method == "batchEmbedContents":
+            requests = body.get("requests", [])
+            stats["embedded_texts"] += len(requests)
+            await delay(config.embed_latency_ms, len(requests))
+            return _json_response({"embeddings": [embed(item) for item in requests]})
+
+        prompt = _prompt_text(body)
+        max_tokens = int(body.get("generationConfig", {}).get("maxOutputTokens") or 1000)
+        answer = answer_for(prompt, max_tokens)
+
+        if method == "generateContent":
+            await delay(config.generate_latency_ms)
+            return {
+                "candidates": [
+                    {"content": {"role": "model", "parts": [{"text": answer}]}, "finishReason": "STOP"}
+                ],
+                "usageMetadata": _usage(prompt, answer),
+            }
+
+        # streamGenerateContent: 生成遅延を断片数で分割して SSE で送る
+        pieces = max(1, config.stream_chunks)
+        size = -(-len(answer) // pieces)
+
+        async def events() -> AsyncIterator[str]:
+            for start in range(0, len(answer), size):
+                await delay(config.generate_latency_ms / pieces)
+                part = {"text": answer[start:start + size]}
+                chunk = {"candidates": [{"content": {"role": "model", "parts": [part]}}]}
+                if start + size >= len(answer):
+                    chunk["usageMetadata"] = _usage(prompt, answer)
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\r\n\r\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def get_stats() -> dict:
+        return dict(stats)
+
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="ローカル Gemini 代替サーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0)
+    parser.add_argument("--embed-per-item-latency-ms", type=float, default=0.0)
+    parser.add_argument("--generate-latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--stream-chunks", type=int, default=4)
+    parser.add_argument("--answer-chars", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = FakeGeminiConfig(
+        embed_latency_ms=args.embed_latency_ms,
+        embed_per_item_latency_ms=args.embed_per_item_latency_ms,
+        generate_latency_ms=args.generate_latency_ms,
+        jitter_ms=args.jitter_ms,
+        stream_chunks=args.stream_chunks,
+        answer_chars=args.answer_chars,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
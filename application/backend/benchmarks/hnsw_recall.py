@@ -0,0 +1,177 @@
+"""HNSW 検索の recall@k とレイテンシを総当たり検索と比較するベンチマーク。
+
+既定では合成ベクトル（クラスタ構造を持つ正規化済みベクトル）で一時コレクションを作成し、
+search_ef ごとに VectorDBService 経由で検索して NumPy の総当たり結果と突き合わせる。
+--from-collection を指定すると既存の永続化ディレクトリのベクトルをクエリにも流用する。
+
+実行例:
+    python benchmarks/hnsw_recall.py --chunks 20000 --queries 200 --search-ef 10 50 100 200
+"""
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+if str(BACKEND_ROOT) not in sys.path:
+    sys.path.insert(0, str(BACKEND_ROOT))
+
+from app.config import get_settings, resolve_project_path
+from app.services.vectordb import COLLECTION_NAME, VectorDBService
+
+_ADD_BATCH = 5000
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+def _synthetic_vectors(count: int, dimension: int, clusters: int, seed: int) -> np.ndarray:
+    # 実際の埋め込みに近づけるため、クラスタ中心の周辺にばらつかせる
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=count)
+    noise = rng.standard_normal((count, dimension)).astype(np.float32) * 0.6
+    return _normalize(centers[labels] + noise)
+
+
+def _build_synthetic_store(args: argparse.Namespace, directory: str) -> tuple[VectorDBService, np.ndarray]:
+    vectors = _synthetic_vectors(args.chunks, args.dimension, args.clusters, args.seed)
+    service = VectorDBService(
+        directory,
+        collection_name="hnsw_benchmark",
+        space=args.space,
+        hnsw_m=args.m,
+        hnsw_construction_ef=args.construction_ef,
+        hnsw_search_ef=min(args.search_ef),
+    )
+    started = time.perf_counter()
+    for start in range(0, len(vectors), _ADD_BATCH):
+        batch = vectors[start:start + _ADD_BATCH]
+        service.add_document_chunks(
+            "benchmark",
+            [f"chunk-{start + offset}" for offset in range(len(batch))],
+            batch.tolist(),
+            start_index=start,
+        )
+    print(f"indexed {len(vectors)} vectors in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return service, vectors
+
+
+def _load_existing_store(args: argparse.Namespace) -> tuple[VectorDBService, np.ndarray]:
+    settings = get_settings()
+    directory = str(resolve_project_path(settings.chroma_persist_directory))
+    service = VectorDBService(
+        directory,
+        collection_name=COLLECTION_NAME,
+        hnsw_search_ef=min(args.search_ef),
+    )
+    result = service.get_collection().get(include=["embeddings"])
+    return service, _normalize(np.asarray(result["embeddings"], dtype=np.float32))
+
+
+def _brute_force_chunk_indexes(
+    service: VectorDBService,
+    queries: np.ndarray,
+    top_k: int,
+) -> list[set[str]]:
+    # 正解集合は chunk_id で比較するため、コレクション側の ID と行を対応付ける
+    result = service.get_collection().get(include=["embeddings"])
+    ids = result["ids"]
+    matrix = _normalize(np.asarray(result["embeddings"], dtype=np.float32))
+    truth = []
+    for query in queries:
+        scores = matrix @ query
+        top = np.argpartition(-scores, min(top_k, len(scores) - 1))[:top_k]
+        truth.append({ids[index] for index in top})
+    return truth
+
+
+def _percentile(values: list[float], q: float) -> float:
+    return float(np.percentile(np.asarray(values), q)) if values else 0.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--from-collection", action="store_true", help="既存コレクションを使用する")
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--space", choices=["cosine", "l2", "ip"], default="cosine")
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--construction-ef", type=int, default=100)
+    parser.add_argument("--search-ef", type=int, nargs="+", default=[10, 50, 100, 200])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="結果を JSONL で追記するファイル")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.from_collection:
+            service, vectors = _load_existing_store(args)
+        else:
+            service, vectors = _build_synthetic_store(args, directory)
+        if len(vectors) == 0:
+            raise SystemExit("コレクションにベクトルがありません。")
+
+        # クエリは格納済みベクトルに摂動を加えたもの（完全一致だけを測らないため）
+        rng = np.random.default_rng(args.seed + 1)
+        picks = rng.integers(0, len(vectors), size=args.queries)
+        queries = _normalize(vectors[picks] + rng.standard_normal(vectors[picks].shape).astype(np.float32) * 0.3)
+        truth = _brute_force_chunk_indexes(service, queries, args.top_k)
+
+        # 総当たり検索自体のレイテンシも基準として計測
+        brute_latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            np.argpartition(-(vectors @ query), min(args.top_k, len(vectors) - 1))[:args.top_k]
+            brute_latencies.append((time.perf_counter() - started) * 1000)
+
+        results = []
+        for search_ef in args.search_ef:
+            latencies = []
+            hits = 0
+            for query, expected in zip(queries, truth):
+                started = time.perf_counter()
+                chunks = service.query_similar_chunks(query.tolist(), args.top_k, search_ef=search_ef)
+                latencies.append((time.perf_counter() - started) * 1000)
+                hits += len(expected & {chunk["chunk_id"] for chunk in chunks})
+            results.append(
+                {
+                    "benchmark": "hnsw_recall",
+                    "space": service.space,
+                    "chunks": len(vectors),
+                    "dimension": int(vectors.shape[1]),
+                    "m": args.m,
+                    "construction_ef": args.construction_ef,
+                    "search_ef": search_ef,
+                    "top_k": args.top_k,
+                    "queries": len(queries),
+                    f"recall_at_{args.top_k}": hits / (len(queries) * args.top_k),
+                    "latency_ms_p50": _percentile(latencies, 50),
+                    "latency_ms_p95": _percentile(latencies, 95),
+                    "latency_ms_p99": _percentile(latencies, 99),
+                    "brute_force_latency_ms_p50": _percentile(brute_latencies, 50),
+                }
+            )
+
+    for result in results:
+        print(json.dumps(result, ensure_ascii=False))
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with args.output.open("a", encoding="utf-8") as handle:
+            for result in results:
+                handle.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""取り込み・質問応答経路のオフラインベンチマーク。
+
+ローカル Gemini 代替サーバー（benchmarks/fake_gemini.py）をサブプロセスで起動し、
+合成コーパスを段階的に取り込みながら、コーパスサイズごとに次の値を計測する。
+
+- 取り込みスループット（ingest_chunks_pipelined によるチャンク/秒）
+- POST /api/v1/query のレイテンシ（p50 / p95 / p99）とスループット
+- プロセスのメモリ使用量（現在値・ピーク）とデータディレクトリのディスク使用量
+
+結果はコーパスサイズごとに1行の JSON として experiments/benchmarks.jsonl に追記する。
+
+実行例:
+    python benchmarks/run_benchmark.py --sizes 1000 10000 100000
+    python benchmarks/run_benchmark.py --sizes 1000 10000 100000 1000000 --vector-backend numpy
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from datetime import datetime, timezone
+import json
+import os
+from pathlib import Path
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Iterator
+from uuid import uuid4
+
+import httpx
+import numpy as np
+
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+REPO_ROOT = BACKEND_ROOT.parents[1]
+if str(BACKEND_ROOT) not in sys.path:
+    sys.path.insert(0, str(BACKEND_ROOT))
+
+DEFAULT_OUTPUT = REPO_ROOT / "experiments" / "benchmarks.jsonl"
+
+# 合成チャンク用の語彙（BM25 でも一致が生じるよう有限の語彙から組み立てる）
+_VOCABULARY = (
+    "検索 埋め込み ベクトル 文書 質問 回答 生成 モデル 索引 類似度 チャンク 分割 "
+    "コンテナ 開発 環境 設定 評価 実験 性能 遅延 スループット 並行 キャッシュ 保存 "
+    "rag chroma gemini python fastapi sqlite numpy hnsw bm25 token"
+).split()
+
+
+def _synthetic_chunk(rng: random.Random, document_index: int, chunk_index: int, chars: int) -> str:
+    words = [f"doc{document_index}", f"chunk{chunk_index}"]
+    length = sum(len(word) + 1 for word in words)
+    while length < chars:
+        word = rng.choice(_VOCABULARY)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:chars]
+
+
+def _iter_chunks(seed: int, document_index: int, count: int, chars: int) -> Iterator[str]:
+    rng = random.Random(f"{seed}:{document_index}")
+    for chunk_index in range(count):
+        yield _synthetic_chunk(rng, document_index, chunk_index, chars)
+
+
+def _questions(seed: int, count: int) -> list[str]:
+    rng = random.Random(f"{seed}:questions")
+    return [
+        " ".join(rng.choice(_VOCABULARY) for _ in range(6)) + f" について {index}"
+        for index in range(count)
+    ]
+
+
+def _rss_mb() -> float:
+    # 現在の RSS（Linux の /proc から取得。取得できない環境では 0）
+    try:
+        with open("/proc/self/status", encoding="utf-8") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss は Linux では KiB、macOS ではバイト
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _disk_mb(path: Path) -> float:
+    return sum(file.stat().st_size for file in path.rglob("*") if file.is_file()) / (1024 * 1024)
+
+
+def _percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0}
+    array = np.asarray(values)
+    return {
+        "p50": float(np.percentile(array, 50)),
+        "p95": float(np.percentile(array, 95)),
+        "p99": float(np.percentile(array, 99)),
+        "mean": float(array.mean()),
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _start_fake_gemini(args: argparse.Namespace) -> subprocess.Popen:
+    command = [
+        sys.executable, str(Path(__file__).with_name("fake_gemini.py")),
+        "--port", str(args.port),
+        "--embed-latency-ms", str(args.embed_latency_ms),
+        "--embed-per-item-latency-ms", str(args.embed_per_item_latency_ms),
+        "--generate-latency-ms", str(args.generate_latency_ms),
+        "--jitter-ms", str(args.jitter_ms),
+        "--seed", str(args.seed),
+    ]
+    process = subprocess.Popen(command)
+    # 起動完了まで待機
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{args.port}/stats", timeout=0.5)
+            return process
+        except httpx.HTTPError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+    process.terminate()
+    raise SystemExit("Gemini 代替サーバーを起動できませんでした。")
+
+
+def _configure_environment(args: argparse.Namespace, workdir: Path, base_url: str) -> None:
+    # アプリの設定は環境変数から読むため、app モジュールの読み込み前に設定する
+    os.environ.update(
+        {
+            "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY", "benchmark"),
+            "GEMINI_API_BASE_URL": base_url,
+            "CHROMA_PERSIST_DIRECTORY": str(workdir / "chromadb"),
+            "NUMPY_STORE_DIRECTORY": str(workdir / "numpy_store"),
+            "VECTOR_BACKEND": args.vector_backend,
+            "EMBEDDING_OUTPUT_DIMENSIONALITY": str(args.embedding_dimension),
+            # 同じ質問の繰り返しでキャッシュに当たらないよう質問埋め込みキャッシュは無効化
+            "QUERY_EMBEDDING_CACHE_SIZE": "0",
+            "LOG_LEVEL": "WARNING",
+        }
+    )
+
+
+async def _ingest(target: int, state: dict, args: argparse.Namespace) -> tuple[int, float]:
+    # 既存コーパスに追加して target 件に揃える（追加件数, 所要秒数）
+    from app.config import get_settings
+    from app.services.ingest import ingest_chunks_pipelined
+    from app.services.vectordb import get_async_vectordb_service
+
+    settings = get_settings()
+    vectordb = get_async_vectordb_service()
+    added = 0
+    started = time.perf_counter()
+    while state["chunks"] < target:
+        count = min(args.chunks_per_document, target - state["chunks"])
+        document_index = state["documents"]
+        await ingest_chunks_pipelined(
+            f"benchmark-{document_index}",
+            _iter_chunks(args.seed, document_index, count, args.chunk_chars),
+            vectordb,
+            batch_size=max(1, settings.vectorize_batch_size),
+            depth=settings.vectorize_pipeline_depth,
+        )
+        state["chunks"] += count
+        state["documents"] += 1
+        added += count
+    return added, time.perf_counter() - started
+
+
+async def _run_queries(args: argparse.Namespace, questions: list[str]) -> tuple[list[float], float, int]:
+    # ASGI アプリへ直接リクエストし、API 層を含めた質問応答のレイテンシを計測する
+    from app.main import app
+
+    semaphore = asyncio.Semaphore(max(1, args.query_concurrency))
+    latencies: list[float] = []
+    errors = 0
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=None,
+    ) as client:
+
+        async def run(question: str) -> None:
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(
+                    "/api/v1/query",
+                    json={"question": question, "top_k": args.top_k, "search_mode": args.search_mode},
+                )
+                latencies.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run(question) for question in questions))
+        elapsed = time.perf_counter() - started
+
+    return latencies, elapsed, errors
+
+
+async def _run(args: argparse.Namespace, workdir: Path, base_url: str) -> list[dict]:
+    from app.config import get_settings
+    from app.services.embedding_store import close_chunk_embedding_store
+    from app.services.http_client import close_http_client, init_http_client
+    from app.services.lexical_index import close_lexical_index
+    from app.services.vectordb import init_vectordb_service, reset_vectordb_service
+
+    settings = get_settings()
+    run_id = str(uuid4())
+    commit = _git_commit()
+    questions = _questions(args.seed, args.queries)
+    state = {"chunks": 0, "documents": 0}
+    records: list[dict] = []
+
+    await init_http_client()
+    init_vectordb_service()
+    try:
+        for size in sorted(args.sizes):
+            added, ingest_seconds = await _ingest(size, state, args)
+            latencies, query_seconds, errors = await _run_queries(args, questions)
+            record = {
+                "benchmark": "rag_pipeline",
+                "run_id": run_id,
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "git_commit": commit,
+                "vector_backend": settings.vector_backend,
+                "embedding_dimension": args.embedding_dimension,
+                "search_mode": args.search_mode,
+                "chunks": state["chunks"],
+                "ingested_chunks": added,
+                "ingest_seconds": ingest_seconds,
+                "ingest_chunks_per_sec": added / ingest_seconds if ingest_seconds > 0 else None,
+                "queries": len(latencies),
+                "query_errors": errors,
+                "query_concurrency": args.query_concurrency,
+                "query_latency_ms": _percentiles(latencies),
+                "query_throughput_qps": len(latencies) / query_seconds if query_seconds > 0 else None,
+                "rss_mb": _rss_mb(),
+                "peak_rss_mb": _peak_rss_mb(),
+                "disk_mb": _disk_mb(workdir),
+                "config": {
+                    "gemini_api_base_url": base_url,
+                    "embed_latency_ms": args.embed_latency_ms,
+                    "embed_per_item_latency_ms": args.embed_per_item_latency_ms,
+                    "generate_latency_ms": args.generate_latency_ms,
+                    "jitter_ms": args.jitter_ms,
+                    "chunk_chars": args.chunk_chars,
+                    "top_k": args.top_k,
+                    "vectorize_batch_size": settings.vectorize_batch_size,
+                    "vectorize_pipeline_depth": settings.vectorize_pipeline_depth,
+                    "embedding_batch_size": settings.embedding_batch_size,
+                    "embedding_max_concurrency": settings.embedding_max_concurrency,
+                },
+            }
+            records.append(record)
+            print(json.dumps(record, ensure_ascii=False), flush=True)
+            # 長時間の計測でも途中結果を残せるようサイズごとに追記
+            if args.output:
+                args.output.parent.mkdir(parents=True, exist_ok=True)
+                with args.output.open("a", encoding="utf-8") as handle:
+                    handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+    finally:
+        await close_http_client()
+        reset_vectordb_service()
+        close_chunk_embedding_store()
+        close_lexical_index()
+    return records
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--query-concurrency", type=int, default=8)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--search-mode", choices=["vector", "hybrid"], default="vector")
+    parser.add_argument("--chunk-chars", type=int, default=500)
+    parser.add_argument("--chunks-per-document", type=int, default=1000)
+    parser.add_argument("--vector-backend", choices=["chroma", "numpy"], default="chroma")
+    parser.add_argument("--embedding-dimension", type=int, default=768)
+    parser.add_argument("--gemini-base-url", help="起動済みの代替サーバー（または実 API）のベースURL")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0)
+    parser.add_argument("--embed-per-item-latency-ms", type=float, default=0.0)
+    parser.add_argument("--generate-latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", type=Path, help="データ保存先（未指定時は一時ディレクトリを作成して削除）")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="rag-benchmark-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    process = None
+    base_url = args.gemini_base_url
+    if base_url is None:
+        process = _start_fake_gemini(args)
+        base_url = f"http://127.0.0.1:{args.port}/v1beta"
+
+    try:
+        _configure_environment(args, workdir, base_url)
+        asyncio.run(_run(args, workdir, base_url))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@ from __future__ import annotations
 import asyncio
 from pathlib import Path
 import sys
-from uuid import uuid4
+from uuid import NAMESPACE_URL, uuid5
 
 PROJECT_ROOT = Path(__file__).resolve().parents[3]
 BACKEND_ROOT = Path(__file__).resolve().parents[1]
@@ -12,7 +12,14 @@ if str(BACKEND_ROOT) not in sys.path:
 
 from app.utils.file_handlers import chunk_text, read_text_file
 from app.services.vectordb import get_vectordb_service
-from app.services.embedding import get_embedding
+from app.services.embedding import get_embeddings
+from app.services.embedding_store import close_chunk_embedding_store
+from app.services.http_client import close_http_client
+from app.services.lexical_index import close_lexical_index, get_lexical_index
+
+# 分割設定（API の既定値と同じ。オーバーラップは文脈構築時の重複除去のためメタデータにも保存する）
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
 
 
 def _collect_documents(documents_dir: Path) -> list[Path]:
@@ -42,29 +49,39 @@ def _ensure_test_documents(documents_dir: Path) -> list[Path]:
     return _collect_documents(documents_dir)
 
 
+def _document_id(document_path: Path) -> str:
+    # プロジェクトルートからの相対パスで決定的に ID を作る（再実行時に同じドキュメントを重複登録しない）
+    relative_path = document_path.resolve().relative_to(PROJECT_ROOT).as_posix()
+    return str(uuid5(NAMESPACE_URL, relative_path))
+
+
 async def _ingest_document(document_path: Path) -> None:
-    document_id = str(uuid4())
+    document_id = _document_id(document_path)
     text = read_text_file(str(document_path))
-    chunks = chunk_text(text)
+    chunks = chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP)
+
+    if not chunks:
+        return
+
+    # 全チャンクをバッチ埋め込みしてから一括保存
+    embeddings = await get_embeddings(chunks, task_type="RETRIEVAL_DOCUMENT")
 
+    # 前回の実行で保存した同じドキュメントのチャンクは置き換える（本文が短くなった場合に古いチャンクを残さない）
     vectordb = get_vectordb_service()
-    collection = vectordb.get_collection()
-
-    for index, chunk in enumerate(chunks):
-        embedding = await get_embedding(chunk, task_type="RETRIEVAL_DOCUMENT")
-        chunk_id = str(uuid4())
-        collection.add(
-            documents=[chunk],
-            embeddings=[embedding],
-            ids=[chunk_id],
-            metadatas=[
-                {
-                    "document_id": document_id,
-                    "document_filename": document_path.name,
-                    "chunk_index": index,
-                }
-            ],
-        )
+    vectordb.delete_document(document_id)
+    lexical_index = get_lexical_index()
+    if lexical_index is not None:
+        lexical_index.delete_document(document_id)
+    chunk_ids = vectordb.add_document_chunks(
+        document_id,
+        chunks,
+        embeddings,
+        extra_metadata={"document_filename": document_path.name, "chunk_overlap": CHUNK_OVERLAP},
+    )
+
+    # ハイブリッド検索用の転置インデックスにも登録
+    if lexical_index is not None:
+        lexical_index.add_chunks(document_id, chunk_ids, chunks)
 
 
 async def main() -> None:
@@ -73,8 +90,13 @@ async def main() -> None:
     if not documents:
         raise RuntimeError("data/documents にテスト用 .txt ドキュメントを準備できませんでした。")
 
-    for document_path in documents:
-        await _ingest_document(document_path)
+    try:
+        for document_path in documents:
+            await _ingest_document(document_path)
+    finally:
+        await close_http_client()
+        close_chunk_embedding_store()
+        close_lexical_index()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+import pytest
+
+from app.services import document_store as document_store_module
+from app.services.document_store import DocumentStore
+
+
+@pytest.fixture
+def document_store(tmp_path, monkeypatch) -> DocumentStore:
+    # 共有インスタンスを一時ディレクトリの DB に差し替える（data/ 配下には書き込まない）
+    store = DocumentStore(str(tmp_path / "documents.sqlite3"))
+    monkeypatch.setattr(document_store_module, "_store", store)
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def make_document(document_store):
+    def make(document_id: str, status: str = "uploaded") -> dict:
+        entry = {
+            "document_id": document_id,
+            "filename": f"{document_id}.txt",
+            "file_type": "txt",
+            "status": status,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "original_text": None,
+            "stored_path": f"{document_id}.txt",
+            "chunk_count": 0,
+            "char_count": 0,
+        }
+        document_store.upsert(entry)
+        return entry
+
+    return make
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+from app.services.context import merge_adjacent_chunks, overlap_length
+
+
+def _chunk(index: int, content: str, document_id: str = "doc", overlap: int | None = 3) -> dict:
+    return {
+        "chunk_id": f"{document_id}:{index}",
+        "document_id": document_id,
+        "chunk_index": index,
+        "content": content,
+        "chunk_overlap": overlap,
+    }
+
+
+def test_trims_overlap_between_adjacent_chunks():
+    merged = merge_adjacent_chunks([_chunk(0, "abcdefg"), _chunk(1, "efghijk")])
+
+    assert [text for _, text in merged] == ["abcdefghijk"]
+
+
+def test_keeps_text_when_overlap_does_not_match():
+    # 記録されたオーバーラップと本文が一致しない場合は削らずに連結する
+    merged = merge_adjacent_chunks([_chunk(0, "abcdefg"), _chunk(1, "xyzhijk")])
+
+    assert [text for _, text in merged] == ["abcdefgxyzhijk"]
+
+
+def test_legacy_chunks_without_overlap_are_concatenated():
+    merged = merge_adjacent_chunks(
+        [_chunk(0, "abcdefg", overlap=None), _chunk(1, "efghijk", overlap=None)])
+
+    assert [text for _, text in merged] == ["abcdefgefghijk"]
+
+
+def test_merges_out_of_order_chunks_at_first_position():
+    chunks = [
+        _chunk(2, "ijklmno"),
+        _chunk(0, "other", document_id="other"),
+        _chunk(0, "abcdefg"),
+        _chunk(1, "efghijk"),
+    ]
+
+    merged = merge_adjacent_chunks(chunks)
+
+    # 0 と 2 は 1 を介してつながり、最初に現れた 2 の位置にまとまる
+    assert [text for _, text in merged] == ["abcdefghijklmno", "other"]
+    assert [chunk["chunk_index"] for chunk in merged[0][0]] == [2, 0, 1]
+
+
+def test_non_adjacent_chunks_stay_separate():
+    merged = merge_adjacent_chunks([_chunk(0, "abcdefg"), _chunk(2, "ijklmno")])
+
+    assert [text for _, text in merged] == ["abcdefg", "ijklmno"]
+
+
+def test_overlap_length():
+    assert overlap_length("abcdefg", "efghijk", 3) == 3
+    assert overlap_length("abcdefg", "efghijk", 0) == 0
+    assert overlap_length("abcdefg", "ef", 3) == 0
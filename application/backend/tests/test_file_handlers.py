@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import pytest
+
+from app.utils.file_handlers import (
+    chunk_text,
+    count_chunks,
+    iter_chunks,
+    iter_file_chunks,
+    iter_text_blocks,
+)
+
+TEXT = "あいうえおかきくけこ" * 37 + "ABCDE\nfghij" * 23
+
+
+@pytest.mark.parametrize(
+    ("chunk_size", "overlap"),
+    [(500, 50), (100, 0), (37, 36), (1, 0), (10_000, 10)],
+)
+def test_iter_file_chunks_matches_chunk_text(tmp_path, chunk_size, overlap):
+    path = tmp_path / "doc.txt"
+    path.write_text(TEXT, encoding="utf-8")
+
+    chunks = list(iter_file_chunks(str(path), "txt", chunk_size=chunk_size, overlap=overlap))
+
+    assert chunks == chunk_text(TEXT, chunk_size=chunk_size, overlap=overlap)
+    assert len(chunks) == count_chunks(len(TEXT), chunk_size=chunk_size, overlap=overlap)
+
+
+@pytest.mark.parametrize("block_size", [1, 2, 7, 4096])
+def test_multibyte_characters_across_block_boundaries(tmp_path, block_size):
+    # ブロック境界で UTF-8 の途中から切れても、連結結果は chunk_text と一致する
+    path = tmp_path / "doc.txt"
+    path.write_text(TEXT, encoding="utf-8")
+
+    blocks = iter_text_blocks(str(path), block_size=block_size)
+
+    assert list(iter_chunks(blocks, chunk_size=50, overlap=10)) == chunk_text(TEXT, 50, 10)
+
+
+def test_empty_file_has_no_chunks(tmp_path):
+    path = tmp_path / "empty.txt"
+    path.write_bytes(b"")
+
+    assert list(iter_file_chunks(str(path), "txt")) == chunk_text("") == []
+
+
+def test_rejects_invalid_overlap():
+    with pytest.raises(ValueError):
+        list(iter_chunks(["abc"], chunk_size=10, overlap=10))
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import pytest
+
+from app.api import documents
+from app.services.jobs import (
+    DocumentDeletingError,
+    JobConflictError,
+    JobStore,
+    VectorizationJobQueue,
+    get_job_queue,
+)
+
+
+@pytest.fixture
+def job_store(tmp_path) -> JobStore:
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    yield store
+    store.close()
+
+
+async def _wait_for_status(store: JobStore, job_id: str, status: str) -> dict:
+    for _ in range(200):
+        job = store.get(job_id)
+        if job["status"] == status:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not reach {status}: {store.get(job_id)}")
+
+
+@pytest.mark.asyncio
+async def test_resumes_unfinished_job_after_restart(tmp_path, make_document):
+    make_document("doc-1")
+    db_path = str(tmp_path / "jobs.sqlite3")
+    stored = asyncio.Event()
+
+    async def interrupted_runner(job: dict, store: JobStore) -> None:
+        # 1バッチ分の進捗を保存した後、停止されるまで待つ
+        store.update(job["job_id"], total_chunks=10, processed_chunks=4)
+        stored.set()
+        await asyncio.Event().wait()
+
+    first_store = JobStore(db_path)
+    first = VectorizationJobQueue(first_store, interrupted_runner, workers=1)
+    await first.start()
+    job = first.submit("doc-1", 500, 50)
+    await asyncio.wait_for(stored.wait(), timeout=2)
+    await first.stop()
+    first_store.close()
+
+    resumed_from: list[int] = []
+
+    async def resumed_runner(job: dict, store: JobStore) -> None:
+        resumed_from.append(job["processed_chunks"])
+        store.update(job["job_id"], processed_chunks=job["total_chunks"])
+
+    second_store = JobStore(db_path)
+    assert [active["job_id"] for active in second_store.list_active()] == [job["job_id"]]
+    second = VectorizationJobQueue(second_store, resumed_runner, workers=1)
+    await second.start()
+    try:
+        finished = await _wait_for_status(second_store, job["job_id"], "completed")
+    finally:
+        await second.stop()
+        second_store.close()
+
+    # 保存済みの進捗から再開し、同じジョブとして完了する
+    assert resumed_from == [4]
+    assert finished["processed_chunks"] == 10
+
+
+def test_submit_returns_active_job_for_same_settings(job_store, make_document):
+    make_document("doc-1")
+    queue = VectorizationJobQueue(job_store, runner=None)
+
+    job = queue.submit("doc-1", 500, 50)
+
+    assert queue.submit("doc-1", 500, 50)["job_id"] == job["job_id"]
+
+
+def test_submit_rejects_active_job_with_other_settings(job_store, make_document):
+    make_document("doc-1")
+    queue = VectorizationJobQueue(job_store, runner=None)
+    job = queue.submit("doc-1", 500, 50)
+
+    with pytest.raises(JobConflictError) as excinfo:
+        queue.submit("doc-1", 200, 20)
+
+    assert excinfo.value.job["job_id"] == job["job_id"]
+
+
+def test_submit_rejects_deleting_document(job_store, make_document):
+    make_document("doc-1", status="deleting")
+    queue = VectorizationJobQueue(job_store, runner=None)
+
+    with pytest.raises(DocumentDeletingError):
+        queue.submit("doc-1", 500, 50)
+
+
+def test_vectorize_endpoint_returns_409_on_conflict(job_store, make_document):
+    make_document("doc-1")
+    queue = VectorizationJobQueue(job_store, runner=None)
+    app = FastAPI()
+    app.include_router(documents.router)
+    app.dependency_overrides[get_job_queue] = lambda: queue
+
+    with TestClient(app) as client:
+        accepted = client.post("/api/v1/documents/doc-1/vectorize?chunk_size=500&chunk_overlap=50")
+        same = client.post("/api/v1/documents/doc-1/vectorize?chunk_size=500&chunk_overlap=50")
+        conflict = client.post("/api/v1/documents/doc-1/vectorize?chunk_size=200&chunk_overlap=20")
+
+    assert accepted.status_code == 202
+    assert same.status_code == 202
+    assert same.json()["job_id"] == accepted.json()["job_id"]
+    assert conflict.status_code == 409
+    assert accepted.json()["job_id"] in conflict.json()["detail"]
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import httpx
+import pytest
+
+from app.services.rate_limit import (
+    AdaptiveConcurrencyLimiter,
+    GeminiRateLimiter,
+    parse_retry_after,
+)
+
+
+def test_retry_after_seconds_header():
+    response = httpx.Response(429, headers={"Retry-After": "7"})
+
+    assert parse_retry_after(response) == 7.0
+
+
+def test_retry_after_http_date_header():
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    response = httpx.Response(429, headers={"Retry-After": format_datetime(retry_at, usegmt=True)})
+
+    assert 25.0 <= parse_retry_after(response) <= 30.0
+
+
+def test_retry_after_past_date_is_zero():
+    retry_at = datetime.now(timezone.utc) - timedelta(minutes=1)
+    response = httpx.Response(429, headers={"Retry-After": format_datetime(retry_at, usegmt=True)})
+
+    assert parse_retry_after(response) == 0.0
+
+
+def test_retry_delay_from_gemini_error_body():
+    response = httpx.Response(429, json={
+        "error": {
+            "code": 429,
+            "details": [
+                {"@type": "type.googleapis.com/google.rpc.QuotaFailure"},
+                {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "12.5s"},
+            ],
+        },
+    })
+
+    assert parse_retry_after(response) == 12.5
+
+
+@pytest.mark.parametrize("response", [
+    httpx.Response(429),
+    httpx.Response(429, headers={"Retry-After": "soon"}),
+    httpx.Response(429, content=b"not json"),
+    httpx.Response(429, json={"error": {"details": [{"retryDelay": "abc"}]}}),
+])
+def test_retry_after_unavailable(response):
+    assert parse_retry_after(response) is None
+
+
+def test_throttle_halves_limit_once_per_congestion():
+    limiter = AdaptiveConcurrencyLimiter(16)
+    started = 1.0  # 縮小より前に開始した要求
+
+    limiter.on_throttle(started)
+    assert limiter.limit == 8
+
+    # 同じ混雑で返った後続の 429 では縮小しない
+    limiter.on_throttle(started)
+    assert limiter.limit == 8
+
+
+def test_throttle_does_not_go_below_minimum():
+    limiter = AdaptiveConcurrencyLimiter(4, minimum=2)
+
+    for _ in range(5):
+        limiter.on_throttle(float("inf"))
+
+    assert limiter.limit == 2
+
+
+def test_success_restores_limit_additively():
+    limiter = AdaptiveConcurrencyLimiter(16)
+    limiter.on_throttle(float("inf"))
+    assert limiter.limit == 8
+
+    # 1回ごとに 1/上限 ずつ増えるため、およそ上限分の成功で +1
+    for _ in range(9):
+        limiter.on_success()
+    assert limiter.limit == 9
+
+    for _ in range(1000):
+        limiter.on_success()
+    assert limiter.limit == 16
+
+
+@pytest.mark.asyncio
+async def test_call_retries_throttled_response_and_decreases_limit():
+    responses = [
+        httpx.Response(429, headers={"Retry-After": "0"}),
+        httpx.Response(200, json={"ok": True}),
+    ]
+    limiter = GeminiRateLimiter(
+        "test", max_concurrency=8, max_retries=3, base_delay=0.0, max_delay=0.0)
+
+    async def send() -> httpx.Response:
+        return responses.pop(0)
+
+    response = await limiter.call(send)
+
+    assert response.status_code == 200
+    stats = limiter.stats()
+    assert stats["throttled"] == 1
+    assert stats["retries"] == 1
+    assert stats["concurrency_limit"] == 4
+    assert stats["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_call_returns_last_response_when_retries_are_exhausted():
+    limiter = GeminiRateLimiter("test", max_retries=1, base_delay=0.0, max_delay=0.0)
+    calls = 0
+
+    async def send() -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        return httpx.Response(503)
+
+    response = await limiter.call(send)
+
+    assert response.status_code == 503
+    assert calls == 2
+    assert limiter.stats()["throttled"] == 0
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import pytest
+
+from app.services.retrieval import reciprocal_rank_fusion
+
+
+def _ranking(*chunk_ids: str, source: str = "") -> list[dict]:
+    return [{"chunk_id": chunk_id, "content": f"{source}{chunk_id}"} for chunk_id in chunk_ids]
+
+
+def test_fuses_rankings_by_reciprocal_rank():
+    vector = _ranking("a", "b", "c", source="vector:")
+    lexical = _ranking("c", "a", "d", source="lexical:")
+
+    fused = reciprocal_rank_fusion([vector, lexical], k=60)
+
+    # a: 1/61 + 1/62, c: 1/63 + 1/61, b: 1/62, d: 1/63
+    assert [item["chunk_id"] for item in fused] == ["a", "c", "b", "d"]
+    max_score = 2 / 61
+    assert fused[0]["score"] == pytest.approx((1 / 61 + 1 / 62) / max_score)
+    assert fused[-1]["score"] == pytest.approx((1 / 63) / max_score)
+
+
+def test_top_in_every_ranking_scores_one():
+    fused = reciprocal_rank_fusion([_ranking("a", "b"), _ranking("a")], k=60)
+
+    assert fused[0]["chunk_id"] == "a"
+    assert fused[0]["score"] == pytest.approx(1.0)
+    assert all(0.0 <= item["score"] <= 1.0 for item in fused)
+
+
+def test_keeps_content_from_first_ranking():
+    fused = reciprocal_rank_fusion(
+        [_ranking("a", source="vector:"), _ranking("a", source="lexical:")])
+
+    assert fused[0]["content"] == "vector:a"
+
+
+def test_does_not_mutate_inputs():
+    vector = _ranking("a")
+
+    reciprocal_rank_fusion([vector])
+
+    assert "score" not in vector[0]
+
+
+def test_empty_rankings():
+    assert reciprocal_rank_fusion([]) == []
+    assert reciprocal_rank_fusion([[], []]) == []